@@ -1,8 +1,41 @@
 import os
+import time
+import argparse
+import traceback
 import pandas as pd
 import json
+import re
+import bisect
+import hashlib
+import shutil
+import tempfile
+import mmap
+import zipfile
+import tarfile
+import itertools
+import sqlite3
 import numpy as np 
-from datetime import datetime, timedelta
+import sys
+import cProfile
+import socket
+import threading
+import collections
+from contextlib import contextmanager, closing, ExitStack
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+try:
+    #Only used for the peak memory in profile reports, doesn't exist on Windows
+    import resource
+except ImportError:
+    resource = None
+try:
+    #Only needed for engine='arrow' (see read_game_arrow)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.json as pj
+except ImportError:
+    pa = None
 
 '''
 This code is meant to convert 1 folder of 1 game data (usually around +7000 individual JSON files) 
@@ -11,375 +44,1562 @@ It's really scrappy code since something was always different with the game data
 For any questions & concerns, feel free to hit me up on Discord xirimpi#3959.
 '''
 
-def json_to_df(json_dir):
+#Packed games (see pack_game): every message of a game in one file, in seqIdx order, with an index next to it
+PACK_EXTENSION = '.ndjson'
+#Game exports that can be read without extracting them first (see read_game_files)
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', PACK_EXTENSION)
+
+def is_archive(path):
     '''
-    Input: 
-        json_dir: a folder of individual JSON files for one game
-    Output: 
-        rawdata: a flattened pandas dataframe
+    True if path is a zip/tar archive (or a packed game) instead of a game folder
+    '''
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+def is_packed(path):
+    '''
+    True if path is a game packed by pack_game
+    '''
+    return path.lower().endswith(PACK_EXTENSION) and os.path.isfile(path)
+
+def is_json_name(name):
+    '''
+    True if name is one message file of a game folder (a packed .ndjson game ends in .json too but is a game of its own)
+    '''
+    return name.endswith(".json") and not name.lower().endswith(PACK_EXTENSION)
+
+def game_name(json_dir):
     '''
-    #Empty list to store json file info
-    json_list = [] 
+    Name of a game: its folder name, or the archive name without the extension
+    '''
+    name = os.path.basename(os.path.abspath(json_dir))
+    for extension in ARCHIVE_EXTENSIONS:
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return name
 
+def list_json_files(json_dir):
+    '''
+    Returns the path of every JSON file in a game folder (in no particular order)
+    '''
+    json_paths = []
     for root, dirs, files in os.walk(json_dir):
         for name in files:
-            if name.endswith((".json")):
-                json_path = os.path.join(root, name)
-                #Read json file info
-                json_data = pd.read_json(json_path, lines=True)  
-                #Append json file info to list
-                json_list.append(json_data) 
+            if is_json_name(name):
+                json_paths.append(os.path.join(root, name))
+    return json_paths
+
+#Stands in for a field that isn't in a payload (see project_payload)
+MISSING = object()
+
+def get_path(source, keys):
+    '''
+    Follows keys down nested dicts, MISSING if one of them isn't there
+    '''
+    for key in keys:
+        if not isinstance(source, dict) or key not in source:
+            return MISSING
+        source = source[key]
+    return source
+
+def project_payload(payload, paths):
+    '''
+    Picks only some fields out of one message payload instead of flattening all of it
+    Every field is looked up in the payload first and then in the payload inside it, the same places
+    json_normalize + the 'payload.' rename in json_to_df would find it
+    Input:
+        payload: 'payload' of one message
+        paths: list of fields split on '.' (like ['teamOne', 'players'])
+    Output:
+        row: list with one value per field (NaN where it's missing, like json_normalize)
+    '''
+    inner = payload.get('payload') if isinstance(payload, dict) else None
+    row = []
+    for keys in paths:
+        value = get_path(payload, keys)
+        if value is MISSING:
+            value = get_path(inner, keys)
+        row.append(np.nan if value is MISSING else value)
+    return row
+
+#Bytes of out of order tar members kept in memory before the rest go to a temporary file (see read_game_files)
+TAR_SPILL_BYTES = 2**20
+
+def tar_members(archive):
+    '''
+    Members of a tar archive opened in stream mode ('r|*'), one at a time
+    TarFile keeps every member it went past so it can go back, which stream mode can't do anyway, so that list is
+    emptied as it goes instead of growing with the number of files in the game
+    '''
+    while True:
+        member = archive.next()
+        if member is None:
+            return
+        archive.members = []
+        yield member
+
+def read_game_files(json_dir, names=None):
+    '''
+    Yields (name, lines) for the JSON files of a game, from a folder or straight out of a zip/tar archive
+    Each file is read in one go, and a tar archive (.tar.gz too) is read front to back in one pass without seeking
+    A packed game (see pack_game) gives one message at a time, named by its line number
+    Input:
+        json_dir: game folder, archive or packed game
+        names: only these files (paths in a folder, member names in an archive) in this order. Default: every file,
+               in the order they are stored in an archive
+    '''
+    if not is_archive(json_dir):
+        for json_path in names if names is not None else list_json_files(json_dir):
+            with open(json_path, 'rb') as f:
+                content = f.read()
+            count_read(len(content))
+            yield json_path, content.splitlines()
+    elif is_packed(json_dir):
+        #Each message is its own 'file', named by its line number
+        yield from read_packed_lines(json_dir, names)
+    elif zipfile.is_zipfile(json_dir):
+        with zipfile.ZipFile(json_dir) as archive:
+            if names is None:
+                names = [info.filename for info in archive.infolist() if not info.is_dir() and info.filename.endswith('.json')]
+            for name in names:
+                content = archive.read(name)
+                count_read(len(content))
+                yield name, content.splitlines()
+    elif names is None:
+        #Stream mode ('r|*'): members come in the order they were stored and nothing is ever seeked back to
+        with tarfile.open(json_dir, 'r|*') as archive:
+            for member in tar_members(archive):
+                if member.isfile() and member.name.endswith('.json'):
+                    content = archive.extractfile(member).read()
+                    count_read(len(content))
+                    yield member.name, content.splitlines()
+    elif json_dir.lower().endswith('.tar'):
+        #Jumping around an uncompressed tar is cheap
+        with tarfile.open(json_dir, 'r:') as archive:
+            members = {member.name: member for member in archive.getmembers()}
+            for name in names:
+                content = archive.extractfile(members[name]).read()
+                count_read(len(content))
+                yield name, content.splitlines()
+    else:
+        #Going back in a compressed tar means decompressing it again from the start, so it's still read front to back
+        #once and members that come before their turn wait until it comes. They wait in a temporary file that moves
+        #to disk past TAR_SPILL_BYTES, so memory doesn't grow with the size of the archive (--stream)
+        wanted = set(names)
+        waiting = {}
+        with tarfile.open(json_dir, 'r|*') as archive, tempfile.SpooledTemporaryFile(max_size=TAR_SPILL_BYTES) as spill:
+            members = tar_members(archive)
+            for name in names:
+                content = None
+                if name in waiting:
+                    offset, size = waiting.pop(name)
+                    spill.seek(offset)
+                    content = spill.read(size)
+                while content is None:
+                    member = next(members)
+                    if not member.isfile() or member.name not in wanted:
+                        continue
+                    if member.name == name:
+                        content = archive.extractfile(member).read()
+                    else:
+                        spill.seek(0, os.SEEK_END)
+                        waiting[member.name] = (spill.tell(), member.size)
+                        shutil.copyfileobj(archive.extractfile(member), spill)
+                count_read(len(content))
+                yield name, content.splitlines()
+
+#One row per message of a packed game: where its line is in the .ndjson file and what the pipeline needs to know
+#about it without parsing it ('time' is sourceUpdatedAt in nanoseconds, the flags are only set on messages with player lists)
+PACK_INDEX = np.dtype([('seqIdx', np.int64), ('offset', np.int64), ('length', np.int64), ('time', np.int64),
+                       ('snapshot', bool), ('event', bool), ('dragon', bool), ('winner', bool)])
+
+def pack_index_path(path):
+    '''
+    Index file of a packed game
+    '''
+    return path + '.idx.npy'
+
+def index_message(message):
+    '''
+    The PACK_INDEX fields of one parsed message (besides where it is in the file)
+    '''
+    row = dict(zip(RAW_COLUMNS, project_payload(message.get('payload'), [field.split('.') for field in RAW_COLUMNS])))
+    if not isinstance(row['teamOne.players'], list):
+        return -1, False, False, False, False
+    winner = row['winningTeam']
+    #Same things partition_events, scan_objectives and find_winner look for
+    event = any(pd.notna(row[field]) for field in EVENT_COLUMNS if field != 'winningTeam') or (pd.notna(winner) and winner != 0)
+    dragon = row['teamOne.dragonKills'] == 1 or row['teamTwo.dragonKills'] == 1
+    time = pd.Timestamp(row['sourceUpdatedAt']).value if pd.notna(row['sourceUpdatedAt']) else -1
+    return time, True, bool(event), bool(dragon), bool(pd.notna(winner) and winner != 0)
+
+def pack_game(json_dir, output=None):
+    '''
+    Packs a game folder (or archive) into one .ndjson file with every message in seqIdx order plus an offset index
+    (see PACK_INDEX), so runs on it skip thousands of file opens and the sort, and read_early_game only has to parse
+    the lines it needs. Every original file gets checked on the way: each line has to be JSON with a seqIdx and no
+    seqIdx can show up twice. The packed file is then read back and compared against the originals
+    Input:
+        json_dir: a folder of individual JSON files for one game, or a zip/tar archive of one
+        output: .ndjson file to write (default: <game folder name>.ndjson next to the game folder)
+    Output:
+        summary: dict with 'path', 'files', 'messages', 'snapshots', 'events', 'bytes_in', 'bytes_out' and 'sha1'
+    '''
+    output = output or os.path.join(os.path.dirname(os.path.abspath(json_dir)), game_name(json_dir) + PACK_EXTENSION)
+    messages = []
+    files = bytes_in = 0
+    for name, lines in read_game_files(json_dir):
+        files += 1
+        for line in lines:
+            bytes_in += len(line) + 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+                seqIdx = int(message['seqIdx'])
+            except (ValueError, TypeError, KeyError):
+                raise ValueError('Not a message with a seqIdx in ' + str(name) + ': ' + line[:80].decode(errors='replace'))
+            messages.append((seqIdx, line, index_message(message)))
+    messages.sort(key=lambda message: message[0])
+    seqIdxs = np.array([seqIdx for seqIdx, line, flags in messages], dtype=np.int64)
+    repeated = seqIdxs[1:][seqIdxs[1:] == seqIdxs[:-1]]
+    if len(repeated):
+        raise ValueError('seqIdx ' + ', '.join(str(each) for each in repeated[:10]) + ' show up more than once in ' + json_dir)
+
+    index = np.zeros(len(messages), dtype=PACK_INDEX)
+    digest = hashlib.sha1()
+    offset = 0
+    #Written to temporary files first so a pack that gets interrupted never looks finished
+    with open(output + '.tmp', 'wb') as f:
+        for row, (seqIdx, line, flags) in enumerate(messages):
+            index[row] = (seqIdx, offset, len(line)) + flags
+            f.write(line + b'\n')
+            digest.update(line)
+            offset += len(line) + 1
+    with open(pack_index_path(output) + '.tmp', 'wb') as f:
+        np.save(f, index)
+
+    #Read it back once: every line has to be where the index says, with the same message
+    check = hashlib.sha1()
+    for row, (line,) in read_packed_lines(output + '.tmp', index=index):
+        if json.loads(line)['seqIdx'] != index[row]['seqIdx']:
+            raise ValueError('Packed file of ' + json_dir + ' does not match its index at seqIdx ' + str(index[row]['seqIdx']))
+        check.update(line)
+    if check.hexdigest() != digest.hexdigest():
+        raise ValueError('Packed file of ' + json_dir + ' does not match the original files')
+    os.replace(pack_index_path(output) + '.tmp', pack_index_path(output))
+    os.replace(output + '.tmp', output)
+    return {'path': output, 'files': files, 'messages': len(index), 'snapshots': int(index['snapshot'].sum()),
+            'events': int(index['event'].sum()), 'bytes_in': bytes_in, 'bytes_out': offset, 'sha1': digest.hexdigest()}
+
+def load_pack_index(path):
+    '''
+    Index of a packed game (see PACK_INDEX), memory-mapped
+    '''
+    return np.load(pack_index_path(path), mmap_mode='r')
+
+def read_packed_lines(path, rows=None, index=None):
+    '''
+    Yields (row, [line]) for some messages of a packed game, straight out of the memory-mapped file so only those
+    lines ever get copied
+    Input:
+        path: .ndjson file from pack_game
+        rows: line numbers to read, in this order (default: all of them, in seqIdx order)
+        index: the index of the file if it's already loaded (see load_pack_index)
+    '''
+    index = load_pack_index(path) if index is None else index
+    if not len(index):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as packed:
+        offsets, lengths = index['offset'], index['length']
+        for row in range(len(index)) if rows is None else rows:
+            count_read(int(lengths[row]) + 1)
+            yield row, [packed[offsets[row]:offsets[row] + lengths[row]]]
+
+def packed_early_rows(path, minutes, winner=True):
+    '''
+    Lines of a packed game read_early_game needs, picked from the index without parsing anything: every line up to
+    the first snapshot past the last checkpoint, every event line, the line of the first dragon and (with winner) the
+    line of the last winningTeam
+    '''
+    index = load_pack_index(path)
+    snapshots = np.flatnonzero(index['snapshot'])
+    if not len(snapshots):
+        return list(range(len(index)))
+    times = index['time'][snapshots]
+    last = (int(times[0]) + round(minutes * 60 * 10**9)) // 10**9
+    past = snapshots[1:][times[1:] // 10**9 > last]
+    head = past[0] + 1 if len(past) else len(index)
+    rows = set(range(head)) | set(np.flatnonzero(index['event']).tolist())
+    dragons = np.flatnonzero(index['dragon'])
+    rows.update(dragons[:1].tolist())
+    if winner:
+        rows.update(np.flatnonzero(index['winner'])[-1:].tolist())
+    return sorted(rows)
+
+def add_messages(records, lines, paths=None):
+    '''
+    Parses the lines of one JSON file (one message per line) into (seqIdx, payload) records (see read_json_batch)
+    '''
+    for line in lines:
+        if line.strip():
+            message = json.loads(line)
+            payload = message.get('payload')
+            records.append((message['seqIdx'], payload if paths is None else project_payload(payload, paths)))
+
+def read_json_batch(json_paths, fields=None):
+    '''
+    Reads a batch of JSON files (one message per line) and keeps only what json_to_df needs
+    This runs inside the worker processes of json_to_df so it has to stay a top-level function
+    Input:
+        json_paths: list of JSON file paths
+        fields: only keep these fields of each payload (see project_payload), None keeps the whole payload
+    Output:
+        records: list of (seqIdx, payload) tuples (or (seqIdx, row) with fields)
+    '''
+    paths = [field.split('.') for field in fields] if fields is not None else None
+    records = []
+    for json_path in json_paths:
+        with open(json_path, 'rb') as f:
+            content = f.read()
+        count_read(len(content))
+        add_messages(records, content.splitlines(), paths)
+    return records
+
+def read_archive(archive, fields=None):
+    '''
+    read_json_batch for a zip/tar archive of a game, reading every member in one sequential pass
+    '''
+    paths = [field.split('.') for field in fields] if fields is not None else None
+    records = []
+    files = 0
+    for name, lines in read_game_files(archive):
+        add_messages(records, lines, paths)
+        files += 1
+    return records, files
+
+def json_to_df(json_dir, workers=1, fields=None):
+    '''
+    Input: 
+        json_dir: a folder of individual JSON files for one game, or a zip/tar archive of one (see read_game_files)
+        workers: number of processes used to read the files (1 reads everything in this process, archives always are)
+        fields: list of the columns that are needed (like RAW_COLUMNS). Only those get pulled out of each payload,
+                which skips json_normalize and the big frame of every nested field. None flattens everything
+    Output: 
+        rawdata: a flattened pandas dataframe
+    '''
+    if is_archive(json_dir):
+        #One sequential pass through the archive, no files on disk and nothing to list first
+        with profile_stage('read archive') as stage:
+            records, stage['files'] = read_archive(json_dir, fields)
+            stage['rows_out'] = len(records)
+    else:
+        with profile_stage('list files') as stage:
+            json_paths = list_json_files(json_dir)
+            stage['files'] = len(json_paths)
 
-    rawdata = pd.concat(json_list, ignore_index=True)
+        #Read json file info, either here or spread across a pool of processes
+        with profile_stage('read files', files=len(json_paths)) as stage:
+            if workers is None or workers > 1:
+                workers = workers or os.cpu_count() or 1
+                #A few batches per worker so a slow disk read doesn't leave the other workers idle
+                batch_size = max(1, -(-len(json_paths) // (workers * 4)))
+                batches = [json_paths[i:i + batch_size] for i in range(0, len(json_paths), batch_size)]
+                records = []
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for batch in pool.map(read_json_batch, batches, [fields] * len(batches)):
+                        records.extend(batch)
+            else:
+                records = read_json_batch(json_paths, fields)
+            stage['rows_out'] = len(records)
 
-    # Reorder the data (even though the files in the folder were originally in order, they somehow became out of order)
-    rawdatasorted = rawdata.sort_values(by='seqIdx', ascending=True).reset_index()
+    with profile_stage('json_normalize' if fields is None else 'projected frame', rows_in=len(records)) as stage:
+        # Reorder the data (even though the files in the folder were originally in order, they somehow became out of order)
+        records.sort(key=lambda record: record[0])
 
-    #Flatten the 'payload' columns
-    rawdata = pd.json_normalize(rawdatasorted['payload']) 
-    rawdata = rawdata.rename(columns=lambda x: x.replace('payload.', '')).rename(columns=lambda x: x.replace('payload.payload.', ''))
+        if fields is None:
+            #Flatten the 'payload' columns
+            rawdata = pd.json_normalize([payload for seqIdx, payload in records]) 
+            rawdata = rawdata.rename(columns=lambda x: x.replace('payload.', '')).rename(columns=lambda x: x.replace('payload.payload.', ''))
+        else:
+            rawdata = pd.DataFrame([row for seqIdx, row in records], columns=list(fields))
+        stage['rows_out'] = len(rawdata)
     
     return rawdata
 
-def get_team_data(rawdata): 
+def chunk_firsts(records, fields):
     '''
-    Input: 
+    scan_objectives on a list of (seqIdx, row) records from add_messages (with fields), only the first objectives
+    '''
+    players = fields.index('teamOne.players')
+    rows = [row for seqIdx, row in sorted(records, key=lambda record: record[0]) if isinstance(row[players], list)]
+    return scan_objectives(pd.DataFrame(rows, columns=list(fields)))[0]
+
+def read_early_game(json_dir, minutes, winner=True, chunk_size=200):
+    '''
+    json_to_df for only the parts of a game the stat sheet looks at: the files are read in seqIdx order until the
+    snapshots are past the last checkpoint and every first objective is found, then (with winner) the files at the
+    end of the game are read backwards until the last 'winningTeam' shows up. Everything in between is never read
+    Input:
+        json_dir: a folder of individual JSON files for one game, a zip/tar archive of one or a packed game (then only
+                  the lines packed_early_rows picks get read)
+        minutes: last checkpoint (in minutes) any stat needs
+        winner: also read the end of the game for find_winner (final_output_academy has no Win column)
+        chunk_size: number of files read at a time once the checkpoint is passed, between first objective checks
+    Output:
+        rawdata: like json_to_df(json_dir, fields=RAW_COLUMNS) without the rows nothing needs
+    '''
+    fields = RAW_COLUMNS
+    paths = [field.split('.') for field in fields]
+    stamp, players, winning = fields.index('sourceUpdatedAt'), fields.index('teamOne.players'), fields.index('winningTeam')
+    if is_packed(json_dir):
+        #The index already says which lines are needed, only those get parsed
+        with profile_stage('read packed', files=0) as stage:
+            records = []
+            for row, lines in read_packed_lines(json_dir, packed_early_rows(json_dir, minutes, winner)):
+                add_messages(records, lines, paths)
+                stage['files'] += 1
+            stage['rows_out'] = len(records)
+        return pd.DataFrame([row for seqIdx, row in records], columns=list(fields))
+    with profile_stage('list files') as stage:
+        ordered, stored = message_order(json_dir)
+        stage['files'] = len(ordered)
+
+    with profile_stage('read head', files=0) as stage:
+        records = []
+        firsts = {}
+        last = None
+        past = False
+        files = read_game_files(json_dir, ordered)
+        while len(firsts) < len(FIRST_OBJECTIVES):
+            #One file at a time until the checkpoint is passed, then chunk_size at a time until the firsts are in
+            chunk = list(itertools.islice(files, chunk_size if past else 1))
+            if not chunk:
+                break
+            stage['files'] += len(chunk)
+            new = []
+            for name, lines in chunk:
+                add_messages(new, lines, paths)
+            records.extend(new)
+            if past:
+                for objective, side in chunk_firsts(new, fields).items():
+                    firsts.setdefault(objective, side)
+                continue
+            for seqIdx, row in new:
+                if isinstance(row[players], list):
+                    ns = pd.Timestamp(row[stamp]).value
+                    if last is None:
+                        #Second of the last checkpoint (see checkpoint_seconds), once a snapshot is past it every
+                        #snapshot check_time could pick for it has been read
+                        last = (ns + round(minutes * 60 * 10**9)) // 10**9
+                    elif ns // 10**9 > last:
+                        past = True
+            if past:
+                firsts = chunk_firsts(records, fields)
+        files.close()
+        stage['rows_out'] = len(records)
+        rest = ordered[stage['files']:]
+
+    #find_winner takes the last winningTeam of the game, so it's the first one found going backwards from the end
+    if winner and rest:
+        with profile_stage('read tail', files=0) as stage:
+            head = len(records)
+            for name, lines in read_game_files(json_dir, rest[::-1]):
+                stage['files'] += 1
+                new = []
+                add_messages(new, lines, paths)
+                records.extend(new)
+                if any(isinstance(row[players], list) and row[winning] != 0 and not pd.isna(row[winning]) for seqIdx, row in new):
+                    break
+            stage['rows_out'] = len(records) - head
+
+    with profile_stage('projected frame', rows_in=len(records)) as stage:
+        records.sort(key=lambda record: record[0])
+        rawdata = pd.DataFrame([row for seqIdx, row in records], columns=list(fields))
+        stage['rows_out'] = len(rawdata)
+
+    return rawdata
+
+#Player fields kept from each snapshot ('stats.' fields are nested, same names pd.json_normalize would give them)
+#'int' fields come out as integers unless a player is missing from a snapshot, then they stay float with NaN like pandas would do
+PLAYER_FIELDS = {
+    'teamID': 'int', 'summonerName': 'str', 'summonerID': 'str', 'accountID': 'str', 'championID': 'int',
+    'pickTurn': 'int', 'pickMode': 'str', 'level': 'int', 'experience': 'int', 'currentGold': 'int',
+    'totalGold': 'int', 'goldPerSecond': 'float', 'stats.minionsKilled': 'int', 'stats.championsKilled': 'int'
+}
+
+def build_player_frame(players_column):
+    '''
+    Flattens a column of player lists so each row is one player at one snapshot (5 rows per snapshot)
+    The arrays are sized once (snapshots x 5 players) and filled in one pass, so long games cost the same per snapshot as short ones
+    Input:
+        players_column: 'teamOne.players' or 'teamTwo.players' column from rawdata (a list of player dicts per snapshot)
+    Output:
+        players: pandas dataframe with the PLAYER_FIELDS columns
+    '''
+    n = len(players_column) * 5
+    columns = {field: np.full(n, None, dtype=object) if kind == 'str' else np.full(n, np.nan) for field, kind in PLAYER_FIELDS.items()}
+    paths = [(columns[field], field.split('.')) for field in PLAYER_FIELDS]
+
+    for i, players in enumerate(players_column):
+        #Snapshots without a player list keep their 5 rows empty so rows still line up with np.repeat(..., 5)
+        if not isinstance(players, list):
+            continue
+        for j, player in enumerate(players[:5]):
+            row = i * 5 + j
+            for column, path in paths:
+                value = player
+                for key in path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                if value is not None:
+                    column[row] = value
+
+    return player_frame(columns)
+
+def player_frame(columns):
+    '''
+    Makes the dataframe of build_player_frame (or arrow_player_frame) out of its filled in PLAYER_FIELDS arrays
+    '''
+    #Counts fit in int32 and take half the memory of int64
+    for field, kind in PLAYER_FIELDS.items():
+        column = columns[field]
+        if kind == 'int' and not np.isnan(column).any() and (column == np.round(column)).all():
+            columns[field] = column.astype(np.int32 if np.abs(column).max(initial=0) < 2**31 else np.int64)
+
+    return pd.DataFrame(columns)
+
+#NA Global Contract Database, used to get the lane position of each player
+CONTRACT_DB_URL = 'https://lol.fandom.com/wiki/Archive:Global_Contract_Database/NA/Current'
+#Folder for anything saved between runs
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.lolscrimautomater')
+#Saved copy of the contract database so it doesn't get downloaded for every game
+CONTRACT_DB_PATH = os.path.join(CACHE_DIR, 'nagcd.csv')
+#How long the saved copy is used before it gets downloaded again
+CONTRACT_DB_TTL = timedelta(days=1)
+#Summoner names were slightly different in game than in the contract database and had to be fixed
+NAME_FIXES = {
+    'Wildturtle': 'WildTurtle',
+    'Faisal': 'Faisall',
+    'Jojopyun': 'jojopyun',
+    #'Fizzi': 'Zyko',
+}
+
+#A player that's only on our team, used to tell which team is CLG when both teams are CLG (like CLG Academy vs CLG)
+#Finn/Thien were our Top laners at the time, please change these to players on the current rosters
+CLG_PLAYER = 'Finn'
+CLG_ACADEMY_PLAYER = 'Thien'
+#If an amateur team was not in the global database, I had to manually code them in (team tag -> summoner name -> position)
+ROSTER_OVERRIDES = {
+    'AOER': {'Chim': 'Top', 'Jozy': 'Jungle', 'LEO99': 'Mid', 'Shorthop': 'Bot', 'Fizzi': 'Support'},
+}
+
+#Contract database already loaded by this process, so every game in a batch shares one copy
+_contract_db = {}
+#Where each of those copies came from (see contract_db_source)
+_contract_db_source = {}
+
+def download_contract_db(path=None):
+    '''
+    Downloads the contract database, fixes the summoner names and saves it to path (default: CONTRACT_DB_PATH)
+    '''
+    path = path or CONTRACT_DB_PATH
+    nagcd = pd.read_html(CONTRACT_DB_URL)[2].rename(columns={"Official Summoner Name": 'summonerName'})
+    nagcd['summonerName'] = nagcd['summonerName'].replace(NAME_FIXES)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    #Write to a temporary file first so a half written file never gets read by another game
+    nagcd.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    return nagcd
+
+def get_contract_db(refresh=False, offline=False, path=None, ttl=CONTRACT_DB_TTL):
+    '''
+    Gets the contract database from (in order) this process, the saved copy if it's newer than ttl, or the website
+    Input:
+        refresh: download it again even if the saved copy is still fresh
+        offline: never download, use the saved copy however old it is
+        path: where the saved copy lives (default: CONTRACT_DB_PATH, looked up when called so it can be pointed somewhere else)
+        ttl: timedelta after which the saved copy is downloaded again
+    Output:
+        nagcd: contract database dataframe with a 'summonerName' column
+    '''
+    path = path or CONTRACT_DB_PATH
+    if not refresh and path in _contract_db:
+        return _contract_db[path].copy()
+
+    saved = os.path.exists(path)
+    fresh = saved and datetime.now() - datetime.fromtimestamp(os.path.getmtime(path)) < ttl
+    if offline and not saved:
+        raise FileNotFoundError('No saved contract database at ' + path + ', run refresh-roster while online first')
+
+    if (refresh or not fresh) and not offline:
+        try:
+            nagcd = download_contract_db(path)
+            source = 'download'
+        except Exception as error:
+            #Keep going with the old copy when the website can't be reached
+            if not saved:
+                raise
+            print('Could not download the contract database (' + str(error) + '), using the saved copy')
+            nagcd = pd.read_csv(path)
+            source = 'fallback'
+    else:
+        nagcd = pd.read_csv(path)
+        source = 'saved'
+
+    _contract_db[path] = nagcd
+    _contract_db_source[path] = source
+    return nagcd.copy()
+
+def contract_db_source(path=None):
+    '''
+    Where the contract database get_contract_db gives in this process came from: 'saved' (the saved copy, it was still
+    fresh or offline was set), 'download' or 'fallback' (the saved copy because the download failed). None if it
+    isn't loaded. A batch loads it once before its workers start, so every game reports how that went
+    '''
+    return _contract_db_source.get(path or CONTRACT_DB_PATH)
+
+def refresh_contract_db(path=None):
+    '''
+    Downloads the contract database again and replaces the saved copy
+    '''
+    return get_contract_db(refresh=True, path=path)
+
+#Columns of rawdata that get used after json_to_df
+RAW_COLUMNS = ['type', 'subject', 'action', 'sourceUpdatedAt', 'gameTime', 'teamOne.players',
+               'teamTwo.players', 'winningTeam', 'victimTeamUrn', 'teamOne.dragonKills', 
+               'teamTwo.dragonKills', 'monsterType', 'killerTeamUrn',
+               'buildingType', 'buildingTeamUrn', 'lane', 'turretTier']
+
+#Fields of RAW_COLUMNS that only some messages have (kills, monsters, buildings, the end of the game), parse_game
+#moves them out of 'data' into one table per kind of message (see partition_events)
+EVENT_COLUMNS = ['victimTeamUrn', 'monsterType', 'killerTeamUrn', 'buildingType', 'buildingTeamUrn', 'lane', 'turretTier', 'winningTeam']
+
+def partition_events(data):
+    '''
+    Splits the event fields off the snapshot rows into a dense table for each kind of message ('type'/'subject'/'action')
+    Each table only has the rows of that kind with an event field set (a winningTeam of 0 doesn't count) and only
+    the EVENT_COLUMNS that kind ever sets, plus 'row': the row of 'data' it came from, which keeps seqIdx order
+    Input:
+        data: rows of rawdata that have player lists (see parse_game)
+    Output:
+        events: dict of 'events.<type>.<subject>.<action>' -> table, in the order each kind first shows up
+    '''
+    relevant = data[EVENT_COLUMNS].notna()
+    relevant['winningTeam'] &= data['winningTeam'] != 0
+    rows = np.flatnonzero(relevant.any(axis=1).to_numpy())
+    kinds = data[['type', 'subject', 'action']].iloc[rows].fillna('').astype(str)
+    events = {}
+    for kind, group in kinds.groupby(list(kinds.columns), sort=False):
+        columns = [name for name in EVENT_COLUMNS if relevant.loc[group.index, name].any()]
+        table = data.loc[group.index, columns]
+        table.insert(0, 'row', group.index.to_numpy(dtype=np.int64))
+        events['events.' + '.'.join(kind)] = table.reset_index(drop=True)
+    return events
+
+def event_tables(game, columns):
+    '''
+    Every event table of a parsed game that has the first of columns, put together in seqIdx order
+    Output:
+        events: dict of 'row' (of game['data']) and each of columns -> numpy array (NaN where a table doesn't have one)
+    '''
+    tables = [table for part, table in game.items() if part.startswith('events.') and columns[0] in table]
+    rows = np.concatenate([table['row'].to_numpy() for table in tables] + [np.zeros(0, dtype=np.int64)])
+    order = np.argsort(rows, kind='stable')
+    events = {'row': rows[order]}
+    for name in columns:
+        #object arrays, so categoricals from the game cache and missing columns all come out the same
+        values = [table[name].to_numpy(dtype=object) if name in table else np.full(len(table), np.nan, dtype=object) for table in tables]
+        events[name] = np.concatenate(values + [np.zeros(0, dtype=object)])[order]
+    return events
+
+def parse_game(rawdata):
+    '''
+    Splits rawdata into the snapshot rows, the events and the flattened player lists of each team
+    Input:
         rawdata: flattened pandas dataframe from 'json_to_df' function
+    Output:
+        game: dict with
+            'data': 'sourceUpdatedAt', 'gameTime', dragon kills and 'date' of the rows of rawdata that have player lists
+            'teamOne'/'teamTwo': build_player_frame of each team's player lists (5 rows for each row of 'data')
+            'events.<type>.<subject>.<action>': the event fields of those rows, one table per kind (see partition_events)
+    '''
+    #Selects certain columns from rawdata (already the only ones when json_to_df was given fields=RAW_COLUMNS)
+    rawdata = rawdata.reindex(columns=RAW_COLUMNS)
+
+    #intermediate dataframe
+    data = rawdata[rawdata['teamOne.players'].notnull()].reset_index(drop=True)
+
+    return assemble_game(data.drop(columns=['teamOne.players', 'teamTwo.players']),
+                         build_player_frame(data['teamOne.players']), build_player_frame(data['teamTwo.players']))
+
+def assemble_game(data, teamOne, teamTwo):
+    '''
+    Last step of parse_game (and read_game_arrow), once the snapshot rows and the players of each team are split out
+    Input:
+        data: the RAW_COLUMNS (besides the player lists) of the rows that have player lists, in seqIdx order
+        teamOne/teamTwo: each team's players (see build_player_frame)
+    Output:
+        game: see parse_game
+    '''
+    data['sourceUpdatedAt'] = pd.to_datetime(data['sourceUpdatedAt'])
+    #Day of each snapshot as a categorical, so .date() runs once per day instead of once per row
+    days, firsts = pd.factorize(data['sourceUpdatedAt'].dt.normalize())
+    data['date'] = pd.Categorical.from_codes(days, [each.date() for each in firsts])
+
+    game = {
+        'data': data.drop(columns=['type', 'subject', 'action'] + EVENT_COLUMNS),
+        'teamOne': teamOne,
+        'teamTwo': teamTwo,
+    }
+    game.update(partition_events(data))
+    return game
+
+def arrow_field(column, keys):
+    '''
+    A nested field (like ['stats', 'minionsKilled']) of an Arrow struct column, None if the structs don't have it
+    '''
+    for key in keys:
+        if not pa.types.is_struct(column.type) or column.type.get_field_index(key) < 0:
+            return None
+        column = pc.struct_field(column, key)
+    return column
+
+def arrow_player_frame(players):
+    '''
+    build_player_frame for an Arrow column of player lists: the players get flattened and dropped into their
+    (snapshot x 5) row by Arrow and numpy instead of a loop over every snapshot
+    '''
+    n = len(players) * 5
+    players = players.combine_chunks() if isinstance(players, pa.ChunkedArray) else players
+    lengths = pc.fill_null(pc.list_value_length(players), 0).to_numpy()
+    flat = pc.list_flatten(players)
+    snapshots = pc.list_parent_indices(players).to_numpy()
+    #Place of each player in its list, only the first 5 are kept like players[:5]
+    places = np.arange(len(snapshots)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keep = places < 5
+    rows = snapshots[keep] * 5 + places[keep]
+
+    columns = {}
+    for field, kind in PLAYER_FIELDS.items():
+        column = np.full(n, None, dtype=object) if kind == 'str' else np.full(n, np.nan)
+        values = arrow_field(flat, field.split('.'))
+        if values is not None:
+            if kind != 'str':
+                values = pc.cast(values, pa.float64())
+            values = values.to_numpy(zero_copy_only=False)[keep]
+            present = pd.notna(values)
+            column[rows[present]] = values[present]
+        columns[field] = column
+    return player_frame(columns)
+
+def read_game_arrow(json_dir, workers=1):
+    '''
+    Arrow engine of load_game: gives the same game as parse_game(json_to_df(json_dir, fields=RAW_COLUMNS)), but the
+    messages are parsed, sorted, filtered and flattened by Arrow's JSON reader and compute kernels instead of one
+    message at a time in Python. Needs pyarrow (pip install pyarrow)
+    Input:
+        json_dir: a folder of individual JSON files for one game, or a zip/tar archive of one
+        workers: 1 parses on one thread, anything else lets Arrow use every core
+    Output:
+        game: see parse_game
+    '''
+    if pa is None:
+        raise ImportError("engine='arrow' needs pyarrow (pip install pyarrow)")
+    with profile_stage('read files', files=0) as stage:
+        if is_packed(json_dir):
+            #Already one newline-delimited file, Arrow reads it straight from the memory map
+            buffer = pa.memory_map(json_dir)
+            count_read(buffer.size())
+            stage['files'] = 1
+        else:
+            lines = []
+            for name, file_lines in read_game_files(json_dir):
+                lines.append(file_lines)
+                stage['files'] += 1
+            #Every message of the game in one newline-delimited buffer, blank lines are fine for the JSON reader
+            buffer = pa.py_buffer(b'\n'.join(itertools.chain.from_iterable(lines)))
+
+    with profile_stage('arrow parse') as stage:
+        table = pj.read_json(buffer, read_options=pj.ReadOptions(use_threads=workers != 1))
+        table = table.take(pc.sort_indices(table, sort_keys=[('seqIdx', 'ascending')]))
+        stage['rows_out'] = table.num_rows
+
+    with profile_stage('arrow columns', rows_in=table.num_rows) as stage:
+        #Same places project_payload looks: the payload first, then the payload inside it
+        payload = table['payload']
+        columns = {}
+        for field in RAW_COLUMNS:
+            keys = field.split('.')
+            outer, inner = arrow_field(payload, keys), arrow_field(payload, ['payload'] + keys)
+            if outer is None and inner is None:
+                columns[field] = pa.nulls(table.num_rows)
+            else:
+                columns[field] = inner if outer is None else outer if inner is None else pc.coalesce(outer, inner)
+        snapshots = pc.is_valid(columns['teamOne.players'])
+        columns = {field: column.filter(snapshots) for field, column in columns.items()}
+        if pa.types.is_string(columns['sourceUpdatedAt'].type):
+            columns['sourceUpdatedAt'] = pc.cast(columns['sourceUpdatedAt'], pa.timestamp('ns', tz='UTC'))
+        data = pd.DataFrame({field: column.to_pandas() for field, column in columns.items() if not field.endswith('.players')})
+        stage['rows_out'] = len(data)
+
+    with profile_stage('parse_game', rows_in=len(data)):
+        return assemble_game(data, arrow_player_frame(columns['teamOne.players']), arrow_player_frame(columns['teamTwo.players']))
+
+#Parsed games saved by load_game, one folder per game
+GAME_CACHE_DIR = os.path.join(CACHE_DIR, 'games')
+#Bump this when parse_game changes what it gives back, so old saved games get parsed again
+GAME_CACHE_VERSION = 3
+
+def game_cache_path(json_dir, cache_dir=GAME_CACHE_DIR):
+    '''
+    Folder a parsed game gets saved in (named after a hash of the game folder's full path)
+    '''
+    return os.path.join(cache_dir, hashlib.sha1(os.path.abspath(json_dir).encode()).hexdigest()[:16])
+
+def write_columns(frame, path):
+    '''
+    Saves a dataframe as one .npy file per column, so it can be memory-mapped back
+    Text columns are saved as int32 codes plus the list of values, dates as ISO strings, times as int64 nanoseconds
+    (read_columns gives the text and date columns back as categoricals)
+    Output:
+        columns: description of each column to keep in the cache's meta file
+    '''
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for number, name in enumerate(frame.columns):
+        column = frame[name]
+        meta = {'name': name, 'file': str(number) + '.npy'}
+        if pd.api.types.is_datetime64_any_dtype(column):
+            meta['kind'] = 'datetime'
+            meta['tz'] = str(column.dt.tz) if column.dt.tz is not None else None
+            values = to_epoch_ns(column)
+        elif column.dtype.kind in 'iufb':
+            meta['kind'] = 'number'
+            values = column.to_numpy()
+        else:
+            codes, uniques = pd.factorize(column)
+            uniques = uniques.tolist()
+            meta['kind'] = 'date' if uniques and all(isinstance(each, date) for each in uniques) else 'text'
+            meta['values'] = [each.isoformat() for each in uniques] if meta['kind'] == 'date' else uniques
+            values = codes.astype(np.int32)
+        np.save(os.path.join(path, meta['file']), values)
+        columns.append(meta)
+    return columns
+
+def read_columns(columns, path):
+    '''
+    Loads a dataframe saved by write_columns, memory-mapping the .npy files
+    '''
+    frame = {}
+    for meta in columns:
+        values = np.load(os.path.join(path, meta['file']), mmap_mode='r')
+        count_read(values.nbytes)
+        if meta['kind'] == 'datetime':
+            times = pd.to_datetime(np.asarray(values), utc=meta['tz'] is not None)
+            frame[meta['name']] = times.tz_convert(meta['tz']) if meta['tz'] else times
+        elif meta['kind'] == 'number':
+            frame[meta['name']] = values
+        else:
+            uniques = [date.fromisoformat(each) for each in meta['values']] if meta['kind'] == 'date' else meta['values']
+            #-1 is a missing value, same as in a categorical
+            frame[meta['name']] = pd.Categorical.from_codes(np.asarray(values), uniques)
+    return pd.DataFrame(frame)
+
+def read_game_cache(path, fingerprint):
+    '''
+    Loads a game saved by write_game_cache, None if there isn't one or the game folder changed since it was saved
+    '''
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != GAME_CACHE_VERSION or meta.get('fingerprint') != fingerprint:
+        return None
+    return {part: read_columns(meta['parts'][part], os.path.join(path, part)) for part in meta['parts']}
+
+def write_game_cache(game, path, fingerprint):
+    '''
+    Saves a game from parse_game (written to a temporary folder first, then swapped in)
+    '''
+    temp = path + '.tmp' + str(os.getpid())
+    shutil.rmtree(temp, ignore_errors=True)
+    parts = {part: write_columns(frame, os.path.join(temp, part)) for part, frame in game.items()}
+    with open(os.path.join(temp, 'meta.json'), 'w') as f:
+        json.dump({'version': GAME_CACHE_VERSION, 'fingerprint': fingerprint, 'parts': parts}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp, path)
+
+def clear_game_cache(cache_dir=GAME_CACHE_DIR, older_than=None):
+    '''
+    Deletes the games load_game saved in cache_dir (nothing else in it, in case it was pointed at a shared folder)
+    Input:
+        cache_dir: folder the games were saved in
+        older_than: timedelta, only delete the games saved longer ago than this (None deletes all of them)
+    Output:
+        games: number of saved games deleted
+        size: bytes freed
+    '''
+    games = size = 0
+    if not os.path.isdir(cache_dir):
+        return games, size
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        meta_path = os.path.join(path, 'meta.json')
+        #Temporary folders are left behind by a run that got killed while saving
+        if not os.path.isdir(path) or not (os.path.exists(meta_path) or '.tmp' in name):
+            continue
+        saved = datetime.fromtimestamp(os.path.getmtime(meta_path if os.path.exists(meta_path) else path))
+        if older_than is not None and datetime.now() - saved < older_than:
+            continue
+        size += sum(os.path.getsize(os.path.join(root, each)) for root, dirs, files in os.walk(path) for each in files)
+        shutil.rmtree(path, ignore_errors=True)
+        games += 1
+    return games, size
+
+def load_game(json_dir, workers=1, cache_dir=None, until=None, winner=True, engine='pandas'):
+    '''
+    Reads a game folder into the parts get_team_data needs (see parse_game)
+    With a cache_dir the parsed game is saved there, and later runs load it back in milliseconds instead of
+    parsing the JSON files again, until a file in the game folder is added or changed
+    Input:
+        json_dir: a folder of individual JSON files for one game (or a zip/tar archive of one)
+        workers: number of processes used to read the JSON files (see json_to_df)
+        cache_dir: folder for parsed games (None doesn't save anything)
+        until: only read the game up to this many minutes, plus the first objectives and the winner (see read_early_game).
+               A whole game that's already saved in cache_dir still gets used, but a partial one never gets saved
+        winner: with until, also read the end of the game for the winner
+        engine: what reads and parses the JSON files, one of ENGINES (until always reads with pandas)
+    '''
+    def read():
+        if until is None:
+            return ENGINES[engine](json_dir, workers)
+        return profiled_parse_game(read_early_game(json_dir, until, winner))
+    if cache_dir is None:
+        return read()
+    path = game_cache_path(json_dir, cache_dir)
+    with profile_stage('read game cache') as stage:
+        fingerprint = fingerprint_game(json_dir)
+        game = read_game_cache(path, fingerprint)
+        stage.update(files=fingerprint['files'], hit=game is not None)
+    if game is None:
+        game = read()
+        if until is None:
+            with profile_stage('write game cache', rows_in=len(game['data'])):
+                write_game_cache(game, path, fingerprint)
+    return game
+
+def read_game_pandas(json_dir, workers=1):
+    '''
+    pandas engine of load_game: json_to_df with only RAW_COLUMNS, then parse_game
+    '''
+    return profiled_parse_game(json_to_df(json_dir, workers, RAW_COLUMNS))
+
+#Engines load_game can read a game with, both give the same parsed game (read_game_arrow needs pyarrow)
+ENGINES = {'pandas': read_game_pandas, 'arrow': read_game_arrow}
+
+def profiled_parse_game(rawdata):
+    '''
+    parse_game with its own stage in profile reports (see profile_stage)
+    '''
+    with profile_stage('parse_game', rows_in=len(rawdata)) as stage:
+        game = parse_game(rawdata)
+        stage['rows_out'] = len(game['data'])
+    return game
+
+def resolve_participants(names, nagcd, academy=False):
+    '''
+    Works out the team tag, summoner name, contract database team and position of each player once, then hands them back
+    for every row by the player's number, so this costs the same for a 20 minute game as for a 50 minute one
+    Positions come from the contract database, then ROSTER_OVERRIDES for amateur teams that aren't in it
+    Input:
+        names: 'summonerName' column of a player frame (full names like 'CLG Finn', one row per player per snapshot)
+        nagcd: contract database (see get_contract_db)
+        academy: split names the academy way (amateur tags are sometimes missing) and only use the contract database
+                 if the first player is in it
+    Output:
+        players: dataframe with 'teamName', 'summonerName', 'Team' and 'Position', one row per row of names
+    '''
+    codes, uniques = pd.factorize(names)
+    unique = pd.DataFrame({'full': pd.Series(uniques, dtype=object)})
+    nagcd = nagcd.drop_duplicates(subset='summonerName')
+
+    if academy:
+        #Had a harder time selecting teamName and summonerName because one or the other would be missing
+        unique[['teamName', 'summonerName']] = pd.DataFrame(unique['full'].str.split(' ', n=1).to_list(), columns=['teamName', 'summonerName'])
+        #Every player without the first player's tag just has no tag, so the whole name is the summoner name
+        first = unique['teamName'].iloc[codes[0]] if len(codes) and codes[0] >= 0 else np.nan
+        mask = unique['teamName'] != first
+        unique.loc[mask, 'summonerName'] = unique['teamName']
+        unique.loc[mask, 'teamName'] = first
+        missing = {'teamName': first, 'summonerName': np.nan, 'Team': np.nan, 'Position': np.nan}
+        firstName = unique['summonerName'].iloc[codes[0]] if len(codes) and codes[0] >= 0 else np.nan
+        if firstName in set(nagcd['summonerName']):
+            unique = pd.merge(unique, nagcd[['summonerName', 'Team', 'Position']], on='summonerName', how='left')
+        elif first in ROSTER_OVERRIDES:
+            unique['Team'] = np.nan
+            unique['Position'] = [ROSTER_OVERRIDES[first].get(name) for name in unique['summonerName']]
+        else:
+            raise ValueError('No positions for ' + str(first) + ': add the team to ROSTER_OVERRIDES if it isn\'t in the contract database')
+    else:
+        unique[['teamName', 'summonerName']] = unique['full'].str.split(' ', expand=True)
+        missing = {'teamName': np.nan, 'summonerName': np.nan, 'Team': np.nan, 'Position': np.nan}
+        unique = pd.merge(unique, nagcd[['summonerName', 'Team', 'Position']], on='summonerName', how='left')
+        #Amateur players that aren't in the contract database
+        for row in np.flatnonzero(unique['Position'].isnull().to_numpy()):
+            position = ROSTER_OVERRIDES.get(unique.at[row, 'teamName'], {}).get(unique.at[row, 'summonerName'])
+            if position is not None:
+                unique.loc[row, ['Team', 'Position']] = [unique.at[row, 'teamName'], position]
+
+    #Rows without a player (snapshots that had no player list) get the last row
+    columns = ['teamName', 'summonerName', 'Team', 'Position']
+    table = pd.concat([unique[columns], pd.DataFrame([missing])], ignore_index=True)
+    return table.take(np.where(codes >= 0, codes, len(unique))).reset_index(drop=True).astype(object)
+
+#Team dataframe columns with only a few different values, kept as categoricals
+CATEGORY_COLUMNS = ['date', 'Team', 'teamName', 'Team_name', 'summonerName', 'Position']
+
+def compact_team(team):
+    '''
+    Shrinks a team dataframe from get_team_data: the CATEGORY_COLUMNS become categoricals (a small code per row instead
+    of a string) and gameTime whole milliseconds (int64) when no snapshot is missing it
+    '''
+    for column in CATEGORY_COLUMNS:
+        if column in team:
+            team[column] = team[column].astype('category')
+    gameTime = team['gameTime'].to_numpy()
+    if gameTime.dtype.kind == 'f' and not np.isnan(gameTime).any() and (gameTime == np.round(gameTime)).all():
+        team['gameTime'] = gameTime.astype(np.int64)
+    return team
+
+def get_team_data(rawdata, offline=False): 
+    '''
+    Input: 
+        rawdata: flattened pandas dataframe from 'json_to_df' function (or the parsed game from 'load_game')
+        offline: only use the saved contract database (see get_contract_db)
     Outputs: 
         CLG: a cleaned pandas dataframe for whichever team is CLG
         team2: a cleaned pandas dataframe for opponent team
 
     '''
-    #Selects certain columns from rawdata
-    rawdata = rawdata[['type', 'subject', 'action', 'sourceUpdatedAt', 'gameTime', 'teamOne.players',
-                    'teamTwo.players', 'winningTeam', 'victimTeamUrn', 'teamOne.dragonKills', 
-                    'teamTwo.dragonKills', 'monsterType', 'killerTeamUrn',
-                   'buildingType', 'buildingTeamUrn', 'lane', 'turretTier']]
-
-    #intermediate dataframe
-    data = rawdata.copy()
-    data = rawdata[rawdata['teamOne.players'].notnull()]
-    data['sourceUpdatedAt'] = pd.to_datetime(data['sourceUpdatedAt'])
-    data['date'] = [d.date() for d in data['sourceUpdatedAt']]
+    #Split rawdata into the snapshot rows and each team's players (already done if it came from load_game)
+    game = rawdata if isinstance(rawdata, dict) else parse_game(rawdata)
+    data = game['data']
 
     #Team 1 code starts here
-    teamOne = pd.DataFrame()
-    #Flatten nested JSON column for teamOne to expand each row to be a player 
-    for each in data[data["teamOne.players"].notnull()]['teamOne.players']:
-        teamOne = pd.concat([teamOne, pd.json_normalize(each)])
-
-    teamOne[['teamName', 'summonerName']] = teamOne["summonerName"].str.split(' ', expand=True)
-    #Get NA Global Contract Database from website
-    nagcd = pd.read_html('https://lol.fandom.com/wiki/Archive:Global_Contract_Database/NA/Current')[2].rename(columns={"Official Summoner Name": 'summonerName'})
-    #Summoner names were slightly different and had to be fixed
-    nagcd['summonerName'] = nagcd['summonerName'].replace('Wildturtle','WildTurtle')
-    #Merge nagcd & teamOne to get lane positions for each player
-    teamOne = pd.merge(teamOne, nagcd, on=['summonerName'], how='left')
+    #Players of teamOne, each row is a player at one snapshot (see build_player_frame)
+    teamOne = game['teamOne'].copy()
+
+    #Get NA Global Contract Database (saved copy, or from website if it's out of date)
+    with profile_stage('contract database') as stage:
+        nagcd = get_contract_db(offline=offline)
+        stage['source'] = contract_db_source()
+        stage['rows_out'] = len(nagcd)
+    #Team tag, name, contract database team and lane position of each player
+    with profile_stage('resolve players', rows_in=len(teamOne)):
+        teamOne[['teamName', 'summonerName', 'Team', 'Position']] = resolve_participants(teamOne['summonerName'], nagcd)
 
     #Flattening the column earlier made the dataframe 5x longer than before (since 5 players each team) and it created a new dataframe
-    # so repeat each row of 'sourceUpdatedAt', 'gameTime', and 'sourceUpdatedAtDT' 5 times as well
+    # so repeat each row of 'sourceUpdatedAt', 'gameTime' and 'date' 5 times as well
     teamOne['sourceUpdatedAt'] = np.repeat(data['sourceUpdatedAt'], 5).reset_index(drop=True)
     teamOne['gameTime'] = np.repeat(data['gameTime'], 5).reset_index(drop=True)
-    #'sourceUpdatedAtDT is 'sourcedUpdatedAt' but in datetime formate
-    teamOne['sourceUpdatedAtDT'] = [each.strftime('%H:%M:%S') for each in teamOne['sourceUpdatedAt']]
     teamOne['date'] = np.repeat(data['date'], 5).reset_index(drop=True)
 
     #Select relevant columns to output
-    teamOne = teamOne[['date', 'sourceUpdatedAt', 'sourceUpdatedAtDT', 'gameTime', 'teamID', 'Team', 'teamName', 'summonerName', 'summonerID', 'accountID', 'Position',
+    teamOne = teamOne[['date', 'sourceUpdatedAt', 'gameTime', 'teamID', 'Team', 'teamName', 'summonerName', 'summonerID', 'accountID', 'Position',
                             'championID', 'pickTurn', 'pickMode', 'level', 'experience', 'currentGold', 
                             'totalGold', 'goldPerSecond', 'stats.minionsKilled', 'stats.championsKilled']]
     teamOne = teamOne.rename(columns={"stats.minionsKilled": "minionsKilled", "stats.championsKilled": "champsKilled"})
-    teamOne = teamOne.dropna().sort_values('sourceUpdatedAt').reset_index()
+    teamOne = compact_team(teamOne.dropna().sort_values('sourceUpdatedAt').reset_index())
 
     #Team 2 code starts here
-    teamTwo = pd.DataFrame()
-    #Flatten nested JSON column for teamTwo
-    for each in data[data["teamTwo.players"].notnull()]['teamTwo.players']:
-        teamTwo = pd.concat([teamTwo, pd.json_normalize(each)])
+    #Players of teamTwo, each row is a player at one snapshot
+    teamTwo = game['teamTwo'].copy()
 
-    teamTwo[['teamName', 'summonerName']] = teamTwo["summonerName"].str.split(' ', expand=True)
-    #Merge nagcd & teamTwo to get lane positions for each player
-    teamTwo = pd.merge(teamTwo, nagcd, on=['summonerName'], how='left')
+    #Team tag, name, contract database team and lane position of each player
+    with profile_stage('resolve players', rows_in=len(teamTwo)):
+        teamTwo[['teamName', 'summonerName', 'Team', 'Position']] = resolve_participants(teamTwo['summonerName'], nagcd)
 
     #Flattening the column earlier made the dataframe 5x longer than before (since 5 players each team) and it created a new dataframe
-    # so repeat each row of 'sourceUpdatedAt', 'gameTime', and 'sourceUpdatedAtDT' 5 times as well
+    # so repeat each row of 'sourceUpdatedAt', 'gameTime' and 'date' 5 times as well
     teamTwo['sourceUpdatedAt'] = np.repeat(data['sourceUpdatedAt'], 5).reset_index(drop=True)
     teamTwo['gameTime'] = np.repeat(data['gameTime'], 5).reset_index(drop=True)
-    #'sourceUpdatedAtDT is 'sourcedUpdatedAt' but in datetime formate
-    teamTwo['sourceUpdatedAtDT'] = [each.strftime('%H:%M:%S') for each in teamTwo['sourceUpdatedAt']]
     teamTwo['date'] = np.repeat(data['date'], 5).reset_index(drop=True)
 
     #Select relevant columns to output
-    teamTwo = teamTwo[['date', 'sourceUpdatedAt', 'sourceUpdatedAtDT', 'gameTime', 'teamID', 'Team', 'teamName', 'summonerName', 'summonerID', 'accountID', 'Position',
+    teamTwo = teamTwo[['date', 'sourceUpdatedAt', 'gameTime', 'teamID', 'Team', 'teamName', 'summonerName', 'summonerID', 'accountID', 'Position',
                             'championID', 'pickTurn', 'pickMode', 'level', 'experience', 'currentGold', 
                             'totalGold', 'goldPerSecond', 'stats.minionsKilled', 'stats.championsKilled']]
     teamTwo = teamTwo.rename(columns={"stats.minionsKilled": "minionsKilled", "stats.championsKilled": "champsKilled"})
-    teamTwo = teamTwo.dropna().sort_values('sourceUpdatedAt').reset_index()
+    teamTwo = compact_team(teamTwo.dropna().sort_values('sourceUpdatedAt').reset_index())
     
     #get objectives for each team
-    CLG, team2 = objectives(data, teamOne, teamTwo)
+    with profile_stage('objectives', rows_in=len(data)):
+        CLG, team2 = objectives(game, teamOne, teamTwo)
     
     return CLG, team2
 
-def get_team_data_academy(rawdata):
+def get_team_data_academy(rawdata, offline=False):
     '''
     Had to create a different function for CLG Academy because the global database and roster was whack for Amateur teams
     Input: 
-        rawdata: flattened pandas dataframe from 'json_to_df' function
+        rawdata: flattened pandas dataframe from 'json_to_df' function (or the parsed game from 'load_game')
+        offline: only use the saved contract database (see get_contract_db)
     Outputs: 
         CLG: a cleaned pandas dataframe for whichever team is CLG Academy
         team2: a cleaned pandas dataframe for opponent team
 
     '''
-    #Selects certain columns from rawdata
-    rawdata = rawdata[['type', 'subject', 'action', 'sourceUpdatedAt', 'gameTime', 'teamOne.players',
-                    'teamTwo.players', 'winningTeam', 'victimTeamUrn', 'teamOne.dragonKills', 
-                    'teamTwo.dragonKills', 'monsterType', 'killerTeamUrn',
-                   'buildingType', 'buildingTeamUrn', 'lane', 'turretTier']]
-
-    #intermediate dataframe
-    data = rawdata.copy()
-    data = rawdata[rawdata['teamOne.players'].notnull()]
-    data['sourceUpdatedAt'] = pd.to_datetime(data['sourceUpdatedAt'])
-    data['date'] = [d.date() for d in data['sourceUpdatedAt']]
+    #Split rawdata into the snapshot rows and each team's players (already done if it came from load_game)
+    game = rawdata if isinstance(rawdata, dict) else parse_game(rawdata)
+    data = game['data']
 
     #Team 1 code starts here
-    teamOne = pd.DataFrame()
-    #Flatten nested JSON column for teamOne to expand each row to be a player 
-    for each in data[data["teamOne.players"].notnull()]['teamOne.players']:
-        teamOne = pd.concat([teamOne, pd.json_normalize(each)])
-
-    #Had a harder time selecting teamName and summonerName from dataframe because one or the other would be missing
-    team_summoner = pd.DataFrame(teamOne["summonerName"].str.split(' ', 1).to_list(), columns=['teamName', 'summonerName'])
-    mask = (team_summoner['teamName'] != team_summoner['teamName'].head(1).item())
-    team_summoner.loc[mask, 'summonerName'] = team_summoner['teamName']
-    team_summoner.loc[mask, 'teamName'] = team_summoner['teamName'].head(1).item()
-    teamOne[['teamName', 'summonerName']] = team_summoner
-
-    #Get NA Global Contract Database from website
-    nagcd = pd.read_html('https://lol.fandom.com/wiki/Archive:Global_Contract_Database/NA/Current')[2].rename(columns={"Official Summoner Name": 'summonerName'}).drop_duplicates(subset='summonerName')
-    #Summoner names were slightly different and had to be fixed
-    nagcd['summonerName'] = nagcd['summonerName'].replace('Faisal','Faisall')
-    #nagcd['summonerName'] = nagcd['summonerName'].replace('Fizzi','Zyko')
-    nagcd['summonerName'] = nagcd['summonerName'].replace('Jojopyun','jojopyun')
-    nagcd['summonerName'] = nagcd['summonerName'].replace('Wildturtle','WildTurtle')
-    #Merge nagcd & teamOne to get lane positions for each player
-    if teamOne['summonerName'].head(1).item() in nagcd['summonerName'].unique():
-        teamOne = pd.merge(teamOne, nagcd, on=['summonerName'], how='left')
-    #If an amateur team was not in the global database, I had to manually code them in
-    elif teamOne['teamName'].head(1).item() == 'AOER':
-        teamOne.loc[teamOne['summonerName']=='Chim', 'Position'] = 'Top'
-        teamOne.loc[teamOne['summonerName']=='Jozy', 'Position'] = 'Jungle'
-        teamOne.loc[teamOne['summonerName']=='LEO99', 'Position'] = 'Mid'
-        teamOne.loc[teamOne['summonerName']=='Shorthop', 'Position'] = 'Bot'
-        teamOne.loc[teamOne['summonerName']=='Fizzi', 'Position'] = 'Support'
+    #Players of teamOne, each row is a player at one snapshot (see build_player_frame)
+    teamOne = game['teamOne'].copy()
+
+    #Get NA Global Contract Database (saved copy, or from website if it's out of date)
+    with profile_stage('contract database') as stage:
+        nagcd = get_contract_db(offline=offline)
+        stage['source'] = contract_db_source()
+        stage['rows_out'] = len(nagcd)
+    #Team tag, name and lane position of each player, from the contract database or ROSTER_OVERRIDES for amateur teams
+    with profile_stage('resolve players', rows_in=len(teamOne)):
+        teamOne[['teamName', 'summonerName', 'Team', 'Position']] = resolve_participants(teamOne['summonerName'], nagcd, academy=True)
 
     #change column name to make less confusing later
     if 'teamName' in teamOne.columns:
         teamOne.rename(columns={"teamName": "Team_name"}, inplace=True)
 
     #Flattening the column earlier made the dataframe 5x longer than before (since 5 players each team) and it created a new dataframe
-    # so repeat each row of 'sourceUpdatedAt', 'gameTime', and 'sourceUpdatedAtDT' 5 times as well
+    # so repeat each row of 'sourceUpdatedAt', 'gameTime' and 'date' 5 times as well
     teamOne['sourceUpdatedAt'] = np.repeat(data['sourceUpdatedAt'], 5).reset_index(drop=True)
     teamOne['gameTime'] = np.repeat(data['gameTime'], 5).reset_index(drop=True)
-    #'sourceUpdatedAtDT is 'sourcedUpdatedAt' but in datetime formate
-    teamOne['sourceUpdatedAtDT'] = [each.strftime('%H:%M:%S') for each in teamOne['sourceUpdatedAt']]
     teamOne['date'] = np.repeat(data['date'], 5).reset_index(drop=True)
 
     #Select relevant columns to output
-    teamOne = teamOne[['date', 'sourceUpdatedAt', 'sourceUpdatedAtDT', 'gameTime', 'teamID', 'Team_name', 'summonerName', 'summonerID', 'accountID', 'Position',
+    teamOne = teamOne[['date', 'sourceUpdatedAt', 'gameTime', 'teamID', 'Team_name', 'summonerName', 'summonerID', 'accountID', 'Position',
                             'championID', 'pickTurn', 'pickMode', 'level', 'experience', 'currentGold', 
                             'totalGold', 'goldPerSecond', 'stats.minionsKilled', 'stats.championsKilled']]
     teamOne = teamOne.rename(columns={"stats.minionsKilled": "minionsKilled", "stats.championsKilled": "champsKilled"})
-    teamOne = teamOne.sort_values('sourceUpdatedAt').reset_index()
+    teamOne = compact_team(teamOne.sort_values('sourceUpdatedAt').reset_index())
 
     #Team 2 code starts here
-    teamTwo = pd.DataFrame()
-    #Flatten nested JSON column for teamTwo
-    for each in data[data["teamTwo.players"].notnull()]['teamTwo.players']:
-        teamTwo = pd.concat([teamTwo, pd.json_normalize(each)])
-
-    #Had a harder time selecting teamName and summonerName from dataframe because one or the other would be missing
-    team_summoner = pd.DataFrame(teamTwo["summonerName"].str.split(' ', 1).to_list(), columns=['teamName', 'summonerName'])
-    mask = (team_summoner['teamName'] != team_summoner['teamName'].head(1).item())
-    team_summoner.loc[mask, 'summonerName'] = team_summoner['teamName']
-    team_summoner.loc[mask, 'teamName'] = team_summoner['teamName'].head(1).item()
-    teamTwo[['teamName', 'summonerName']] = team_summoner
-    #Merge nagcd & teamTwo to get lane positions for each player
-    if teamTwo['summonerName'].head(1).item() in nagcd['summonerName'].unique():
-        teamTwo = pd.merge(teamTwo, nagcd, on=['summonerName'], how='left')
-    #If an amateur team was not in the global database, I had to manually code them in
-    elif teamTwo['teamName'].head(1).item() == 'AOER':
-        teamTwo.loc[teamOne['summonerName']=='Chim', 'Position'] = 'Top'
-        teamTwo.loc[teamOne['summonerName']=='Jozy', 'Position'] = 'Jungle'
-        teamTwo.loc[teamOne['summonerName']=='LEO99', 'Position'] = 'Mid'
-        teamTwo.loc[teamOne['summonerName']=='Shorthop', 'Position'] = 'Bot'
-        teamTwo.loc[teamOne['summonerName']=='Fizzi', 'Position'] = 'Support'
+    #Players of teamTwo, each row is a player at one snapshot
+    teamTwo = game['teamTwo'].copy()
+
+    #Team tag, name and lane position of each player, from the contract database or ROSTER_OVERRIDES for amateur teams
+    with profile_stage('resolve players', rows_in=len(teamTwo)):
+        teamTwo[['teamName', 'summonerName', 'Team', 'Position']] = resolve_participants(teamTwo['summonerName'], nagcd, academy=True)
     
     #change column name to make less confusing later
     if 'teamName' in teamTwo.columns:
         teamTwo.rename(columns={"teamName": "Team_name"}, inplace=True)
 
     #Flattening the column earlier made the dataframe 5x longer than before (since 5 players each team) and it created a new dataframe
-    # so repeat each row of 'sourceUpdatedAt', 'gameTime', and 'sourceUpdatedAtDT' 5 times as well
+    # so repeat each row of 'sourceUpdatedAt', 'gameTime' and 'date' 5 times as well
     teamTwo['sourceUpdatedAt'] = np.repeat(data['sourceUpdatedAt'], 5).reset_index(drop=True)
     teamTwo['gameTime'] = np.repeat(data['gameTime'], 5).reset_index(drop=True)
-    #'sourceUpdatedAtDT is 'sourcedUpdatedAt' but in datetime formate
-    teamTwo['sourceUpdatedAtDT'] = [each.strftime('%H:%M:%S') for each in teamTwo['sourceUpdatedAt']]
     teamTwo['date'] = np.repeat(data['date'], 5).reset_index(drop=True)
 
     #Select relevant columns to output
-    teamTwo = teamTwo[['date', 'sourceUpdatedAt', 'sourceUpdatedAtDT', 'gameTime', 'teamID', 'Team_name', 'summonerName', 'summonerID', 'accountID', 'Position',
+    teamTwo = teamTwo[['date', 'sourceUpdatedAt', 'gameTime', 'teamID', 'Team_name', 'summonerName', 'summonerID', 'accountID', 'Position',
                             'championID', 'pickTurn', 'pickMode', 'level', 'experience', 'currentGold', 
                             'totalGold', 'goldPerSecond', 'stats.minionsKilled', 'stats.championsKilled']]
     teamTwo = teamTwo.rename(columns={"stats.minionsKilled": "minionsKilled", "stats.championsKilled": "champsKilled"})
-    teamTwo = teamTwo.sort_values('sourceUpdatedAt').reset_index()
+    teamTwo = compact_team(teamTwo.sort_values('sourceUpdatedAt').reset_index())
     
     #get objectives for each team
-    CLG, team2 = objectives_academy(data, teamOne, teamTwo)
+    with profile_stage('objectives', rows_in=len(data)):
+        CLG, team2 = objectives_academy(game, teamOne, teamTwo)
     
     return CLG, team2
 
+#Lane positions, in the order they are stored in a snapshot index
+POSITIONS = ['Top', 'Jungle', 'Mid', 'Bot', 'Support']
+#Short lane names used in the output columns
+LANE_LABELS = {'Top': 'Top', 'Jungle': 'Jg', 'Mid': 'Mid', 'Bot': 'AD', 'Support': 'Sup'}
+#Stats that get_cs, get_g and get_xp look up
+INDEX_STATS = ['minionsKilled', 'totalGold', 'experience']
+#Name of the difference of each stat in the output columns
+DIFF_NAMES = {'minionsKilled': 'CSD', 'totalGold': 'GD', 'experience': 'XPD'}
+
+def to_epoch_ns(times):
+    '''
+    Converts a datetime column to int64 nanoseconds since 1970 (in UTC if the column has a timezone)
+    '''
+    if getattr(times.dt, 'tz', None) is not None:
+        times = times.dt.tz_convert('UTC').dt.tz_localize(None)
+    return times.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+def build_snapshot_index(team):
+    '''
+    Builds a lookup table for a team dataframe so each CS/gold/XP read doesn't have to scan the whole dataframe
+    Input:
+        team: teamOne/teamTwo/CLG/team2 dataframe from get_team_data or objectives
+    Output:
+        index: dict with
+            'start': first 'sourceUpdatedAt' of the team (what check_time counts minutes from)
+            'timestamps': every 'sourceUpdatedAt' sorted, as int64 nanoseconds (for the nearest time binary search)
+            'seconds': sorted unique snapshot times as int64 seconds
+            'day': the second that the day of 'start' begins on, to turn 'HH:MM:SS' strings back into seconds
+            'positions': dict of position -> row of the value matrices
+            'minionsKilled'/'totalGold'/'experience': position-major matrix (positions x seconds) holding the
+                first value of each position at each second, like .head(1) on the old dataframe filter
+            'present': boolean matrix of which (position, second) pairs actually have a snapshot
+    '''
+    stamps = to_epoch_ns(team['sourceUpdatedAt'])
+    row_seconds = stamps // 10**9
+    seconds = np.unique(row_seconds)
+
+    positions = [each for each in POSITIONS if each in set(team['Position'].dropna())]
+    positions += [each for each in team['Position'].dropna().unique() if each not in positions]
+    position_column = team['Position'].to_numpy()
+
+    index = {
+        'start': team['sourceUpdatedAt'].iloc[0],
+        'timestamps': np.sort(stamps),
+        'seconds': seconds,
+        'day': row_seconds[0] - row_seconds[0] % 86400,
+        'positions': {position: row for row, position in enumerate(positions)},
+        'present': np.zeros((len(positions), len(seconds)), dtype=bool),
+    }
+    stat_columns = {}
+    for stat in INDEX_STATS:
+        values = team[stat].to_numpy()
+        dtype = values.dtype if values.dtype.kind in 'iuf' else np.float64
+        index[stat] = np.zeros((len(positions), len(seconds)), dtype=dtype)
+        stat_columns[stat] = values
+
+    for row, position in enumerate(positions):
+        rows = np.flatnonzero(position_column == position)
+        #np.unique gives the first row of each second, which is the one the old .head(1) picked
+        times, first = np.unique(row_seconds[rows], return_index=True)
+        columns = np.searchsorted(seconds, times)
+        index['present'][row, columns] = True
+        for stat in INDEX_STATS:
+            index[stat][row, columns] = stat_columns[stat][rows[first]]
+
+    return index
+
+def as_snapshot_index(team):
+    '''
+    Lets the lookup functions take either a team dataframe or an index that was already built
+    '''
+    return team if isinstance(team, dict) else build_snapshot_index(team)
+
+def snapshot_column(index, time):
+    '''
+    Finds the column of a 'HH:MM:SS' time string in a snapshot index with a binary search, returns None if there isn't one
+    '''
+    hours, minutes, secs = (int(each) for each in time.split(':'))
+    second = index['day'] + hours * 3600 + minutes * 60 + secs
+    #Games that run past midnight
+    if second < index['seconds'][0]:
+        second += 86400
+    column = np.searchsorted(index['seconds'], second)
+    if column < len(index['seconds']) and index['seconds'][column] == second:
+        return column
+    return None
+
+def get_stat(team, time, position, stat):
+    '''
+    Gets a stat for a position from a team at a certain time, NaN if the team has no one at that position/time
+    '''
+    index = as_snapshot_index(team)
+    row = index['positions'].get(position)
+    if row is None:
+        return np.nan
+    column = snapshot_column(index, time)
+    if column is None or not index['present'][row, column]:
+        return np.nan
+    return index[stat][row, column].item()
+
 def get_cs(team, time, position):
     '''
     Gets creep score for a position from a team at a certain time
     '''
-    if position in team['Position'].unique():
-        return team.loc[(team['sourceUpdatedAtDT']==time) & (team['Position']==position)].head(1)['minionsKilled'].item()
-    else:
-        return np.nan
+    return get_stat(team, time, position, 'minionsKilled')
     
 def get_team_cs(team, time):
     '''
     Calculates creep score for all positions on a team at a certain time
     '''
+    team = as_snapshot_index(team)
     return get_cs(team, time, 'Top') + get_cs(team, time, 'Jungle') + get_cs(team, time, 'Mid') + get_cs(team, time, 'Bot') + get_cs(team, time, 'Support')
 
 def get_g(team, time, position):
     '''
     Gets gold for a position from a team at a certain time
     '''
-    if position in team['Position'].unique():
-        return team.loc[(team['sourceUpdatedAtDT']==time) & (team['Position']==position)].head(1)['totalGold'].item()
-    else:
-        return np.nan
+    return get_stat(team, time, position, 'totalGold')
 
 def get_team_g(team, time):
     '''
     Calculates gold for all positions on a team at a certain time
     '''
+    team = as_snapshot_index(team)
     return get_g(team, time, 'Top') + get_g(team, time, 'Jungle') + get_g(team, time, 'Mid') + get_g(team, time, 'Bot') + get_g(team, time, 'Support')
 
 def get_xp(team, time, position):
     '''
     Gets experience for a position from a team at a certain time
     '''
-    if position in team['Position'].unique():
-        return team.loc[(team['sourceUpdatedAtDT']==time) & (team['Position']==position)].head(1)['experience'].item()
-    else:
-        return np.nan
+    return get_stat(team, time, position, 'experience')
     
 def get_team_xp(team, time):
     '''
     Calculates experience for all positions on a team at a certain time
     '''
+    team = as_snapshot_index(team)
     return get_xp(team, time, 'Top') + get_xp(team, time, 'Jungle') + get_xp(team, time, 'Mid') + get_xp(team, time, 'Bot') + get_xp(team, time, 'Support')                       
 
 def check_time(team, time):
     '''
     Returns datetime format of specified time if it exists in team's time stamps, else returns next closest datetime format of time stamp
     '''
-    updatedTime = team.loc[0]['sourceUpdatedAt'] + pd.Timedelta(minutes = time)
+    index = as_snapshot_index(team)
+    updatedTime = index['start'] + pd.Timedelta(minutes = time)
     DT = updatedTime.strftime('%H:%M:%S')
-    if DT in team['sourceUpdatedAtDT'].unique():
+    if snapshot_column(index, DT) is not None:
         return DT
     else:
-        closest = min(team['sourceUpdatedAt'], key=lambda x: abs(x - updatedTime))
+        #Binary search for the closest time stamp (the earlier one wins a tie)
+        target = to_epoch_ns(pd.Series([updatedTime]))[0]
+        stamps = index['timestamps']
+        after = min(np.searchsorted(stamps, target), len(stamps) - 1)
+        before = max(after - 1, 0)
+        nearest = stamps[before] if abs(stamps[before] - target) <= abs(stamps[after] - target) else stamps[after]
+        closest = pd.Timestamp(nearest, tz='UTC')
+        closest = closest.tz_localize(None) if updatedTime.tzinfo is None else closest.tz_convert(updatedTime.tzinfo)
         return closest.strftime('%H:%M:%S')        
 
-def objectives(data, teamOne, teamTwo):
+def checkpoint_seconds(index, minutes):
     '''
-    Input:
-        data: rawdata dataframe from json_to_df function
-        teamOne: teamOne dataframe from get_team_data function
-        teamTwo: teamTwo dataframe from get_team_data function
-    Output: 
-        CLG: cleaned dataframe for whichever team is CLG
-        team2: cleaned dataframe for opponent team
+    check_time for a whole list of minutes at once
+    Output:
+        seconds: int64 array with the snapshot second used for each number of minutes (see build_snapshot_index)
+    '''
+    start = to_epoch_ns(pd.Series([index['start']]))[0]
+    targets = start + np.round(np.asarray(minutes, dtype=float) * 60 * 10**9).astype(np.int64)
+    seconds = targets // 10**9
+    #Same as check_time: the second of the target if there's a snapshot in it, else the closest time stamp (earlier one wins a tie)
+    stamps = index['timestamps']
+    after = np.minimum(np.searchsorted(stamps, targets), len(stamps) - 1)
+    before = np.maximum(after - 1, 0)
+    nearest = np.where(np.abs(stamps[before] - targets) <= np.abs(stamps[after] - targets), stamps[before], stamps[after])
+    return np.where(np.isin(seconds, index['seconds']), seconds, nearest // 10**9)
+
+def snapshot_values(index, seconds, stats=INDEX_STATS):
+    '''
+    Looks up every position's stats at a list of snapshot seconds in one go
+    Output:
+        values: float array (seconds x POSITIONS x stats), NaN where there's no snapshot for that position and second
+    '''
+    columns = np.minimum(np.searchsorted(index['seconds'], seconds), len(index['seconds']) - 1)
+    found = index['seconds'][columns] == seconds
+    values = np.full((len(seconds), len(POSITIONS), len(stats)), np.nan)
+    for p, position in enumerate(POSITIONS):
+        row = index['positions'].get(position)
+        if row is None:
+            continue
+        present = found & index['present'][row, columns]
+        for s, stat in enumerate(stats):
+            values[:, p, s] = np.where(present, index[stat][row, columns], np.nan)
+    return values
+
+def diff_curves(teamOne, teamTwo, minutes=None, stats=INDEX_STATS):
+    '''
+    CS/gold/XP differences for every lane and the whole team at a list of minutes, all worked out with array operations
+    so asking for 40 minutes costs about the same as asking for 3
+    Input:
+        teamOne: CLG dataframe (or its snapshot index) from objectives function
+        teamTwo: team2 dataframe (or its snapshot index) from objectives function
+        minutes: checkpoint minutes (default: every minute of the game)
+        stats: team columns to diff (see INDEX_STATS)
+    Output:
+        curves: dataframe with a row per minute and a (stat, lane) column for each stat ('CSD', 'GD', 'XPD') and
+                lane ('Top', 'Jg', 'Mid', 'AD', 'Sup' and 'Team' for the whole team)
+    '''
+    one, two = as_snapshot_index(teamOne), as_snapshot_index(teamTwo)
+    if minutes is None:
+        minutes = np.arange(1, (one['timestamps'][-1] - one['timestamps'][0]) // (60 * 10**9) + 1)
+    seconds = checkpoint_seconds(one, minutes)
+    #minutes x lanes x stats
+    diffs = snapshot_values(one, seconds, stats) - snapshot_values(two, seconds, stats)
+    #A missing lane makes the team diff NaN, same as adding up get_g for each position
+    diffs = np.concatenate([diffs, diffs.sum(axis=1, keepdims=True)], axis=1)
+
+    columns = pd.MultiIndex.from_product([[DIFF_NAMES[stat] for stat in stats], list(LANE_LABELS.values()) + ['Team']])
+    return pd.DataFrame(diffs.transpose(0, 2, 1).reshape(len(seconds), -1), index=pd.Index(minutes, name='minute'), columns=columns)
+
+#Bayes urn of team one (100), anything else is team two (200)
+TEAM_ONE_URN = 'live:lol:riot:team:one'
+#First objectives flagged by objectives/objectives_academy
+FIRST_OBJECTIVES = ['firstBlood', 'firstDrag', 'firstHerald', 'firstTower', 'firstMid']
+
+def scan_objectives(data, timeline=False):
+    '''
+    Walks the events of a game once (in seqIdx order) to find which team got each first objective
+    Stops as soon as every first objective is found, unless timeline is set, then it keeps going to record every objective
+    Input:
+        data: snapshot rows of rawdata (rows in seqIdx order), or a game from parse_game/load_game, then only its
+              event tables get looked at (see scan_event_tables)
+        timeline: also record every monster (dragon, herald, baron...) and building (turret...) taken, with its game time
+    Output:
+        firsts: dict of FIRST_OBJECTIVES -> 'teamOne'/'teamTwo' that got it (left out if nobody did)
+        events: dataframe with 'gameTime', 'objective', 'team' (that took it), 'lane' and 'turretTier' (empty without timeline)
+    '''
+    if isinstance(data, dict):
+        return scan_event_tables(data, timeline)
+    def column(name):
+        return data[name].to_numpy() if name in data else np.full(len(data), np.nan, dtype=object)
+    gameTimes, victims, killers, monsters = column('gameTime'), column('victimTeamUrn'), column('killerTeamUrn'), column('monsterType')
+    dragonsOne, dragonsTwo = column('teamOne.dragonKills'), column('teamTwo.dragonKills')
+    buildings, buildingTeams, lanes, tiers = column('buildingType'), column('buildingTeamUrn'), column('lane'), column('turretTier')
+
+    firsts = {}
+    events = []
+    for row in range(len(data)):
+        #which team got first blood (the victim's team didn't)
+        if 'firstBlood' not in firsts and isinstance(victims[row], str):
+            firsts['firstBlood'] = 'teamTwo' if victims[row] == TEAM_ONE_URN else 'teamOne'
+
+        #which team got first dragon
+        if 'firstDrag' not in firsts and (dragonsOne[row] == 1 or dragonsTwo[row] == 1):
+            firsts['firstDrag'] = 'teamTwo' if dragonsOne[row] == 0 else 'teamOne'
+
+        #which team got first herald
+        if isinstance(monsters[row], str):
+            side = 'teamOne' if killers[row] == TEAM_ONE_URN else 'teamTwo'
+            if monsters[row] == 'riftHerald' and 'firstHerald' not in firsts:
+                firsts['firstHerald'] = side
+            if timeline:
+                events.append((gameTimes[row], monsters[row], side, np.nan, np.nan))
+
+        #which team got first tower and first mid tower (the building's team lost it)
+        if isinstance(buildings[row], str):
+            side = 'teamTwo' if buildingTeams[row] == TEAM_ONE_URN else 'teamOne'
+            if buildings[row] == 'turret':
+                if 'firstTower' not in firsts:
+                    firsts['firstTower'] = side
+                #doesn't matter if the actual first tower was the mid tower
+                if 'firstMid' not in firsts and lanes[row] == 'mid' and tiers[row] == 'outer':
+                    firsts['firstMid'] = side
+            if timeline:
+                events.append((gameTimes[row], buildings[row], side, lanes[row], tiers[row]))
+
+        if not timeline and len(firsts) == len(FIRST_OBJECTIVES):
+            break
+
+    return firsts, pd.DataFrame(events, columns=['gameTime', 'objective', 'team', 'lane', 'turretTier'])
+
+def scan_event_tables(game, timeline=False):
+    '''
+    scan_objectives for a parsed game: each objective only reads the event tables that have its fields, and first
+    dragon reads the dragon kills of 'data'. Without timeline each walk stops once its first objectives are found
+    '''
+    firsts = {}
+    kills = event_tables(game, ['victimTeamUrn'])
+    for victim in kills['victimTeamUrn']:
+        if isinstance(victim, str):
+            firsts['firstBlood'] = 'teamTwo' if victim == TEAM_ONE_URN else 'teamOne'
+            break
+
+    dragonsOne, dragonsTwo = game['data']['teamOne.dragonKills'].to_numpy(), game['data']['teamTwo.dragonKills'].to_numpy()
+    dragons = np.flatnonzero((dragonsOne == 1) | (dragonsTwo == 1))
+    if len(dragons):
+        firsts['firstDrag'] = 'teamTwo' if dragonsOne[dragons[0]] == 0 else 'teamOne'
+
+    events = []
+    monsters = event_tables(game, ['monsterType', 'killerTeamUrn'])
+    for row, monster, killer in zip(monsters['row'], monsters['monsterType'], monsters['killerTeamUrn']):
+        if isinstance(monster, str):
+            side = 'teamOne' if killer == TEAM_ONE_URN else 'teamTwo'
+            if monster == 'riftHerald' and 'firstHerald' not in firsts:
+                firsts['firstHerald'] = side
+            if timeline:
+                events.append((row, 0, monster, side, np.nan, np.nan))
+            elif 'firstHerald' in firsts:
+                break
+
+    buildings = event_tables(game, ['buildingType', 'buildingTeamUrn', 'lane', 'turretTier'])
+    for row, building, team, lane, tier in zip(*buildings.values()):
+        if isinstance(building, str):
+            side = 'teamTwo' if team == TEAM_ONE_URN else 'teamOne'
+            if building == 'turret':
+                if 'firstTower' not in firsts:
+                    firsts['firstTower'] = side
+                if 'firstMid' not in firsts and lane == 'mid' and tier == 'outer':
+                    firsts['firstMid'] = side
+            if timeline:
+                events.append((row, 1, building, side, lane, tier))
+            elif 'firstTower' in firsts and 'firstMid' in firsts:
+                break
+
+    #Monsters before buildings taken on the same row, same as scan_objectives
+    events.sort(key=lambda event: event[:2])
+    gameTimes = game['data']['gameTime'].to_numpy()
+    events = [(gameTimes[event[0]],) + event[2:] for event in events]
+    return firsts, pd.DataFrame(events, columns=['gameTime', 'objective', 'team', 'lane', 'turretTier'])
+
+def objective_timeline(data):
+    '''
+    Every monster and building taken in a game with its game time (see scan_objectives)
+    '''
+    return scan_objectives(data, timeline=True)[1]
+
+def find_winner(data):
+    '''
+    Looks for the 'winningTeam' (100 or 200) from the end of the game backwards, None if the game has no winner
+    data can be a parsed game too, then only its event tables with a 'winningTeam' get looked at
+    '''
+    if isinstance(data, dict):
+        winners = event_tables(data, ['winningTeam'])['winningTeam']
+    elif 'winningTeam' not in data:
+        return None
+    else:
+        winners = data['winningTeam'].to_numpy()
+    for row in range(len(winners) - 1, -1, -1):
+        if winners[row] != 0 and not pd.isna(winners[row]):
+            return winners[row]
+    return None
+
+def set_objectives(data, teamOne, teamTwo):
+    '''
+    Adds a column for each first objective to both teams (1 for the team that got it, 0 for the other, 0 for both if nobody did)
+    '''
+    firsts = scan_objectives(data)[0]
+    for objective in FIRST_OBJECTIVES:
+        teamOne[objective] = int(firsts.get(objective) == 'teamOne')
+        teamTwo[objective] = int(firsts.get(objective) == 'teamTwo')
+
+def objectives(data, teamOne, teamTwo):
+    '''
+    Input:
+        data: rawdata dataframe from json_to_df function, or the parsed game (see scan_objectives)
+        teamOne: teamOne dataframe from get_team_data function
+        teamTwo: teamTwo dataframe from get_team_data function
+    Output: 
+        CLG: cleaned dataframe for whichever team is CLG
+        team2: cleaned dataframe for opponent team
     '''
     #getting winning team ('100' is teamOne, '200' is teamTwo)
-    if data[data['winningTeam'] != 0]['winningTeam'].dropna().empty:
+    winningTeam = find_winner(data)
+    if winningTeam is None:
         teamOne['winningTeam'] = False
         teamTwo['winningTeam'] = False
     else:
-        winningTeam = data[data['winningTeam'] != 0]['winningTeam'].dropna().item()
         teamOne['winningTeam'] = (winningTeam == teamOne['teamID']).head(1).item()
         teamTwo['winningTeam'] = (winningTeam == teamTwo['teamID']).head(1).item()
     
-    #which team got first blood
-    firstblood= data['victimTeamUrn'].dropna()
-    if firstblood.empty:
-        teamOne['firstBlood'] = 0
-        teamTwo['firstBlood'] = 0
-    elif firstblood.head(1).item() == 'live:lol:riot:team:one':
-        teamOne['firstBlood'] = 0
-        teamTwo['firstBlood'] = 1
-    else:
-        teamOne['firstBlood'] = 1
-        teamTwo['firstBlood'] = 0
-
-    #which team got first dragon
-    firstdrag = data[(data['teamOne.dragonKills']==1) | (data['teamTwo.dragonKills']==1)]
-    if firstdrag.empty:
-        teamOne['firstDrag'] = 0
-        teamTwo['firstDrag'] = 0
-    elif firstdrag['teamOne.dragonKills'].head(1).item() == 0:
-        teamOne['firstDrag'] = 0
-        teamTwo['firstDrag'] = 1
-    else:
-        teamOne['firstDrag'] = 1
-        teamTwo['firstDrag'] = 0
-
-    #which team got first herald
-    firsther = data[data['monsterType']=='riftHerald']['killerTeamUrn']
-    if firsther.empty:
-        teamOne['firstHerald'] = 0
-        teamTwo['firstHerald'] = 0
-    elif firsther.head(1).item()  == 'live:lol:riot:team:one':
-        teamOne['firstHerald'] = 1
-        teamTwo['firstHerald'] = 0
-    else:
-        teamOne['firstHerald'] = 0
-        teamTwo['firstHerald'] = 1
-
-    #which team got first tower
-    firsttower = data[(data['buildingType']=='turret')]['buildingTeamUrn']
-    if firsttower.empty:
-        teamOne['firstTower'] = 0
-        teamTwo['firstTower'] = 0
-    elif firsttower.head(1).item() == 'live:lol:riot:team:one':
-        teamOne['firstTower'] = 0
-        teamTwo['firstTower'] = 1
-    else:
-        teamOne['firstTower'] = 1
-        teamTwo['firstTower'] = 0
-
-    #which team got first mid tower (doesn't matter if the actual first tower was the mid tower)
-    firstmid = data[(data['buildingType']=='turret') & (data['lane']=='mid') & (data['turretTier']=='outer')]['buildingTeamUrn']
-    if firstmid.empty:
-        teamOne['firstMid'] = 0
-        teamTwo['firstMid'] = 0
-    elif firstmid.head(1).item() == 'lie:lol:riot:team:one':
-        teamOne['firstMid'] = 0
-        teamTwo['firstMid'] = 1
-    else:
-        teamOne['firstMid'] = 1
-        teamTwo['firstMid'] = 0
+    #which team got first blood, first dragon, first herald, first tower and first mid tower
+    set_objectives(data, teamOne, teamTwo)
         
     #clarifying which team is CLG
     #I couldn't find another way to identity which team was which when both team name were 'CLG' (like CLG Academy vs CLG) so I checked the players in each team
-    #Finn was our Top laner in Academy at the time, please change this to another player
-    if any("Finn" in x for x in teamOne['summonerName'].head(5)):
+    #CLG_PLAYER was our Top laner in Academy at the time, please change this to another player
+    if any(CLG_PLAYER in x for x in teamOne['summonerName'].head(5)):
         CLG = teamOne.copy()
         team2 = teamTwo.copy()
     else:
@@ -392,77 +1612,20 @@ def objectives_academy(data, teamOne, teamTwo):
     '''
     Had to create a different function for CLG Academy because the global database and roster was whack for Amateur teams
     Input:
-        data: rawdata dataframe from json_to_df function
+        data: rawdata dataframe from json_to_df function, or the parsed game (see scan_objectives)
         teamOne: teamOne dataframe from get_team_data function
         teamTwo: teamTwo dataframe from get_team_data function
     Output: 
         CLG: cleaned dataframe for whichever team is CLG
         team2: cleaned dataframe for opponent team
     '''
-     #which team got first blood
-    firstblood= data['victimTeamUrn'].dropna()
-    if firstblood.empty:
-        teamOne['firstBlood'] = 0
-        teamTwo['firstBlood'] = 0
-    elif firstblood.head(1).item() == 'live:lol:riot:team:one':
-        teamOne['firstBlood'] = 0
-        teamTwo['firstBlood'] = 1
-    else:
-        teamOne['firstBlood'] = 1
-        teamTwo['firstBlood'] = 0
-
-    #which team got first dragon
-    firstdrag = data[(data['teamOne.dragonKills']==1) | (data['teamTwo.dragonKills']==1)]
-    if firstdrag.empty:
-        teamOne['firstDrag'] = 0
-        teamTwo['firstDrag'] = 0
-    elif firstdrag['teamOne.dragonKills'].head(1).item() == 0:
-        teamOne['firstDrag'] = 0
-        teamTwo['firstDrag'] = 1
-    else:
-        teamOne['firstDrag'] = 1
-        teamTwo['firstDrag'] = 0
-
-    #which team got first herald
-    firsther = data[data['monsterType']=='riftHerald']['killerTeamUrn']
-    if firsther.empty:
-        teamOne['firstHerald'] = 0
-        teamTwo['firstHerald'] = 0
-    elif firsther.head(1).item()  == 'live:lol:riot:team:one':
-        teamOne['firstHerald'] = 1
-        teamTwo['firstHerald'] = 0
-    else:
-        teamOne['firstHerald'] = 0
-        teamTwo['firstHerald'] = 1
-
-    #which team got first tower
-    firsttower = data[(data['buildingType']=='turret')]['buildingTeamUrn']
-    if firsttower.empty:
-        teamOne['firstTower'] = 0
-        teamTwo['firstTower'] = 0
-    elif firsttower.head(1).item() == 'live:lol:riot:team:one':
-        teamOne['firstTower'] = 0
-        teamTwo['firstTower'] = 1
-    else:
-        teamOne['firstTower'] = 1
-        teamTwo['firstTower'] = 0
-
-    #which team got first mid tower (doesn't matter if the actual first tower was the mid tower)
-    firstmid = data[(data['buildingType']=='turret') & (data['lane']=='mid') & (data['turretTier']=='outer')]['buildingTeamUrn']
-    if firstmid.empty:
-        teamOne['firstMid'] = 0
-        teamTwo['firstMid'] = 0
-    elif firstmid.head(1).item() == 'lie:lol:riot:team:one':
-        teamOne['firstMid'] = 0
-        teamTwo['firstMid'] = 1
-    else:
-        teamOne['firstMid'] = 1
-        teamTwo['firstMid'] = 0
+    #which team got first blood, first dragon, first herald, first tower and first mid tower
+    set_objectives(data, teamOne, teamTwo)
 
     #clarifying which team is CLG
     #I couldn't find another way to identity which team was which when both team name were 'CLG' (like CLG Academy vs CLG) so I checked the players in each team
-    #Thien was our Top laner in Academy at the time, please change this to another player
-    if any("Thien" in x for x in teamOne['summonerName'].head(5)):
+    #CLG_ACADEMY_PLAYER was our Top laner in Academy at the time, please change this to another player
+    if any(CLG_ACADEMY_PLAYER in x for x in teamOne['summonerName'].head(5)):
         CLG = teamOne.copy()
         team2 = teamTwo.copy()
     else:
@@ -471,59 +1634,81 @@ def objectives_academy(data, teamOne, teamTwo):
 
     return CLG, team2
 
-def final_output(teamOne, teamTwo):
+#Stat columns of final_output and final_output_academy, in order. Each spec is '<stats> per lane @<minutes>' (a column
+#for every lane) or 'team <stats> @<minutes>' (one column for the whole team), stats being CSD, GD and/or XPD
+STAT_SHEET = ['CSD, GD, XPD per lane @10', 'CSD, XPD per lane @15', 'team GD @15,20']
+STAT_SHEET_ACADEMY = ['CSD, GD, XPD per lane @10,15']
+
+def compile_stat_sheet(specs):
+    '''
+    Turns stat specs (see STAT_SHEET) into the list of stats they ask for
+    'CSD, GD per lane @10,15' gives CSD@10 and GD@10 for every lane, then CSD@15 and GD@15 for every lane
+    Output:
+        stats: list of (name, team column, minute, one per lane or whole team)
+    '''
+    columns = {name: stat for stat, name in DIFF_NAMES.items()}
+    stats = []
+    for spec in specs:
+        match = re.fullmatch(r'\s*(team\s+)?([A-Za-z,\s]+?)\s+(per lane\s*)?@\s*([\d.,\s]+)', spec)
+        if match is None or bool(match.group(1)) == bool(match.group(3)):
+            raise ValueError('Stat spec should look like "GD per lane @10,15" or "team GD @15,20", got ' + repr(spec))
+        names = [name.strip().upper() for name in match.group(2).split(',')]
+        unknown = [name for name in names if name not in columns]
+        if unknown:
+            raise ValueError('Unknown stat ' + ', '.join(unknown) + ' in ' + repr(spec) + ' (use ' + ', '.join(columns) + ')')
+        for minute in match.group(4).split(','):
+            minute = float(minute)
+            minute = int(minute) if minute.is_integer() else minute
+            for name in names:
+                stats.append((name, columns[name], minute, bool(match.group(3))))
+    return stats
+
+OUTPUT_STATS = compile_stat_sheet(STAT_SHEET)
+OUTPUT_STATS_ACADEMY = compile_stat_sheet(STAT_SHEET_ACADEMY)
+
+def evaluate_stats(teamOne, teamTwo, stats):
+    '''
+    Works out every stat of a compiled stat sheet with one lookup of all the minutes and team columns it needs
+    Input:
+        teamOne: CLG dataframe (or its snapshot index) from objectives function
+        teamTwo: team2 dataframe (or its snapshot index) from objectives function
+        stats: from compile_stat_sheet
+    Output:
+        values: dict of column name ('GD@10 Top', 'GD@15 Team', ...) to the difference (NaN if a lane is missing)
+    '''
+    one, two = as_snapshot_index(teamOne), as_snapshot_index(teamTwo)
+    minutes = sorted({minute for name, stat, minute, per_lane in stats})
+    columns = sorted({stat for name, stat, minute, per_lane in stats})
+    #Both teams are looked up at the snapshots picked for teamOne, like check_time was used for both
+    seconds = checkpoint_seconds(one, minutes)
+    #minutes x lanes x columns
+    diffs = snapshot_values(one, seconds, columns) - snapshot_values(two, seconds, columns)
+    #Counts stay whole numbers like get_stat gives them
+    whole = {stat: one[stat].dtype.kind in 'iu' and two[stat].dtype.kind in 'iu' for stat in columns}
+
+    values = {}
+    for name, stat, minute, per_lane in stats:
+        lanes = diffs[minutes.index(minute), :, columns.index(stat)]
+        cells = zip(LANE_LABELS.values(), lanes) if per_lane else [('Team', lanes.sum())]
+        for label, value in cells:
+            values[name + '@' + str(minute) + ' ' + label] = int(value) if whole[stat] and not np.isnan(value) else float(value)
+    return values
+
+def final_output(teamOne, teamTwo, stat_sheet=STAT_SHEET):
     '''
     Input: 
         teamOne: CLG dataframe from objectives function
         teamTwo: team2 dataframe from objectives function
+        stat_sheet: stat specs for the stat columns (see STAT_SHEET)
     Output:
         final_df: cleaned dataframe with all stats needed
     '''
-    #Get timestamp for 10 minutes
-    ten = check_time(teamOne, 10)
-    #Get CSD stats for each lane at 10 minutes
-    csd10top = get_cs(teamOne, ten, 'Top') - get_cs(teamTwo, ten, 'Top')
-    csd10jg =  get_cs(teamOne, ten, 'Jungle') - get_cs(teamTwo, ten, 'Jungle')
-    csd10mid = get_cs(teamOne, ten, 'Mid') - get_cs(teamTwo, ten, 'Mid')
-    csd10bot = get_cs(teamOne, ten, 'Bot') - get_cs(teamTwo, ten, 'Bot')
-    csd10sup = get_cs(teamOne, ten, 'Support') - get_cs(teamTwo, ten, 'Support')
-    #Get GD stats for each lane at 10 minutes
-    gd10top = get_g(teamOne, ten, 'Top') - get_g(teamTwo, ten, 'Top')
-    gd10jg =  get_g(teamOne, ten, 'Jungle') - get_g(teamTwo, ten, 'Jungle')
-    gd10mid = get_g(teamOne, ten, 'Mid') - get_g(teamTwo, ten, 'Mid')
-    gd10bot = get_g(teamOne, ten, 'Bot') - get_g(teamTwo, ten, 'Bot')
-    gd10sup = get_g(teamOne, ten, 'Support') - get_g(teamTwo, ten, 'Support')
-    #Get XPD stats for each lane at 10 minutes
-    xpd10top = get_xp(teamOne, ten, 'Top') - get_xp(teamTwo, ten, 'Top')
-    xpd10jg =  get_xp(teamOne, ten, 'Jungle') - get_xp(teamTwo, ten, 'Jungle')
-    xpd10mid = get_xp(teamOne, ten, 'Mid') - get_xp(teamTwo, ten, 'Mid')
-    xpd10bot = get_xp(teamOne, ten, 'Bot') - get_xp(teamTwo, ten, 'Bot')
-    xpd10sup = get_xp(teamOne, ten, 'Support') - get_xp(teamTwo, ten, 'Support')
-    
-    #Get timestamp for 15 minutes
-    fifteen = check_time(teamOne, 15)
-    #Get CSD stats for each lane at 15 minutes
-    csd15top = get_cs(teamOne, fifteen, 'Top') - get_cs(teamTwo, fifteen, 'Top')
-    csd15jg =  get_cs(teamOne, fifteen, 'Jungle') - get_cs(teamTwo, fifteen, 'Jungle')
-    csd15mid = get_cs(teamOne, fifteen, 'Mid') - get_cs(teamTwo, fifteen, 'Mid')
-    csd15bot = get_cs(teamOne, fifteen, 'Bot') - get_cs(teamTwo, fifteen, 'Bot')
-    csd15sup = get_cs(teamOne, fifteen, 'Support') - get_cs(teamTwo, fifteen, 'Support')
-    #Get GD stats for team at 15 minutes
-    gd15 = get_team_g(teamOne,fifteen) - get_team_g(teamTwo,fifteen)
-    #Get XPD stats for each lane at 15 minutes
-    xpd15top = get_xp(teamOne, fifteen, 'Top') - get_xp(teamTwo, fifteen, 'Top')
-    xpd15jg =  get_xp(teamOne, fifteen, 'Jungle') - get_xp(teamTwo, fifteen, 'Jungle')
-    xpd15mid = get_xp(teamOne, fifteen, 'Mid') - get_xp(teamTwo, fifteen, 'Mid')
-    xpd15bot = get_xp(teamOne, fifteen, 'Bot') - get_xp(teamTwo, fifteen, 'Bot')
-    xpd15sup = get_xp(teamOne, fifteen, 'Support') - get_xp(teamTwo, fifteen, 'Support')
-    
-    #Get timestamp for 20 minutes
-    twenty = check_time(teamOne, 20)
-    #Get GD stats for team at 20 minutes
-    gd20 = get_team_g(teamOne, twenty) - get_team_g(teamTwo, twenty)
+    #Build the snapshot lookup for each team once, every stat is then looked up from it in one go
+    with profile_stage('snapshot index', rows_in=len(teamOne) + len(teamTwo)):
+        one, two = build_snapshot_index(teamOne), build_snapshot_index(teamTwo)
     
     #create final output dataframe
-    final_df = pd.DataFrame({
+    row = {
         'Date': teamOne['date'].head(1).item(),
         'Win': teamOne['winningTeam'].head(1).item(),
         'Team': teamTwo['Team'].head(1).item(),
@@ -532,95 +1717,29 @@ def final_output(teamOne, teamTwo):
         'First Herald': teamOne['firstHerald'].head(1).item(),
         'First Tower': teamOne['firstTower'].head(1).item(),
         'Mid Tower': teamOne['firstMid'].head(1).item(),
-        
-        'CSD@10 Top': [csd10top],
-        'CSD@10 Jg': [csd10jg],
-        'CSD@10 Mid': [csd10mid],
-        'CSD@10 AD': [csd10bot],
-        'CSD@10 Sup': [csd10sup],
-        'GD@10 Top': [gd10top],
-        'GD@10 Jg': [gd10jg],
-        'GD@10 Mid': [gd10mid],
-        'GD@10 AD': [gd10bot],
-        'GD@10 Sup': [gd10sup],
-        'XPD@10 Top': [xpd10top],
-        'XPD@10 Jg': [xpd10jg],
-        'XPD@10 Mid': [xpd10mid],
-        'XPD@10 AD': [xpd10bot],
-        'XPD@10 Sup': [xpd10sup],
-        
-        'CSD@15 Top': [csd15top],
-        'CSD@15 Jg': [csd15jg],
-        'CSD@15 Mid': [csd15mid],
-        'CSD@15 AD': [csd15bot],
-        'CSD@15 Sup': [csd15sup],
-        
-        'XPD@15 Top': [xpd15top],
-        'XPD@15 Jg': [xpd15jg],
-        'XPD@15 Mid': [xpd15mid],
-        'XPD@15 AD': [xpd15bot],
-        'XPD@15 Sup': [xpd15sup],
-
-        'GD@15 Team': [gd15],
-        'GD@20 Team': [gd20]
-        })
+        }
+    row.update(evaluate_stats(one, two, compile_stat_sheet(stat_sheet)))
+    final_df = pd.DataFrame([row])
     
     return final_df                                     
 
-def final_output_academy(teamOne, teamTwo):
+def final_output_academy(teamOne, teamTwo, stat_sheet=STAT_SHEET_ACADEMY):
     '''
     Had to create a different function for Academy because they wanted different stats
+    (and the team tag instead of the contract database team, no Win column)
     Input: 
         teamOne: CLG dataframe from objectives function
         teamTwo: team2 dataframe from objectives function
+        stat_sheet: stat specs for the stat columns (see STAT_SHEET_ACADEMY)
     Output:
         final_df: cleaned dataframe with all stats needed
     '''
-        
-    #Get timestamp for 10 minute
-    ten = check_time(teamOne, 10)
-    #Get CSD stats for each lane at 10 minutes
-    csd10top = get_cs(teamOne, ten, 'Top') - get_cs(teamTwo, ten, 'Top')
-    csd10jg =  get_cs(teamOne, ten, 'Jungle') - get_cs(teamTwo, ten, 'Jungle')
-    csd10mid = get_cs(teamOne, ten, 'Mid') - get_cs(teamTwo, ten, 'Mid')
-    csd10bot = get_cs(teamOne, ten, 'Bot') - get_cs(teamTwo, ten, 'Bot')
-    csd10sup = get_cs(teamOne, ten, 'Support') - get_cs(teamTwo, ten, 'Support')
-    #Get GD stats for each lane at 10 minutes
-    gd10top = get_g(teamOne, ten, 'Top') - get_g(teamTwo, ten, 'Top')
-    gd10jg =  get_g(teamOne, ten, 'Jungle') - get_g(teamTwo, ten, 'Jungle')
-    gd10mid = get_g(teamOne, ten, 'Mid') - get_g(teamTwo, ten, 'Mid')
-    gd10bot = get_g(teamOne, ten, 'Bot') - get_g(teamTwo, ten, 'Bot')
-    gd10sup = get_g(teamOne, ten, 'Support') - get_g(teamTwo, ten, 'Support')
-    #Get XPD stats for each lane at 10 minutes
-    xpd10top = get_xp(teamOne, ten, 'Top') - get_xp(teamTwo, ten, 'Top')
-    xpd10jg =  get_xp(teamOne, ten, 'Jungle') - get_xp(teamTwo, ten, 'Jungle')
-    xpd10mid = get_xp(teamOne, ten, 'Mid') - get_xp(teamTwo, ten, 'Mid')
-    xpd10bot = get_xp(teamOne, ten, 'Bot') - get_xp(teamTwo, ten, 'Bot')
-    xpd10sup = get_xp(teamOne, ten, 'Support') - get_xp(teamTwo, ten, 'Support')\
-    
-    #Get timestamp for 15 minutes
-    fifteen = check_time(teamOne, 15)
-    #Get CSD stats for each lane at 15 minutes
-    csd15top = get_cs(teamOne, fifteen, 'Top') - get_cs(teamTwo, fifteen, 'Top')
-    csd15jg =  get_cs(teamOne, fifteen, 'Jungle') - get_cs(teamTwo, fifteen, 'Jungle')
-    csd15mid = get_cs(teamOne, fifteen, 'Mid') - get_cs(teamTwo, fifteen, 'Mid')
-    csd15bot = get_cs(teamOne, fifteen, 'Bot') - get_cs(teamTwo, fifteen, 'Bot')
-    csd15sup = get_cs(teamOne, fifteen, 'Support') - get_cs(teamTwo, fifteen, 'Support')\
-    #Get GD stats for each lane at 15 minutes
-    gd15top = get_g(teamOne, fifteen, 'Top') - get_g(teamTwo, fifteen, 'Top')
-    gd15jg =  get_g(teamOne, fifteen, 'Jungle') - get_g(teamTwo, fifteen, 'Jungle')
-    gd15mid = get_g(teamOne, fifteen, 'Mid') - get_g(teamTwo, fifteen, 'Mid')
-    gd15bot = get_g(teamOne, fifteen, 'Bot') - get_g(teamTwo, fifteen, 'Bot')
-    gd15sup = get_g(teamOne, fifteen, 'Support') - get_g(teamTwo, fifteen, 'Support')
-    #Get XPD stats for each lane at 15 minutes
-    xpd15top = get_xp(teamOne, fifteen, 'Top') - get_xp(teamTwo, fifteen, 'Top')
-    xpd15jg =  get_xp(teamOne, fifteen, 'Jungle') - get_xp(teamTwo, fifteen, 'Jungle')
-    xpd15mid = get_xp(teamOne, fifteen, 'Mid') - get_xp(teamTwo, fifteen, 'Mid')
-    xpd15bot = get_xp(teamOne, fifteen, 'Bot') - get_xp(teamTwo, fifteen, 'Bot')
-    xpd15sup = get_xp(teamOne, fifteen, 'Support') - get_xp(teamTwo, fifteen, 'Support')
+    #Build the snapshot lookup for each team once, every stat is then looked up from it in one go
+    with profile_stage('snapshot index', rows_in=len(teamOne) + len(teamTwo)):
+        one, two = build_snapshot_index(teamOne), build_snapshot_index(teamTwo)
     
     #Create final dataframe to output
-    final_df = pd.DataFrame({
+    row = {
         'Date': teamOne['date'].head(1).item(),
         'Team': teamTwo['Team_name'].head(1).item(),
         'First Blood': teamOne['firstBlood'].head(1).item(),
@@ -628,63 +1747,1502 @@ def final_output_academy(teamOne, teamTwo):
         'First Herald': teamOne['firstHerald'].head(1).item(),
         'First Tower': teamOne['firstTower'].head(1).item(),
         'Mid Tower': teamOne['firstMid'].head(1).item(),
-        
-        'CSD@10 Top': [csd10top],
-        'CSD@10 Jg': [csd10jg],
-        'CSD@10 Mid': [csd10mid],
-        'CSD@10 AD': [csd10bot],
-        'CSD@10 Sup': [csd10sup],
-        'GD@10 Top': [gd10top],
-        'GD@10 Jg': [gd10jg],
-        'GD@10 Mid': [gd10mid],
-        'GD@10 AD': [gd10bot],
-        'GD@10 Sup': [gd10sup],
-        'XPD@10 Top': [xpd10top],
-        'XPD@10 Jg': [xpd10jg],
-        'XPD@10 Mid': [xpd10mid],
-        'XPD@10 AD': [xpd10bot],
-        'XPD@10 Sup': [xpd10sup],
-        
-        'CSD@15 Top': [csd15top],
-        'CSD@15 Jg': [csd15jg],
-        'CSD@15 Mid': [csd15mid],
-        'CSD@15 AD': [csd15bot],
-        'CSD@15 Sup': [csd15sup],
-        'GD@15 Top': [gd15top],
-        'GD@15 Jg': [gd15jg],
-        'GD@15 Mid': [gd15mid],
-        'GD@15 AD': [gd15bot],
-        'GD@15 Sup': [gd15sup],
-        'XPD@15 Top': [xpd15top],
-        'XPD@15 Jg': [xpd15jg],
-        'XPD@15 Mid': [xpd15mid],
-        'XPD@15 AD': [xpd15bot],
-        'XPD@15 Sup': [xpd15sup]
-        })
+        }
+    row.update(evaluate_stats(one, two, compile_stat_sheet(stat_sheet)))
+    final_df = pd.DataFrame([row])
     
     return final_df
 
-def scrim_automater(json_dir):
+#Report of the game being profiled (see profile_game), None when nothing is
+_profile = None
+
+def peak_rss_mb():
+    '''
+    Most memory this process has used so far in MB (None where the resource module doesn't exist)
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux gives KB, macOS gives bytes
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+@contextmanager
+def profile_stage(name, **counts):
+    '''
+    Times one stage of a run when a game is being profiled (see profile_game) and does nothing otherwise
+    The block gets the stage's dict so it can add counts like rows_out or files
+    Stages inside stages get a higher 'depth'. Only the outer ones (depth 0) get run under cProfile
+    Input:
+        name: name of the stage in the report
+        counts: anything already known about the stage (rows_in, files, ...)
+    '''
+    if _profile is None:
+        yield counts
+        return
+    stage = dict(stage=name, depth=_profile['depth'], **counts)
+    _profile['stages'].append(stage)
+    number = len(_profile['stages']) - 1
+    profiler = cProfile.Profile() if _profile['cprofile'] and _profile['depth'] == 0 else None
+    _profile['depth'] += 1
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield stage
+    except BaseException:
+        #Every stage the error went through gets it, the last one of those to start is where it happened
+        stage['failed'] = True
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            _profile['profilers'][number] = profiler
+        _profile['depth'] -= 1
+        stage['seconds'] = round(time.perf_counter() - wall, 6)
+        stage['cpu_seconds'] = round(time.process_time() - cpu, 6)
+        stage['peak_rss_mb'] = peak_rss_mb()
+
+def count_read(size):
+    '''
+    Adds size bytes to what the game being profiled has read (see profile_game), does nothing otherwise
+    '''
+    if _profile is not None:
+        _profile['bytes_read'] += size
+
+@contextmanager
+def profiling(cprofile=False):
+    '''
+    Collects the stages (see profile_stage) of everything run inside it into the profile it gives the block, which
+    keeps whatever was collected even if the block fails
+    '''
+    global _profile
+    if _profile is not None:
+        raise RuntimeError('Already profiling a game')
+    _profile = {'stages': [], 'depth': 0, 'cprofile': cprofile, 'profilers': {}, 'bytes_read': 0}
+    try:
+        yield _profile
+    finally:
+        _profile = None
+
+def profile_report(profile, json_dir, academy, seconds, cpu_seconds):
+    '''
+    Report of one game from the profile profiling collected (see profile_game for what's in it)
+    '''
+    stages = profile['stages']
+    outer = [i for i, stage in enumerate(stages) if stage['depth'] == 0]
+    failed = [stage['stage'] for stage in stages if stage.get('failed')]
+    return {'game': game_name(json_dir), 'path': json_dir, 'academy': academy,
+            'files': next((stage['files'] for stage in stages if 'files' in stage), None), 'bytes_read': profile['bytes_read'],
+            'seconds': round(seconds, 6), 'cpu_seconds': round(cpu_seconds, 6), 'peak_rss_mb': peak_rss_mb(),
+            'slowest': stages[max(outer, key=lambda i: stages[i]['seconds'])]['stage'] if outer else None,
+            'failed_stage': failed[-1] if failed else None, 'stages': stages}
+
+def scrim_automater(json_dir, workers=1, offline=False, cache_dir=None, early=False, engine='pandas'):
     '''
     Runs all functions
+    workers: number of processes used to read the JSON files (see json_to_df)
+    offline: only use the saved contract database (see get_contract_db)
+    cache_dir: folder to save the parsed game in so reruns skip the JSON files (see load_game)
+    early: only read the game up to the last minute OUTPUT_STATS uses, plus the end of it for the winner (see read_early_game)
+    engine: 'pandas' or 'arrow', what reads and parses the JSON files (see ENGINES)
     '''
-    rawdata = json_to_df(json_dir)
-    teamOne, teamTwo = get_team_data(rawdata)
-    final = final_output(teamOne, teamTwo)
+    with profile_stage('load_game') as stage:
+        until = max(minute for name, stat, minute, per_lane in OUTPUT_STATS) if early else None
+        game = load_game(json_dir, workers, cache_dir, until, engine=engine)
+        stage['rows_out'] = len(game['data'])
+    with profile_stage('get_team_data', rows_in=len(game['data'])) as stage:
+        teamOne, teamTwo = get_team_data(game, offline)
+        stage['rows_out'] = len(teamOne) + len(teamTwo)
+    with profile_stage('final_output', rows_in=len(teamOne) + len(teamTwo)) as stage:
+        final = final_output(teamOne, teamTwo)
+        stage['rows_out'] = len(final)
     return final
 
-def scrim_automater_academy(json_dir):
+def scrim_automater_academy(json_dir, workers=1, offline=False, cache_dir=None, early=False, engine='pandas'):
     '''
     Runs all functions. Had to create a separate function for academy
+    workers: number of processes used to read the JSON files (see json_to_df)
+    offline: only use the saved contract database (see get_contract_db)
+    cache_dir: folder to save the parsed game in so reruns skip the JSON files (see load_game)
+    early: only read the game up to the last minute OUTPUT_STATS_ACADEMY uses (see read_early_game, no winner needed)
+    engine: 'pandas' or 'arrow', what reads and parses the JSON files (see ENGINES)
     '''
-    rawdata = json_to_df(json_dir)
-    CLG, team2 = get_team_data_academy(rawdata)
-    final = final_output_academy(CLG, team2)
+    with profile_stage('load_game') as stage:
+        until = max(minute for name, stat, minute, per_lane in OUTPUT_STATS_ACADEMY) if early else None
+        game = load_game(json_dir, workers, cache_dir, until, winner=False, engine=engine)
+        stage['rows_out'] = len(game['data'])
+    with profile_stage('get_team_data', rows_in=len(game['data'])) as stage:
+        CLG, team2 = get_team_data_academy(game, offline)
+        stage['rows_out'] = len(CLG) + len(team2)
+    with profile_stage('final_output', rows_in=len(CLG) + len(team2)) as stage:
+        final = final_output_academy(CLG, team2)
+        stage['rows_out'] = len(final)
     return final
 
-#Change directory to match what game file you want to convert
-#output = scrim_automater('\\Users\\...')
-output = scrim_automater_academy('\\Users\\cheah\\Documents\\CLG\\8-8_CLGavsDig_1')
+def profile_game(json_dir, academy=False, workers=1, offline=False, cache_dir=None, cprofile_path=None, early=False, engine='pandas'):
+    '''
+    Runs scrim_automater (or scrim_automater_academy) on one game and reports how long and how much memory every
+    stage took, so it's clear if the time goes into reading files, json_normalize, the contract database or the lookups
+    Input:
+        json_dir, academy, workers, offline, cache_dir, early, engine: same as scrim_automater
+        cprofile_path: also run the outer stages under cProfile and save the stats of the slowest one here
+                       (open with python -m pstats or snakeviz)
+    Output:
+        final: the output of scrim_automater
+        report: dict with 'game', 'path', 'academy', 'files', 'bytes_read' (bytes of JSON and saved game read in this
+                process), 'seconds', 'cpu_seconds', 'peak_rss_mb', 'slowest', 'failed_stage' (None here) and 'stages'
+                (one dict per stage in the order they started: 'stage', 'depth', 'seconds', 'cpu_seconds',
+                'peak_rss_mb' and counts like 'rows_in', 'rows_out', 'files')
+    '''
+    wall, cpu = time.perf_counter(), time.process_time()
+    with profiling(cprofile_path is not None) as profile:
+        automater = scrim_automater_academy if academy else scrim_automater
+        final = automater(json_dir, workers, offline, cache_dir, early, engine)
+    report = profile_report(profile, json_dir, academy, time.perf_counter() - wall, time.process_time() - cpu)
+    if cprofile_path:
+        slowest = next(i for i, stage in enumerate(report['stages']) if stage['depth'] == 0 and stage['stage'] == report['slowest'])
+        profile['profilers'][slowest].dump_stats(cprofile_path)
+        report['cprofile'] = cprofile_path
+    return final, report
+
+def save_profile(report, path):
+    '''
+    Saves a report from profile_game as .json
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+def find_game_dirs(root_dir, skip=()):
+    '''
+    Finds every game folder under root_dir (a folder with JSON files in it, its subfolders count as part of that game)
+    and every game archive (see ARCHIVE_EXTENSIONS) that isn't inside a game folder
+    An archive next to a game folder of the same name (like the g1.ndjson pack_game writes next to g1) is a copy of
+    that game, so only the folder is kept
+    Input:
+        root_dir: folder with the game folders in it
+        skip: files and folders under root_dir that aren't games (the manifest, profile reports or queue of a batch,
+              which are .json files too and would make their folder look like a game)
+    Output:
+        game_dirs: sorted list of game folder and archive paths
+    '''
+    skip = {os.path.abspath(path) for path in skip if path}
+    folders = []
+    archives = []
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) not in skip]
+        files = [name for name in files if os.path.abspath(os.path.join(root, name)) not in skip]
+        if any(is_json_name(name) for name in files):
+            folders.append(root)
+            #json_to_df already reads the subfolders of a game folder
+            dirs[:] = []
+        else:
+            archives.extend(os.path.join(root, name) for name in files if name.lower().endswith(ARCHIVE_EXTENSIONS))
+            dirs.sort()
+    found = set(folders)
+    copies = [path for path in archives if os.path.join(os.path.dirname(path), game_name(path)) in found]
+    return sorted(folders + [path for path in archives if path not in copies])
+
+def inside_folder(path, folder):
+    '''
+    True if path is folder or anywhere under it
+    '''
+    path, folder = os.path.abspath(path), os.path.abspath(folder)
+    return os.path.commonpath([path, folder]) == folder
+
+def process_game(json_dir, academy=False, offline=False, cache_dir=None, profile_dir=None, details=False, early=False, engine='pandas'):
+    '''
+    Runs scrim_automater (or scrim_automater_academy) on one game and catches anything that goes wrong so one bad game
+    doesn't stop a batch. Has to stay a top-level function because it runs in the batch worker processes
+    Every game is run under profiling (without cProfile, so it costs next to nothing) for its 'report' (see
+    profile_game), which is also there when the game failed. With a profile_dir it's saved there as <game>.profile.json
+    With details the result also gets 'curves' and 'timeline' (see game_details) for the results database, those need
+    the whole game so early (see read_early_game) is ignored then
+    Output:
+        result: dict with 'game' (folder name), 'path', 'output' (final dataframe or None), 'error' (None or the traceback),
+                'seconds' (how long the game took) and 'report'
+    '''
+    start, cpu = time.perf_counter(), time.process_time()
+    result = {'game': game_name(json_dir), 'path': json_dir, 'output': None, 'error': None}
+    try:
+        with profiling() as profile:
+            if details:
+                game = load_game(json_dir, 1, cache_dir, engine=engine)
+                CLG, team2 = (get_team_data_academy if academy else get_team_data)(game, offline)
+                result['output'] = (final_output_academy if academy else final_output)(CLG, team2)
+                result['curves'], result['timeline'] = game_details(game, CLG, team2)
+            else:
+                automater = scrim_automater_academy if academy else scrim_automater
+                result['output'] = automater(json_dir, 1, offline, cache_dir, early, engine)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    result['report'] = profile_report(profile, json_dir, academy, result['seconds'], time.process_time() - cpu)
+    if profile_dir:
+        save_profile(result['report'], os.path.join(profile_dir, result['game'] + '.profile.json'))
+    return result
+
+def combine_results(results):
+    '''
+    Puts the output row of every game that worked into one dataframe (with a 'Game' column for the folder name)
+    '''
+    rows = [result['output'].assign(Game=result['game']) for result in results if result['output'] is not None]
+    if not rows:
+        return pd.DataFrame()
+    combined = pd.concat(rows, ignore_index=True)
+    return combined[['Game'] + [column for column in combined.columns if column != 'Game']]
+
+def pool_games(todo, workers, args, died):
+    '''
+    Runs process_game on the game folders in the todo deque in one pool of processes and yields each result as soon as
+    it's done. A game is only handed out when a worker is free, so when a worker process dies (killed for using too much
+    memory, a crash in a C library) and breaks the pool, the games that were running go in died and the rest stay in todo
+    '''
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while todo or running:
+            try:
+                while todo and len(running) < workers:
+                    json_dir = todo[0]
+                    running[pool.submit(process_game, json_dir, *args)] = json_dir
+                    todo.popleft()
+            except BrokenProcessPool:
+                #Broke since the last wait, the futures still running say which games went with it
+                if not running:
+                    raise
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                json_dir = running.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    died.append(json_dir)
+            if died:
+                #Everything else that was running in the pool is lost with it
+                died.extend(running.values())
+                return
+
+def worker_died(json_dir, seconds):
+    '''
+    Result (like process_game gives) for a game whose worker process died while running it
+    '''
+    error = 'BrokenProcessPool: the worker process running this game died (out of memory or a crash)\n'
+    return {'game': game_name(json_dir), 'path': json_dir, 'output': None, 'error': error, 'seconds': seconds,
+            'report': {'failed_stage': 'worker'}}
+
+def run_games(game_dirs, academy=False, workers=None, offline=False, cache_dir=None, profile_dir=None, details=False, early=False,
+              engine='pandas'):
+    '''
+    Runs process_game on each game folder across a pool of processes and yields each result as soon as it's done
+    When a worker process dies the games it took down with it are run again one at a time, so only the game that kills
+    its worker fails (with 'failed_stage' 'worker', see worker_died), and the games left go to a new pool
+    '''
+    args = (academy, offline, cache_dir, profile_dir, details, early, engine)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(game_dirs) > 1:
+        todo = collections.deque(game_dirs)
+        while todo:
+            died = []
+            yield from pool_games(todo, min(workers, len(todo)), args, died)
+            for json_dir in died:
+                start, again = time.perf_counter(), []
+                yield from pool_games(collections.deque([json_dir]), 1, args, again)
+                if again:
+                    yield worker_died(json_dir, time.perf_counter() - start)
+    else:
+        for json_dir in game_dirs:
+            yield process_game(json_dir, *args)
+
+def code_version():
+    '''
+    Short hash of this file, so saved results get redone after the code that made them changes
+    '''
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+def fingerprint_game(json_dir, contents=False):
+    '''
+    Describes the files of a game folder so a later run can tell if anything was added or changed
+    Input:
+        json_dir: game folder (or archive, then it's the archive file that gets described)
+        contents: hash what's in every file instead of just the file sizes and modified times (slower, but catches
+                  files that were rewritten with the same size and time)
+    Output:
+        fingerprint: dict with 'files' (number of JSON files), 'bytes' (total size) and 'hash'
+    '''
+    digest = hashlib.sha1()
+    if is_archive(json_dir):
+        #An archive is one file, its size and time (or contents) stand for the whole game
+        stat = os.stat(json_dir)
+        digest.update((os.path.basename(json_dir) + '|' + str(stat.st_size) + '|' + str(stat.st_mtime_ns) + '\n').encode())
+        if contents:
+            with open(json_dir, 'rb') as f:
+                for block in iter(lambda: f.read(2**20), b''):
+                    digest.update(block)
+        return {'files': 1, 'bytes': stat.st_size, 'hash': digest.hexdigest()}
+    total = 0
+    json_paths = sorted(list_json_files(json_dir))
+    for json_path in json_paths:
+        stat = os.stat(json_path)
+        total += stat.st_size
+        digest.update((os.path.relpath(json_path, json_dir) + '|' + str(stat.st_size) + '|' + str(stat.st_mtime_ns) + '\n').encode())
+        if contents:
+            with open(json_path, 'rb') as f:
+                digest.update(f.read())
+    return {'files': len(json_paths), 'bytes': total, 'hash': digest.hexdigest()}
+
+def load_manifest(manifest_path, academy=False, rebuild=False):
+    '''
+    Loads the manifest of a batch (what every game folder looked like and the output row it gave)
+    Starts a new one if there isn't one yet, rebuild is set, or it was made by different code or for the other roster
+    '''
+    manifest = {'code': code_version(), 'academy': academy, 'games': {}}
+    if rebuild or not os.path.exists(manifest_path):
+        return manifest
+    with open(manifest_path) as f:
+        saved = json.load(f)
+    if saved.get('code') == manifest['code'] and saved.get('academy') == academy:
+        manifest['games'] = saved.get('games', {})
+    return manifest
+
+def save_manifest(manifest, manifest_path):
+    '''
+    Saves the manifest (written to a temporary file first so a run that gets killed never leaves half a manifest)
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path + '.tmp', 'w') as f:
+        #default=str turns the Date column into '2022-08-08' like it shows in the .csv
+        json.dump(manifest, f, indent=1, default=str)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def game_event(result, status):
+    '''
+    Structured event (one JSON line in the events file) for a game of a batch, from its process_game result
+    Input:
+        result: from process_game, or a game reused from the manifest (that one has no 'report')
+        status: 'done', 'failed' or 'reused'
+    Output:
+        event: dict with 'time', 'game', 'path', 'status', 'seconds', 'cpu_seconds', 'files', 'bytes_read', 'peak_rss_mb',
+               'slowest', 'roster_source' (see contract_db_source), 'roster_cache_hit' (the saved copy was used instead
+               of downloading it), 'game_cache_hit', 'failed_stage' and 'error' (last line of the traceback). The roster
+               and cache ones are None when that stage never ran
+    '''
+    report = result.get('report') or {}
+    stages = report.get('stages', [])
+    found = lambda name, key: next((stage[key] for stage in stages if stage['stage'] == name and key in stage), None)
+    roster = found('contract database', 'source')
+    failed = status == 'failed'
+    return {'time': datetime.now().isoformat(timespec='seconds'), 'game': result['game'], 'path': result['path'], 'status': status,
+            'seconds': round(result['seconds'], 6), 'cpu_seconds': report.get('cpu_seconds'), 'files': report.get('files'),
+            'bytes_read': report.get('bytes_read'), 'peak_rss_mb': report.get('peak_rss_mb'), 'slowest': report.get('slowest'),
+            'roster_source': roster, 'roster_cache_hit': roster == 'saved' if roster else None,
+            'game_cache_hit': found('read game cache', 'hit'),
+            #Errors outside every stage (like a game folder that can't be listed) count as 'other'
+            'failed_stage': (report.get('failed_stage') or 'other') if failed else None,
+            'error': result['error'].strip().splitlines()[-1] if failed else None}
+
+def metric_lines(name, kind, description, samples):
+    '''
+    One metric in the Prometheus text format: its HELP and TYPE lines, then a line per (labels dict, value) sample
+    '''
+    lines = ['# HELP ' + name + ' ' + description, '# TYPE ' + name + ' ' + kind]
+    for labels, value in samples:
+        #Label values can't have raw backslashes, quotes or newlines
+        escaped = {key: str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for key, label in labels.items()}
+        label_text = '{' + ','.join(key + '="' + label + '"' for key, label in escaped.items()) + '}' if labels else ''
+        lines.append(name + label_text + ' ' + (repr(round(value, 6)) if isinstance(value, float) else str(value)))
+    return lines
+
+def batch_metrics(events, seconds):
+    '''
+    Summary of a batch in the Prometheus text format (what node_exporter's textfile collector reads), so a nightly run
+    can go on a dashboard. Rates and latencies only count the games that were run, not the ones reused from the manifest
+    Input:
+        events: game_event of every game in the batch
+        seconds: how long running the games took
+    Output:
+        text: the metrics, ending with a newline
+    '''
+    run = [event for event in events if event['status'] != 'reused']
+    latencies = np.array([event['seconds'] for event in run], dtype=float)
+    files = sum(event['files'] or 0 for event in run)
+    p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (float('nan'), float('nan'))
+    cache = lambda key: [({'result': 'hit'}, sum(event[key] is True for event in run)),
+                         ({'result': 'miss'}, sum(event[key] is False for event in run))]
+    failures = collections.Counter(event['failed_stage'] for event in run if event['status'] == 'failed')
+    prefix = 'lolscrim_batch_'
+    lines = []
+    lines += metric_lines(prefix + 'games', 'gauge', 'Games in the last batch by how they ended',
+                          [({'status': status}, sum(event['status'] == status for event in events)) for status in ('done', 'failed', 'reused')])
+    lines += metric_lines(prefix + 'seconds', 'gauge', 'Seconds the last batch spent running games', [({}, float(seconds))])
+    lines += metric_lines(prefix + 'games_per_second', 'gauge', 'Games run per second in the last batch',
+                          [({}, len(run) / seconds if seconds else 0.0)])
+    lines += metric_lines(prefix + 'files', 'gauge', 'JSON files in the games run in the last batch', [({}, files)])
+    lines += metric_lines(prefix + 'files_per_second', 'gauge', 'JSON files per second in the last batch', [({}, files / seconds if seconds else 0.0)])
+    lines += metric_lines(prefix + 'bytes_read', 'gauge', 'Bytes of JSON and saved games read in the last batch',
+                          [({}, sum(event['bytes_read'] or 0 for event in run))])
+    lines += metric_lines(prefix + 'game_seconds', 'summary', 'Seconds per game in the last batch',
+                          [({'quantile': '0.5'}, float(p50)), ({'quantile': '0.95'}, float(p95))])
+    lines += [prefix + 'game_seconds_sum ' + repr(round(float(latencies.sum()), 6)), prefix + 'game_seconds_count ' + str(len(latencies))]
+    lines += metric_lines(prefix + 'roster_cache', 'gauge', 'Games that used the saved contract database (hit) or a downloaded one (miss)',
+                          cache('roster_cache_hit'))
+    lines += metric_lines(prefix + 'roster_source', 'gauge', 'Games by where their contract database came from (see contract_db_source)',
+                          [({'source': source}, sum(event['roster_source'] == source for event in run)) for source in ('saved', 'download', 'fallback')])
+    lines += metric_lines(prefix + 'game_cache', 'gauge', 'Games loaded from the saved game cache (hit) or parsed (miss)', cache('game_cache_hit'))
+    lines += metric_lines(prefix + 'failures', 'gauge', 'Failed games in the last batch by the stage they failed in',
+                          sorted(({'stage': stage}, count) for stage, count in failures.items()))
+    lines += metric_lines(prefix + 'last_run_timestamp_seconds', 'gauge', 'When the last batch finished', [({}, float(time.time()))])
+    return '\n'.join(lines) + '\n'
+
+def save_metrics(text, path):
+    '''
+    Saves batch_metrics (written to a temporary file first, the textfile collector must never see half of it)
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+def scrim_automater_batch(root_dir, academy=False, workers=None, offline=False, manifest_path=None, rebuild=False, contents=False,
+                          cache_dir=None, profile_dir=None, results_db=None, details=False, early=False, engine='pandas',
+                          metrics_path=None, events_path=None):
+    '''
+    Runs every game folder under root_dir across a pool of processes (one game per process at a time)
+    With a manifest only new or changed games get run, the rest reuse the row saved from the last run.
+    The manifest is saved after every game so a run that gets interrupted picks up where it stopped
+    Input:
+        root_dir: folder with the game folders in it (can be nested, like split/week/game)
+        academy: use the academy functions
+        workers: number of processes (default: number of CPU cores)
+        offline: only use the saved contract database (see get_contract_db)
+        manifest_path: .json file to keep the manifest in (None runs every game every time)
+        rebuild: ignore what's in the manifest and run every game again
+        contents: fingerprint games by what's in their files, not just sizes and times (see fingerprint_game)
+        cache_dir: folder to save parsed games in (see load_game)
+        profile_dir: folder to save a profile report of every game that gets run in (see profile_game)
+        results_db: results database (see open_results_db) to save every game that worked in
+        details: also save the per-minute diffs and objective timeline of every game that gets run (see game_details)
+        early: only read the parts of each game the stats need (see read_early_game)
+        engine: what reads and parses the JSON files (see ENGINES)
+        metrics_path: file to save a summary of the run in, in the Prometheus text format (see batch_metrics)
+        events_path: file to add a JSON line to for every game as it's done (see game_event)
+    Output:
+        output: dataframe with one row per game that worked
+        failures: list of results (see process_game) for the games that didn't
+    '''
+    #Files the batch writes itself aren't games, even when they're saved under root_dir
+    own = [manifest_path, profile_dir, metrics_path, events_path, results_db]
+    for path in own:
+        if path and inside_folder(path, root_dir):
+            print('Warning: ' + path + ' is inside ' + root_dir + ', it is left out of the games')
+    game_dirs = find_game_dirs(root_dir, own)
+    results = []
+    todo = game_dirs
+
+    if manifest_path:
+        manifest = load_manifest(manifest_path, academy, rebuild)
+        games = {}
+        fingerprints = {}
+        todo = []
+        for json_dir in game_dirs:
+            key = os.path.relpath(json_dir, root_dir)
+            fingerprints[json_dir] = fingerprint_game(json_dir, contents)
+            saved = manifest['games'].get(key)
+            #Games that failed last time get another go
+            if saved and saved['hash'] == fingerprints[json_dir]['hash'] and saved['row'] is not None:
+                games[key] = saved
+                results.append({'game': game_name(json_dir), 'path': json_dir,
+                                'output': pd.DataFrame([saved['row']]), 'error': None, 'seconds': 0.0})
+            else:
+                todo.append(json_dir)
+        #Games that aren't in the folder anymore get dropped
+        manifest['games'] = games
+        print('Reusing ' + str(len(results)) + ' games from ' + manifest_path + ', running ' + str(len(todo)))
+
+    if todo:
+        #Load the contract database here first so the worker processes read the saved copy instead of all downloading it
+        get_contract_db(offline=offline)
+
+    events = [game_event(result, 'reused') for result in results]
+    #The database and the events file get closed (with every finished line written) even if something below fails
+    with ExitStack() as stack:
+        conn = stack.enter_context(closing(open_results_db(results_db))) if results_db else None
+        #Games reused from the manifest go in too, in case the database is newer than the manifest
+        for result in results if conn else []:
+            save_result(conn, result['game'], result['output'], academy, result['path'])
+
+        events_file = stack.enter_context(open(events_path, 'a')) if events_path else None
+        for event in events if events_file else []:
+            events_file.write(json.dumps(event) + '\n')
+
+        start = time.perf_counter()
+        for result in run_games(todo, academy, workers, offline, cache_dir, profile_dir, details, early, engine):
+            print(('Failed ' if result['error'] else 'Done ') + result['game'])
+            results.append(result)
+            events.append(game_event(result, 'failed' if result['error'] else 'done'))
+            if events_file:
+                #One line per game as soon as it's done, so a run that's still going can be followed
+                events_file.write(json.dumps(events[-1]) + '\n')
+                events_file.flush()
+            if conn and result['output'] is not None:
+                save_result(conn, result['game'], result['output'], academy, result['path'], result.get('curves'), result.get('timeline'))
+            if manifest_path:
+                row = result['output'].to_dict('records')[0] if result['output'] is not None else None
+                manifest['games'][os.path.relpath(result['path'], root_dir)] = dict(fingerprints[result['path']], row=row, error=result['error'])
+                save_manifest(manifest, manifest_path)
+
+    if manifest_path and not todo:
+        save_manifest(manifest, manifest_path)
+    if metrics_path:
+        save_metrics(batch_metrics(events, time.perf_counter() - start), metrics_path)
+
+    #Keep the games in folder order no matter which one finished first
+    results.sort(key=lambda result: game_dirs.index(result['path']))
+    failures = [result for result in results if result['error']]
+    return combine_results(results), failures
+
+#Shared work queue for backfilling a lot of games from several machines (see create_queue and queue_worker)
+#It's only files in a folder every machine can reach (a network drive), since SQLite locking isn't safe over network drives:
+#   queue.json         what to run (written once by create_queue)
+#   claims/<key>.<n>.lock  attempt n at a game, the file's modified time is its lease and gets renewed while it runs
+#   results/<key>.json the output row (or error) of a game that's done, written to a temporary file first then renamed
+QUEUE_LEASE = 600
+QUEUE_RETRIES = 3
+
+def queue_key(game):
+    '''
+    File name used for a game in the claims and results folders (a hash of its path in the queue, like game_cache_path)
+    '''
+    return hashlib.sha1(game.encode()).hexdigest()[:16]
+
+def write_json_atomic(value, path):
+    '''
+    Writes a .json file so nobody ever reads half of it: to a temporary file next to it first, then renamed over it
+    '''
+    temp = path + '.tmp' + str(os.getpid()) + '.' + socket.gethostname()
+    with open(temp, 'w') as f:
+        #default=str turns the Date column into '2022-08-08' like it shows in the .csv
+        json.dump(value, f, indent=1, default=str)
+    os.replace(temp, path)
+
+def create_queue(root_dir, queue_dir, academy=False, offline=False, early=False, lease=QUEUE_LEASE, retries=QUEUE_RETRIES,
+                 engine='pandas'):
+    '''
+    Coordinator side: puts every game under root_dir in a queue that any number of queue_worker processes (on any
+    number of machines) can take games from. Running it again on the same queue adds the games that are new since
+    Input:
+        root_dir: folder with the game folders (or archives) in it, on a drive every worker can reach
+        queue_dir: folder to keep the queue in, on that drive too
+        academy, offline, early: same as scrim_automater_batch, for every game in the queue
+        lease: seconds without a sign of life before a game someone claimed is given to another worker
+        retries: number of times a game gets claimed again after its worker died before it counts as failed
+        engine: what the workers read and parse the JSON files with (see ENGINES)
+    Output:
+        queue: what was saved to queue.json
+    '''
+    root_dir = os.path.abspath(root_dir)
+    games = [os.path.relpath(json_dir, root_dir) for json_dir in find_game_dirs(root_dir, [queue_dir])]
+    path = os.path.join(queue_dir, 'queue.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            old = json.load(f)['games']
+        games = old + [game for game in games if game not in old]
+    for folder in ('claims', 'results'):
+        os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+    queue = {'root': root_dir, 'academy': academy, 'offline': offline, 'early': early, 'engine': engine, 'lease': lease,
+             'retries': retries, 'games': games}
+    write_json_atomic(queue, path)
+    return queue
+
+def load_queue(queue_dir):
+    '''
+    Loads the queue.json of a queue made by create_queue
+    '''
+    with open(os.path.join(queue_dir, 'queue.json')) as f:
+        return json.load(f)
+
+def read_queue_file(path):
+    '''
+    What's in a result file of a queue, None if there isn't one
+    '''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def claim_path(queue_dir, game, attempt):
+    '''
+    Claim file of one attempt at a game (attempts are numbered from 1)
+    '''
+    return os.path.join(queue_dir, 'claims', queue_key(game) + '.' + str(attempt) + '.lock')
+
+def current_claim(queue_dir, game):
+    '''
+    Number and modified time of the newest claim on a game, (0, None) if nobody has claimed it
+    '''
+    attempt, modified = 0, None
+    while True:
+        try:
+            newer = os.stat(claim_path(queue_dir, game, attempt + 1)).st_mtime
+        except FileNotFoundError:
+            return attempt, modified
+        attempt, modified = attempt + 1, newer
+
+def claim_game(queue_dir, game, worker, lease=QUEUE_LEASE):
+    '''
+    Tries to claim one game of a queue for a worker. Each attempt at a game has its own claim file and creating it with
+    O_EXCL is what makes sure only one worker gets it, even across machines. A claim that hasn't been renewed for
+    lease seconds is from a worker that died, then the next attempt's claim file can be made
+    Output:
+        claim: dict with 'worker', 'host', 'attempt' and 'claimed', None if someone else has the game
+    '''
+    attempt, modified = current_claim(queue_dir, game)
+    if attempt and time.time() - modified < lease:
+        return None
+    claim = {'game': game, 'worker': worker, 'host': socket.gethostname(), 'attempt': attempt + 1,
+             'claimed': datetime.now().isoformat(timespec='seconds')}
+    try:
+        fd = os.open(claim_path(queue_dir, game, attempt + 1), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        json.dump(claim, f)
+    return claim
+
+def release_game(queue_dir, game, attempt):
+    '''
+    Removes the claim files of a game up to attempt (a newer claim another worker made in the meantime stays)
+    '''
+    for number in range(1, attempt + 1):
+        try:
+            os.remove(claim_path(queue_dir, game, number))
+        except FileNotFoundError:
+            pass
+
+def run_claimed_game(queue_dir, queue, game, claim, root_dir, cache_dir=None):
+    '''
+    Runs one claimed game with process_game and saves its result, renewing the claim every lease/3 seconds meanwhile
+    so a slow game doesn't get handed to another worker
+    '''
+    path = claim_path(queue_dir, game, claim['attempt'])
+    stop = threading.Event()
+    def renew():
+        while not stop.wait(queue['lease'] / 3):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+    heartbeat = threading.Thread(target=renew, daemon=True)
+    heartbeat.start()
+    try:
+        result = process_game(os.path.join(root_dir, game), queue['academy'], queue['offline'], cache_dir,
+                              early=queue['early'], engine=queue.get('engine', 'pandas'))
+    finally:
+        stop.set()
+        heartbeat.join()
+    row = result['output'].to_dict('records')[0] if result['output'] is not None else None
+    write_json_atomic({'game': game, 'row': row, 'error': result['error'], 'seconds': result['seconds'],
+                       'worker': claim['worker'], 'host': claim['host'], 'attempt': claim['attempt'],
+                       'finished': datetime.now().isoformat(timespec='seconds')},
+                      os.path.join(queue_dir, 'results', queue_key(game) + '.json'))
+    return result
+
+def queue_worker(queue_dir, root_dir=None, worker=None, cache_dir=None, interval=5.0):
+    '''
+    Worker side: keeps claiming and running games from a queue (see create_queue) until every game has a result
+    Games other workers have claimed get checked again every interval seconds, so the games of a worker that died
+    get picked up once their lease runs out
+    Input:
+        queue_dir: folder of the queue
+        root_dir: where the game folders are on this machine, if the drive isn't at the same path as on the coordinator
+        worker: name of this worker in the claims and results (default: <host name>-<process id>)
+        cache_dir: folder to save parsed games in (see load_game)
+        interval: seconds to wait before looking at the games other workers have again
+    Output:
+        done: number of games this worker ran
+    '''
+    queue = load_queue(queue_dir)
+    root_dir = root_dir or queue['root']
+    worker = worker or socket.gethostname() + '-' + str(os.getpid())
+    done = 0
+    checked_roster = False
+    while True:
+        waiting = False
+        for game in queue['games']:
+            result_path = os.path.join(queue_dir, 'results', queue_key(game) + '.json')
+            if os.path.exists(result_path):
+                continue
+            claim = claim_game(queue_dir, game, worker, queue['lease'])
+            if claim is None:
+                waiting = True
+                continue
+            #Someone could have finished it between the check and the claim
+            if os.path.exists(result_path):
+                release_game(queue_dir, game, claim['attempt'])
+                continue
+            if claim['attempt'] > queue['retries'] + 1:
+                write_json_atomic({'game': game, 'row': None, 'seconds': 0.0, 'worker': worker, 'host': claim['host'],
+                                   'attempt': claim['attempt'], 'finished': datetime.now().isoformat(timespec='seconds'),
+                                   'error': 'Gave up after ' + str(claim['attempt'] - 1) + ' workers died running it\n'},
+                                  result_path)
+                release_game(queue_dir, game, claim['attempt'])
+                continue
+            if not checked_roster:
+                #Once per worker, so it doesn't download the contract database for every game
+                get_contract_db(offline=queue['offline'])
+                checked_roster = True
+            result = run_claimed_game(queue_dir, queue, game, claim, root_dir, cache_dir)
+            release_game(queue_dir, game, claim['attempt'])
+            print(('Failed ' if result['error'] else 'Done ') + game + ' (' + worker + ')')
+            done += 1
+        if not waiting:
+            return done
+        time.sleep(interval)
+
+def queue_status(queue_dir):
+    '''
+    How far along a queue is
+    Output:
+        status: dict with the number of 'games', 'done', 'failed', 'running' (claimed and within their lease),
+                'expired' (claimed by a worker that seems to have died) and 'waiting'
+    '''
+    queue = load_queue(queue_dir)
+    status = dict(games=len(queue['games']), done=0, failed=0, running=0, expired=0, waiting=0)
+    for game in queue['games']:
+        result = read_queue_file(os.path.join(queue_dir, 'results', queue_key(game) + '.json'))
+        if result is not None:
+            status['failed' if result['error'] else 'done'] += 1
+            continue
+        attempt, modified = current_claim(queue_dir, game)
+        if not attempt:
+            status['waiting'] += 1
+        else:
+            status['expired' if time.time() - modified >= queue['lease'] else 'running'] += 1
+    return status
+
+def collect_queue(queue_dir, results_db=None):
+    '''
+    Coordinator side: puts the results the workers saved together like scrim_automater_batch does
+    Input:
+        queue_dir: folder of the queue
+        results_db: also save every game that worked in this results database (see open_results_db). Only the
+                    coordinator writes to it, SQLite doesn't like several machines writing one file
+    Output:
+        output: dataframe with one row per game that worked (in queue order, games without a result yet are left out)
+        failures: list of results for the games that didn't (like process_game, with 'worker' and 'attempt')
+    '''
+    queue = load_queue(queue_dir)
+    results = []
+    for game in queue['games']:
+        saved = read_queue_file(os.path.join(queue_dir, 'results', queue_key(game) + '.json'))
+        if saved is None:
+            continue
+        output = pd.DataFrame([saved['row']]) if saved['row'] is not None else None
+        results.append({'game': game_name(game), 'path': os.path.join(queue['root'], game), 'output': output,
+                        'error': saved['error'], 'seconds': saved['seconds'], 'worker': saved['worker'], 'attempt': saved['attempt']})
+    if results_db:
+        conn = open_results_db(results_db)
+        for result in results:
+            if result['output'] is not None:
+                save_result(conn, result['game'], result['output'], queue['academy'], result['path'])
+        conn.close()
+    return combine_results(results), [result for result in results if result['error']]
+
+#Results database kept by batch/game --results-db, one row per game plus its stats, per-minute diffs and objectives
+RESULTS_DB_PATH = os.path.join(CACHE_DIR, 'results.db')
+
+#Games are saved under 'key', the full path of the game folder (or archive), so two weeks of a split can have a game
+#folder with the same name, and the same game saved by game, batch or queue-collect is one row. 'game' is only the
+#name that gets shown (the 'Game' column of a batch)
+RESULTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (key TEXT, academy INTEGER, game TEXT, date TEXT, opponent TEXT, path TEXT, saved TEXT,
+                                  PRIMARY KEY (key, academy));
+CREATE INDEX IF NOT EXISTS games_date ON games (academy, date);
+CREATE INDEX IF NOT EXISTS games_opponent ON games (academy, opponent, date);
+CREATE TABLE IF NOT EXISTS stats (key TEXT, academy INTEGER, stat TEXT, value REAL, PRIMARY KEY (key, academy, stat));
+CREATE INDEX IF NOT EXISTS stats_stat ON stats (academy, stat);
+CREATE TABLE IF NOT EXISTS curves (key TEXT, academy INTEGER, minute REAL, stat TEXT, lane TEXT, value REAL,
+                                   PRIMARY KEY (key, academy, stat, lane, minute));
+CREATE TABLE IF NOT EXISTS timeline (key TEXT, academy INTEGER, number INTEGER, gameTime REAL, objective TEXT, clg INTEGER,
+                                     lane TEXT, turretTier TEXT, PRIMARY KEY (key, academy, number));
+'''
+
+def open_results_db(path=None):
+    '''
+    Opens (and makes if needed) the results database
+    Input:
+        path: .db file (default: RESULTS_DB_PATH)
+    '''
+    path = path or RESULTS_DB_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(RESULTS_SCHEMA)
+    return conn
+
+def sql_value(value):
+    '''
+    Turns NaN/None into NULL (so AVG skips them like pandas does) and numpy numbers into plain ones
+    '''
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+def game_details(game, CLG, team2):
+    '''
+    Per-minute differences (see diff_curves) and every objective taken (see objective_timeline) of one game
+    Input:
+        game: from load_game
+        CLG, team2: from get_team_data (or get_team_data_academy) of that game
+    Output:
+        curves: from diff_curves
+        timeline: from objective_timeline, with 'clg' (1 if CLG took it, 0 if the other team did) instead of 'team'
+    '''
+    timeline = objective_timeline(game)
+    clg = 'teamOne' if CLG['teamID'].iloc[0] == game['teamOne']['teamID'].dropna().iloc[0] else 'teamTwo'
+    timeline['clg'] = (timeline['team'] == clg).astype(int)
+    return diff_curves(CLG, team2), timeline.drop(columns='team')
+
+def save_result(conn, game, row, academy=False, path=None, curves=None, timeline=None):
+    '''
+    Adds (or replaces) one game in the results database
+    Input:
+        conn: from open_results_db
+        game: game name (the 'Game' column of a batch)
+        row: the final_output (or final_output_academy) row as a dict or one row dataframe
+        academy: which sheet the row is from, both can be kept for the same game
+        path: game folder, the game is saved under its full path (under game without one)
+        curves, timeline: from game_details, left as they are in the database when not given
+    '''
+    if isinstance(row, pd.DataFrame):
+        row = row.to_dict('records')[0]
+    key = (os.path.abspath(path) if path else game, int(academy))
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     key + (game, str(row.get('Date')), row.get('Team'), path, datetime.now().isoformat(timespec='seconds')))
+        conn.execute('DELETE FROM stats WHERE key = ? AND academy = ?', key)
+        #Every number on the sheet, Win and the objectives count as 1/0 so their average is a rate
+        conn.executemany('INSERT INTO stats VALUES (?, ?, ?, ?)',
+                         [key + (stat, sql_value(float(value) if isinstance(value, (bool, np.bool_)) else value))
+                          for stat, value in row.items() if stat not in ('Date', 'Team', 'Game')])
+        if curves is not None:
+            conn.execute('DELETE FROM curves WHERE key = ? AND academy = ?', key)
+            long = curves.melt(ignore_index=False).reset_index()
+            conn.executemany('INSERT INTO curves VALUES (?, ?, ?, ?, ?, ?)',
+                             [key + tuple(sql_value(each) for each in values) for values in long.itertuples(index=False)])
+        if timeline is not None:
+            conn.execute('DELETE FROM timeline WHERE key = ? AND academy = ?', key)
+            conn.executemany('INSERT INTO timeline VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             [key + (number, sql_value(event.gameTime), event.objective, int(event.clg), sql_value(event.lane),
+                                     sql_value(event.turretTier)) for number, event in enumerate(timeline.itertuples(index=False))])
+
+def game_filter(academy=False, opponent=None, since=None, until=None):
+    '''
+    WHERE clause (on the games table as g) and its parameters for the query functions below
+    '''
+    where, params = ['g.academy = ?'], [int(academy)]
+    if opponent is not None:
+        where.append('g.opponent = ?')
+        params.append(opponent)
+    if since is not None:
+        where.append('g.date >= ?')
+        params.append(str(since))
+    if until is not None:
+        where.append('g.date <= ?')
+        params.append(str(until))
+    return ' AND '.join(where), params
+
+def stored_games(conn, academy=False, opponent=None, since=None, until=None):
+    '''
+    Gets the saved rows back as one dataframe (like a batch output), without reading any JSON
+    Input:
+        opponent: only games against this team
+        since, until: only games on or after / on or before these dates ('2022-08-01' or a date)
+    '''
+    where, params = game_filter(academy, opponent, since, until)
+    games = pd.read_sql_query('SELECT g.key, g.game AS Game, g.date AS Date, g.opponent AS Team FROM games g WHERE ' + where +
+                              ' ORDER BY g.date, g.key', conn, params=params)
+    stats = pd.read_sql_query('SELECT s.key, s.stat, s.value FROM stats s JOIN games g ON g.key = s.key AND g.academy = s.academy'
+                              ' WHERE ' + where + ' ORDER BY s.rowid', conn, params=params)
+    if stats.empty:
+        return games.drop(columns='key')
+    #Stats in the order they were saved (the order of the sheet)
+    wide = stats.pivot(index='key', columns='stat', values='value')[stats['stat'].unique()]
+    return games.join(wide, on='key').drop(columns='key')
+
+def season_stats(conn, stats=None, academy=False, opponent=None, since=None, until=None, by='opponent'):
+    '''
+    Averages of the saved stats, worked out by SQLite on the indexed tables
+    Input:
+        stats: stat names to average ('GD@15 Team', 'First Blood', ...), None for all of them
+        opponent, since, until: which games count (see stored_games)
+        by: 'opponent' for a row per opponent, 'date' for a row per day, None for one row for everything
+    Output:
+        averages: dataframe with a 'Games' column and a column per stat (NaN stats left out of the average)
+    '''
+    where, params = game_filter(academy, opponent, since, until)
+    if stats:
+        where += ' AND s.stat IN (' + ', '.join('?' * len(stats)) + ')'
+        params += list(stats)
+    group = {'opponent': 'g.opponent', 'date': 'g.date', None: "'All'"}[by]
+    averages = pd.read_sql_query('SELECT ' + group + ' AS grp, s.stat, AVG(s.value) AS value, COUNT(DISTINCT g.key) AS games,'
+                                 ' MIN(s.rowid) AS position FROM stats s JOIN games g ON g.key = s.key AND g.academy = s.academy'
+                                 ' WHERE ' + where + ' GROUP BY grp, s.stat ORDER BY position', conn, params=params)
+    wide = averages.pivot(index='grp', columns='stat', values='value')[averages['stat'].unique()]
+    wide.insert(0, 'Games', averages.groupby('grp')['games'].max())
+    wide.columns.name = None
+    wide.index.name = by.capitalize() if by else None
+    return wide
+
+#Objective columns, in order
+OBJECTIVE_COLUMNS = {'firstBlood': 'First Blood', 'firstDrag': 'First Drag', 'firstHerald': 'First Herald',
+                     'firstTower': 'First Tower', 'firstMid': 'Mid Tower'}
+
+def flatten_payload(payload, prefix=''):
+    '''
+    Flattens one message payload the same way json_to_df does (nested dicts become 'a.b' keys, lists stay as they are)
+    '''
+    flat = {}
+    for key, value in payload.items():
+        name = (prefix + key).replace('payload.', '')
+        if isinstance(value, dict):
+            flat.update(flatten_payload(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+def new_live_state(academy=False, offline=False):
+    '''
+    Starts the state that watch_game keeps while a game is being written
+    Everything in it is updated one message at a time instead of parsing the game again. Snapshot times go in a sorted
+    list, which is an append when files come in seqIdx order but moves every later time when one comes in late
+    '''
+    return {
+        'academy': academy,
+        'offline': offline,
+        #summonerName -> (team tag, name, position, contract database team) for each side, filled at the first snapshot
+        'players': {'teamOne': None, 'teamTwo': None},
+        'teamID': {},
+        #snapshot times (int64 nanoseconds) kept sorted for the nearest time search
+        'timestamps': [],
+        #second -> first snapshot in that second: {'ns', 'teamOne': {position: player}, 'teamTwo': {...}}
+        'seconds': {},
+        #objective -> (seqIdx, 'teamOne'/'teamTwo' that got it), only the earliest seqIdx is kept
+        'firsts': {},
+        'winner': None,
+    }
+
+def set_first(state, objective, seqIdx, side):
+    '''
+    Records which side got an objective, unless an earlier message already said so
+    '''
+    if objective not in state['firsts'] or seqIdx < state['firsts'][objective][0]:
+        state['firsts'][objective] = (seqIdx, side)
+
+def update_live_state(state, message):
+    '''
+    Adds one JSON message (one line of a game file) to the live state
+    Only messages with a teamOne player list count, same as the 'data' dataframe the objectives function gets
+    '''
+    seqIdx = message['seqIdx']
+    row = flatten_payload(message.get('payload') or {})
+    if not isinstance(row.get('teamOne.players'), list):
+        return
+
+    for side in ['teamOne', 'teamTwo']:
+        players = row.get(side + '.players') or []
+        if players and state['players'][side] is None:
+            #Same resolver as get_team_data (and get_team_data_academy), the first player goes first like in the player frame
+            names = pd.Series([player.get('summonerName') for player in players], dtype=object)
+            resolved = resolve_participants(names, get_contract_db(offline=state['offline']), state['academy'])
+            state['players'][side] = {full: tuple(None if pd.isna(value) else value for value in each)
+                                      for full, each in zip(names, resolved[['teamName', 'summonerName', 'Position', 'Team']].itertuples(index=False))}
+            state['teamID'][side] = players[0].get('teamID')
+
+    #first snapshot in each second, like .head(1) in get_cs/get_g/get_xp
+    stamp = pd.Timestamp(row['sourceUpdatedAt'])
+    #Same number to_epoch_ns gives (nanoseconds in UTC, or as if UTC for times without a timezone)
+    ns = stamp.value
+    bisect.insort(state['timestamps'], ns)
+    second = ns // 10**9
+    if second not in state['seconds'] or ns < state['seconds'][second]['ns']:
+        snapshot = {'ns': ns, 'stamp': stamp}
+        for side in ['teamOne', 'teamTwo']:
+            resolved = state['players'][side] or {}
+            snapshot[side] = {}
+            for player in row.get(side + '.players') or []:
+                position = resolved.get(player.get('summonerName'), (None, None, None, None))[2]
+                if position is not None and position not in snapshot[side]:
+                    stats = player.get('stats') or {}
+                    snapshot[side][position] = {'minionsKilled': stats.get('minionsKilled'), 'totalGold': player.get('totalGold'),
+                                                'experience': player.get('experience')}
+        state['seconds'][second] = snapshot
+
+    if row.get('winningTeam') and not pd.isna(row['winningTeam']):
+        state['winner'] = row['winningTeam']
+    if isinstance(row.get('victimTeamUrn'), str):
+        set_first(state, 'firstBlood', seqIdx, 'teamTwo' if row['victimTeamUrn'] == TEAM_ONE_URN else 'teamOne')
+    if row.get('teamOne.dragonKills') == 1 or row.get('teamTwo.dragonKills') == 1:
+        set_first(state, 'firstDrag', seqIdx, 'teamTwo' if row.get('teamOne.dragonKills') == 0 else 'teamOne')
+    if row.get('monsterType') == 'riftHerald':
+        set_first(state, 'firstHerald', seqIdx, 'teamOne' if row.get('killerTeamUrn') == TEAM_ONE_URN else 'teamTwo')
+    if row.get('buildingType') == 'turret':
+        side = 'teamTwo' if row.get('buildingTeamUrn') == TEAM_ONE_URN else 'teamOne'
+        set_first(state, 'firstTower', seqIdx, side)
+        if row.get('lane') == 'mid' and row.get('turretTier') == 'outer':
+            set_first(state, 'firstMid', seqIdx, side)
+
+def live_snapshot(state, minutes, finished=False):
+    '''
+    Picks the snapshot check_time would pick for a number of minutes into the game, None if the game isn't that far yet
+    (unless it's finished, then a game that ended earlier gets its last snapshot like check_time gives it)
+    '''
+    stamps = state['timestamps']
+    target = stamps[0] + minutes * 60 * 10**9
+    if stamps[-1] < target and not finished:
+        return None
+    if target // 10**9 in state['seconds']:
+        return state['seconds'][target // 10**9]
+    after = min(bisect.bisect_left(stamps, target), len(stamps) - 1)
+    before = max(after - 1, 0)
+    nearest = stamps[before] if abs(stamps[before] - target) <= abs(stamps[after] - target) else stamps[after]
+    return state['seconds'][nearest // 10**9]
+
+def live_row(state, finished=False):
+    '''
+    Output row for what has happened so far, same columns as final_output (or final_output_academy)
+    Stats at a minute the game hasn't reached yet are NaN, unless finished says every message is in (see live_snapshot)
+    '''
+    if not state['timestamps'] or state['players']['teamOne'] is None or state['players']['teamTwo'] is None:
+        return None
+    marker = CLG_ACADEMY_PLAYER if state['academy'] else CLG_PLAYER
+    clg, other = ('teamOne', 'teamTwo') if any(marker in name for name in state['players']['teamOne']) else ('teamTwo', 'teamOne')
+
+    first = state['seconds'][state['timestamps'][0] // 10**9]['stamp']
+    row = {'Date': first.date()}
+    if not state['academy']:
+        row['Win'] = state['winner'] is not None and state['winner'] == state['teamID'].get(clg)
+    #Academy shows the team tag, the main sheet the team from the contract database
+    opponents = [each for each in state['players'][other].values() if each[2] is not None]
+    row['Team'] = (opponents[0][0] if state['academy'] else opponents[0][3]) if opponents else None
+    for objective, column in OBJECTIVE_COLUMNS.items():
+        row[column] = int(state['firsts'][objective][1] == clg) if objective in state['firsts'] else 0
+
+    for name, stat, minutes, per_lane in (OUTPUT_STATS_ACADEMY if state['academy'] else OUTPUT_STATS):
+        snapshot = live_snapshot(state, minutes, finished)
+        diffs = {}
+        for position in POSITIONS:
+            mine = snapshot[clg].get(position, {}).get(stat) if snapshot else None
+            theirs = snapshot[other].get(position, {}).get(stat) if snapshot else None
+            diffs[position] = np.nan if mine is None or theirs is None else mine - theirs
+        if per_lane:
+            for position, label in LANE_LABELS.items():
+                row[name + '@' + str(minutes) + ' ' + label] = diffs[position]
+        else:
+            row[name + '@' + str(minutes) + ' Team'] = sum(diffs.values())
+    return row
+
+def read_new_messages(path):
+    '''
+    Reads the messages of a file that just showed up, None if it looks half written so it gets tried again later
+    '''
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (ValueError, OSError):
+        return None
+
+def new_json_files(folders, known):
+    '''
+    Finds the JSON files that showed up in a game folder (or any folder under it, like list_json_files) since the last call
+    Only folders whose modified time changed get listed again (a new file or subfolder changes it), so a check while
+    nothing is being written is one stat per folder. A folder that changed is still listed in full and compared with
+    the names found before, so that grows with the files already in it (about 4ms for a 7000 file folder)
+    Input:
+        folders: folder -> its modified time when it was last listed (None lists it again), kept between calls.
+                 Starts as {json_dir: None}, subfolders get added as they show up
+        known: folder -> set of names already found in it, kept between calls (starts empty)
+    Output:
+        paths: the new JSON files, sorted
+    '''
+    paths = []
+    todo = list(folders)
+    while todo:
+        folder = todo.pop()
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+            if folders[folder] == mtime:
+                continue
+            listed = time.time_ns()
+            names = set(os.listdir(folder))
+        except OSError:
+            continue
+        new = names - known.setdefault(folder, set())
+        known[folder] |= new
+        for name in new:
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                folders[path] = None
+                todo.append(path)
+            elif is_json_name(name):
+                paths.append(path)
+        #A file added in the same clock tick as the listing doesn't change the time again, so a folder that changed
+        #within the last second gets listed again next time
+        folders[folder] = mtime if listed - mtime > 10**9 else None
+    return sorted(paths)
+
+def watch_game(json_dir, academy=False, offline=False, interval=0.2, on_row=None, timeout=None):
+    '''
+    Follows a game folder while Bayes is still writing it and gives an updated output row every time something in it changes
+    (first blood/dragon/herald/tower/mid tower, the winner, or a new checkpoint minute being reached)
+    Input:
+        json_dir: game folder that's being written (files in its subfolders count too, like in json_to_df)
+        academy: use the academy roster and stats
+        offline: only use the saved contract database (see get_contract_db)
+        interval: seconds between checks for new files
+        on_row: function called with each updated row (a dict), prints it by default
+        timeout: stop after this many seconds without a new file (None keeps going until the game ends)
+    Output:
+        row: the last row
+    '''
+    state = new_live_state(academy, offline)
+    folders, known = {json_dir: None}, {}
+    #Files that looked half written, tried again at the next check
+    waiting = []
+    last = None
+    idle = time.monotonic()
+    on_row = on_row or (lambda row: print(row))
+    while True:
+        new_files = False
+        paths, waiting = waiting + new_json_files(folders, known), []
+        for path in paths:
+            messages = read_new_messages(path)
+            if messages is None:
+                waiting.append(path)
+                continue
+            new_files = True
+            for message in messages:
+                update_live_state(state, message)
+        if new_files:
+            idle = time.monotonic()
+            row = live_row(state)
+            #repr so NaN stats count as unchanged (NaN != NaN)
+            if row is not None and repr(row) != repr(last):
+                on_row(row)
+                last = row
+        #Game is over once the winner is in and no more files are showing up
+        if state['winner'] is not None and not new_files:
+            return last
+        if timeout is not None and time.monotonic() - idle > timeout:
+            return last
+        time.sleep(interval)
+
+def prune_live_state(state, minutes):
+    '''
+    Drops every snapshot of the live state that live_snapshot can't pick anymore for these minutes: only the first
+    snapshot, the last one and the closest ones on each side of every checkpoint are kept (plus the checkpoint seconds)
+    Needs the messages to come in seqIdx order so the first snapshot (what the minutes count from) doesn't change
+    '''
+    stamps = state['timestamps']
+    if not stamps:
+        return
+    targets = [stamps[0] + each * 60 * 10**9 for each in minutes]
+    keep = {stamps[0], stamps[-1]}
+    for target in targets:
+        after = bisect.bisect_left(stamps, target)
+        keep.update(stamps[max(after - 1, 0):after + 1])
+    state['timestamps'] = sorted(keep)
+    seconds = {stamp // 10**9 for stamp in keep} | {target // 10**9 for target in targets}
+    state['seconds'] = {second: snapshot for second, snapshot in state['seconds'].items() if second in seconds}
+
+#seqIdx as the first key of a message, which is how Bayes writes them
+LEADING_SEQIDX = re.compile(rb'\s*\{\s*"seqIdx"\s*:\s*(-?\d+)\s*[,}]')
+
+def first_seqidx(f):
+    '''
+    seqIdx of the first message in an open (binary) JSON file, None if it's empty
+    Only the start of the file is read when seqIdx comes first, otherwise the first message gets parsed
+    '''
+    head = f.read(64)
+    match = LEADING_SEQIDX.match(head)
+    if match:
+        return int(match.group(1))
+    for line in (head + f.read()).splitlines():
+        if line.strip():
+            return json.loads(line)['seqIdx']
+    return None
+
+def message_order(json_dir):
+    '''
+    Sorts the files of a game (folder or archive) by the seqIdx of their first message without keeping any of the messages
+    A packed game (see pack_game) is already in order, so nothing gets read besides its index
+    Output:
+        ordered: file names in seqIdx order (see read_game_files)
+        stored: file names in the order read_game_files gives them when it isn't given any
+    '''
+    if is_packed(json_dir):
+        rows = list(range(len(load_pack_index(json_dir))))
+        return rows, rows
+    order = []
+    def add(name, f):
+        seqIdx = first_seqidx(f)
+        if seqIdx is not None:
+            order.append((seqIdx, len(order), name))
+    if not is_archive(json_dir):
+        for json_path in list_json_files(json_dir):
+            with open(json_path, 'rb') as f:
+                add(json_path, f)
+    elif zipfile.is_zipfile(json_dir):
+        with zipfile.ZipFile(json_dir) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith('.json'):
+                    with archive.open(info) as f:
+                        add(info.filename, f)
+    else:
+        with tarfile.open(json_dir, 'r|*') as archive:
+            for member in tar_members(archive):
+                if member.isfile() and member.name.endswith('.json'):
+                    add(member.name, archive.extractfile(member))
+    stored = [name for seqIdx, number, name in order]
+    order.sort()
+    return [name for seqIdx, number, name in order], stored
+
+def stream_game(json_dir, academy=False, offline=False, chunk_size=500):
+    '''
+    Same output as scrim_automater (or scrim_automater_academy), but for games or laptops where holding the whole game
+    in dataframes doesn't fit: the files are read chunk_size at a time in seqIdx order and each chunk is boiled down
+    to the live state (see update_live_state), keeping only the snapshots the checkpoints can still use
+    Memory then depends on chunk_size instead of how long the game is (besides the file names, and a compressed tar
+    that's out of order needs temporary disk space, see read_game_files)
+    Input:
+        json_dir: a folder of individual JSON files for one game, or a zip/tar archive of one
+        academy: use the academy roster and stats
+        offline: only use the saved contract database (see get_contract_db)
+        chunk_size: number of files read at a time
+    Output:
+        final: one row dataframe like final_output (or final_output_academy)
+    '''
+    state = new_live_state(academy, offline)
+    minutes = sorted({minute for name, stat, minute, per_lane in (OUTPUT_STATS_ACADEMY if academy else OUTPUT_STATS)})
+    with profile_stage('list files') as stage:
+        ordered, stored = message_order(json_dir)
+        stage['files'] = len(ordered)
+    #An archive that's already stored in seqIdx order gets read front to back in one pass
+    files = read_game_files(json_dir, None if ordered == stored else ordered)
+    while True:
+        with profile_stage('chunk') as stage:
+            chunk = list(itertools.islice(files, chunk_size))
+            if not chunk:
+                break
+            stage['files'] = len(chunk)
+            messages = [json.loads(line) for name, lines in chunk for line in lines if line.strip()]
+            messages.sort(key=lambda message: message['seqIdx'])
+            for message in messages:
+                update_live_state(state, message)
+            prune_live_state(state, minutes)
+            stage.update(rows_in=len(messages), rows_out=len(state['timestamps']))
+    row = live_row(state, finished=True)
+    if row is None:
+        raise ValueError('No snapshots with both teams in ' + json_dir)
+    return pd.DataFrame([row])
+
+def main(argv=None):
+    '''
+    Command line entry point, run the file with --help to see the options
+    '''
+    parser = argparse.ArgumentParser(description='Convert Bayes Esports game data into scrim stats')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    game = commands.add_parser('game', help='convert one game folder into a .csv file')
+    game.add_argument('json_dir', help='folder of JSON files for one game (or a .zip/.tar.gz of one)')
+    game.add_argument('--academy', action='store_true', help='use the academy roster and stats')
+    game.add_argument('--workers', type=int, default=1, help='number of processes used to read the JSON files')
+    game.add_argument('--offline', action='store_true', help='only use the saved contract database')
+    game.add_argument('-o', '--output', help='output .csv file (default: <game folder name>.csv)')
+    game.add_argument('--cache-dir', nargs='?', const=GAME_CACHE_DIR, help='save parsed games in this folder so reruns skip the JSON files (default: %(const)s, see cache-clear)')
+    game.add_argument('--profile', metavar='REPORT', help='save the time and memory of every stage to this .json file')
+    game.add_argument('--cprofile', metavar='STATS', help='with --profile, also save cProfile stats of the slowest stage here')
+    game.add_argument('--results-db', nargs='?', const=RESULTS_DB_PATH, help='also save the game in this results database (default: %(const)s)')
+    game.add_argument('--stream', action='store_true', help='read the files a chunk at a time to use less memory (ignores --workers and the cache, a .tar.gz out of order uses temporary disk space)')
+    game.add_argument('--chunk-size', type=int, default=500, help='files per chunk with --stream (default: %(default)s)')
+    game.add_argument('--early', action='store_true', help='only read the game up to the last stat checkpoint, plus the end for the winner')
+    game.add_argument('--engine', choices=sorted(ENGINES), default='pandas', help='what reads and parses the JSON files (arrow needs pyarrow)')
+
+    batch = commands.add_parser('batch', help='convert every game folder under a folder into one .csv file (one row per game)')
+    batch.add_argument('root_dir', help='folder with the game folders (or .zip/.tar.gz game archives) in it')
+    batch.add_argument('--academy', action='store_true', help='use the academy roster and stats')
+    batch.add_argument('--workers', type=int, default=None, help='number of games run at once (default: number of CPU cores)')
+    batch.add_argument('--offline', action='store_true', help='only use the saved contract database')
+    batch.add_argument('-o', '--output', help='output .csv file (default: <root folder name>.csv)')
+    batch.add_argument('--manifest', help='manifest used to skip games that haven\'t changed (default: <output>.manifest.json)')
+    batch.add_argument('--rebuild', action='store_true', help='run every game again even if it hasn\'t changed')
+    batch.add_argument('--hash-contents', action='store_true', help='hash the files of each game instead of using their sizes and times')
+    batch.add_argument('--cache-dir', nargs='?', const=GAME_CACHE_DIR, help='save parsed games in this folder so reruns skip the JSON files (default: %(const)s, see cache-clear)')
+    batch.add_argument('--profile-dir', help='save a profile report (see game --profile) of every game that gets run here')
+    batch.add_argument('--results-db', nargs='?', const=RESULTS_DB_PATH, help='also save every game in this results database (default: %(const)s)')
+    batch.add_argument('--details', action='store_true', help='with --results-db, also save per-minute diffs and objective timelines')
+    batch.add_argument('--early', action='store_true', help='only read each game up to the last stat checkpoint, plus the end for the winner')
+    batch.add_argument('--engine', choices=sorted(ENGINES), default='pandas', help='what reads and parses the JSON files (arrow needs pyarrow)')
+    batch.add_argument('--metrics', help='save a summary of the run here in the Prometheus text format (like batch.prom in the textfile collector folder)')
+    batch.add_argument('--events', help='add one JSON line per game to this file as each game is done')
+
+    pack = commands.add_parser('pack', help='pack a game folder into one .ndjson file (in seqIdx order, with an index) that reads faster')
+    pack.add_argument('json_dir', nargs='+', help='folders of JSON files for one game each (or .zip/.tar.gz of one)')
+    pack.add_argument('-o', '--output', help='.ndjson file to write, only with one game (default: <game folder name>.ndjson next to the folder)')
+
+    queue_create = commands.add_parser('queue-create', help='put every game under a folder in a work queue that queue-work processes on any machine can share')
+    queue_create.add_argument('root_dir', help='folder with the game folders (or .zip/.tar.gz game archives) in it, on a shared drive')
+    queue_create.add_argument('queue_dir', help='folder to keep the queue in, on the shared drive too')
+    queue_create.add_argument('--academy', action='store_true', help='use the academy roster and stats')
+    queue_create.add_argument('--offline', action='store_true', help='workers only use their saved contract database')
+    queue_create.add_argument('--early', action='store_true', help='only read each game up to the last stat checkpoint, plus the end for the winner')
+    queue_create.add_argument('--lease', type=float, default=QUEUE_LEASE, help='seconds before the game of a worker that stopped responding goes to another one (default: %(default)s)')
+    queue_create.add_argument('--engine', choices=sorted(ENGINES), default='pandas', help='what the workers read and parse the JSON files with (arrow needs pyarrow)')
+    queue_create.add_argument('--retries', type=int, default=QUEUE_RETRIES, help='times a game is tried again after its worker died (default: %(default)s)')
+
+    queue_work = commands.add_parser('queue-work', help='run games from a queue until every game is done')
+    queue_work.add_argument('queue_dir', help='folder of the queue')
+    queue_work.add_argument('--root', help='where the game folders are on this machine (default: the folder given to queue-create)')
+    queue_work.add_argument('--workers', type=int, default=1, help='number of worker processes on this machine')
+    queue_work.add_argument('--cache-dir', nargs='?', const=GAME_CACHE_DIR, help='save parsed games in this folder so reruns skip the JSON files (default: %(const)s, see cache-clear)')
+    queue_work.add_argument('--interval', type=float, default=5.0, help='seconds between checks on games other workers have')
+
+    queue_collect = commands.add_parser('queue-collect', help='put the results of a queue into one .csv file')
+    queue_collect.add_argument('queue_dir', help='folder of the queue')
+    queue_collect.add_argument('-o', '--output', help='output .csv file (default: <queue folder name>.csv)')
+    queue_collect.add_argument('--results-db', nargs='?', const=RESULTS_DB_PATH, help='also save every game in this results database (default: %(const)s)')
+
+    watch = commands.add_parser('watch', help='follow a game folder while it is being written and update the output as things happen')
+    watch.add_argument('json_dir', help='folder of JSON files for the game')
+    watch.add_argument('--academy', action='store_true', help='use the academy roster and stats')
+    watch.add_argument('--offline', action='store_true', help='only use the saved contract database')
+    watch.add_argument('--interval', type=float, default=0.2, help='seconds between checks for new files')
+    watch.add_argument('-o', '--output', help='.csv file rewritten with every update (default: <game folder name>.csv)')
+
+    curves = commands.add_parser('curves', help='CS/gold/XP differences for every lane at every minute of one game')
+    curves.add_argument('json_dir', help='folder of JSON files for one game (or a .zip/.tar.gz of one)')
+    curves.add_argument('--academy', action='store_true', help='use the academy roster')
+    curves.add_argument('--minutes', help='comma separated minutes (default: every minute)')
+    curves.add_argument('--offline', action='store_true', help='only use the saved contract database')
+    curves.add_argument('-o', '--output', help='output .csv file (default: <game folder name>_curves.csv)')
+    curves.add_argument('--cache-dir', nargs='?', const=GAME_CACHE_DIR, help='save parsed games in this folder so reruns skip the JSON files (default: %(const)s, see cache-clear)')
+    curves.add_argument('--engine', choices=sorted(ENGINES), default='pandas', help='what reads and parses the JSON files (arrow needs pyarrow)')
+
+    season = commands.add_parser('season', help='average stats of the games saved in the results database')
+    season.add_argument('--results-db', default=RESULTS_DB_PATH, help='results database (default: %(default)s)')
+    season.add_argument('--academy', action='store_true', help='academy games')
+    season.add_argument('--opponent', help='only games against this team')
+    season.add_argument('--since', help='only games on or after this date (YYYY-MM-DD)')
+    season.add_argument('--until', help='only games on or before this date (YYYY-MM-DD)')
+    season.add_argument('--stats', help='comma separated stats to average (default: all of them)')
+    season.add_argument('--by', choices=['opponent', 'date', 'all'], default='opponent', help='one row per opponent, per day or for everything')
+    season.add_argument('--games', action='store_true', help='list the saved games instead of averaging them')
+    season.add_argument('-o', '--output', help='also save the table to this .csv file')
+
+    commands.add_parser('refresh-roster', help='download the contract database again and save it')
+
+    cache_clear = commands.add_parser('cache-clear', help='delete the parsed games saved with --cache-dir')
+    cache_clear.add_argument('--cache-dir', default=GAME_CACHE_DIR, help='folder the games were saved in (default: %(default)s)')
+    cache_clear.add_argument('--older-than', type=float, metavar='DAYS', help='only the games saved more than this many days ago')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'watch':
+        output_path = args.output or game_name(args.json_dir) + '.csv'
+        def save_row(row):
+            print(', '.join(key + ': ' + str(value) for key, value in row.items()))
+            pd.DataFrame([row]).to_csv(output_path)
+        watch_game(args.json_dir, args.academy, args.offline, args.interval, save_row)
+        print('Game over, saved ' + output_path)
+    elif args.command == 'curves':
+        game = load_game(args.json_dir, 1, args.cache_dir, engine=args.engine)
+        CLG, team2 = (get_team_data_academy if args.academy else get_team_data)(game, args.offline)
+        minutes = [float(each) for each in args.minutes.split(',')] if args.minutes else None
+        output_path = args.output or game_name(args.json_dir) + '_curves.csv'
+        diff_curves(CLG, team2, minutes).to_csv(output_path)
+        print('Saved ' + output_path)
+    elif args.command == 'season':
+        conn = open_results_db(args.results_db)
+        if args.games:
+            table = stored_games(conn, args.academy, args.opponent, args.since, args.until)
+        else:
+            stats = args.stats.split(',') if args.stats else None
+            table = season_stats(conn, stats, args.academy, args.opponent, args.since, args.until, None if args.by == 'all' else args.by)
+        conn.close()
+        print(table.to_string())
+        if args.output:
+            table.to_csv(args.output)
+            print('Saved ' + args.output)
+    elif args.command == 'pack':
+        if args.output and len(args.json_dir) > 1:
+            parser.error('-o only works with one game')
+        for json_dir in args.json_dir:
+            summary = pack_game(json_dir, args.output)
+            print('Packed ' + str(summary['files']) + ' files (' + str(summary['messages']) + ' messages, ' +
+                  str(summary['snapshots']) + ' snapshots, ' + str(summary['events']) + ' events) into ' + summary['path'])
+    elif args.command == 'queue-create':
+        queue = create_queue(args.root_dir, args.queue_dir, args.academy, args.offline, args.early, args.lease, args.retries, args.engine)
+        print('Queued ' + str(len(queue['games'])) + ' games in ' + args.queue_dir)
+    elif args.command == 'queue-work':
+        cache_dir = args.cache_dir
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = [pool.submit(queue_worker, args.queue_dir, args.root, None, cache_dir, args.interval) for number in range(args.workers)]
+                done = sum(future.result() for future in futures)
+        else:
+            done = queue_worker(args.queue_dir, args.root, None, cache_dir, args.interval)
+        print('Ran ' + str(done) + ' games, queue: ' + str(queue_status(args.queue_dir)))
+    elif args.command == 'queue-collect':
+        output_path = args.output or os.path.basename(os.path.abspath(args.queue_dir)) + '.csv'
+        output, failures = collect_queue(args.queue_dir, args.results_db)
+        output.to_csv(output_path)
+        print('Saved ' + str(len(output)) + ' games to ' + output_path + ', queue: ' + str(queue_status(args.queue_dir)))
+        for failure in failures:
+            print('\nFailed ' + failure['path'] + ' (' + failure['worker'] + ')\n' + failure['error'])
+    elif args.command == 'cache-clear':
+        games, size = clear_game_cache(args.cache_dir, timedelta(days=args.older_than) if args.older_than is not None else None)
+        print('Deleted ' + str(games) + ' saved games (' + '%.1f' % (size / 2**20) + ' MB) from ' + args.cache_dir)
+    elif args.command == 'refresh-roster':
+        nagcd = refresh_contract_db()
+        print('Saved ' + str(len(nagcd)) + ' contracts to ' + CONTRACT_DB_PATH)
+    elif args.command == 'game':
+        cache_dir = args.cache_dir
+        if args.stream:
+            output = stream_game(args.json_dir, args.academy, args.offline, args.chunk_size)
+        elif args.profile:
+            output, report = profile_game(args.json_dir, args.academy, args.workers, args.offline, cache_dir, args.cprofile, args.early, args.engine)
+            save_profile(report, args.profile)
+            for stage in report['stages']:
+                print('  ' * stage['depth'] + stage['stage'] + ': ' + '%.3f' % stage['seconds'] + 's')
+            print('Saved profile to ' + args.profile + ' (slowest stage: ' + report['slowest'] + ')')
+        else:
+            automater = scrim_automater_academy if args.academy else scrim_automater
+            output = automater(args.json_dir, args.workers, args.offline, cache_dir, args.early, args.engine)
+        #Save output to a .csv file to put into spreadsheet
+        output_path = args.output or game_name(args.json_dir) + '.csv'
+        output.to_csv(output_path)
+        print('Saved ' + output_path)
+        if args.results_db:
+            conn = open_results_db(args.results_db)
+            save_result(conn, game_name(args.json_dir), output, args.academy, args.json_dir)
+            conn.close()
+            print('Saved to ' + args.results_db)
+    elif args.command == 'batch':
+        #abspath so 'batch .' is named after the folder instead of saving '..csv'
+        output_path = args.output or os.path.basename(os.path.abspath(args.root_dir)) + '.csv'
+        manifest_path = args.manifest or os.path.splitext(output_path)[0] + '.manifest.json'
+        output, failures = scrim_automater_batch(args.root_dir, args.academy, args.workers, args.offline,
+                                                 manifest_path, args.rebuild, args.hash_contents,
+                                                 args.cache_dir, args.profile_dir,
+                                                 args.results_db, args.details, args.early, args.engine,
+                                                 args.metrics, args.events)
+        output.to_csv(output_path)
+        print('Saved ' + str(len(output)) + ' games to ' + output_path)
+        for failure in failures:
+            print('\nFailed ' + failure['path'] + '\n' + failure['error'])
+        if failures:
+            print(str(len(failures)) + ' games failed: ' + ', '.join(failure['game'] for failure in failures))
 
-#Save output to a .csv file to put into spreadsheet
-output.to_csv('8-8_CLGavsDig_1.csv')
\ No newline at end of file
+#The guard keeps the worker processes of json_to_df and the batch from re-running this when they import the file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import BayesEsportsScrimAutomater as automater
+
+'''
+Benchmarks for BayesEsportsScrimAutomater without needing a real (private) scrim folder.
+'generate' writes a made up game folder that looks like a Bayes export, 'run' times each stage of the pipeline on a game
+folder (real or made up) and 'quick' does both in a temporary folder.
+'''
+
+#Lane of each player slot
+POSITIONS = ['Top', 'Jungle', 'Mid', 'Bot', 'Support']
+
+def make_team(tag, names, teamID, first_participant):
+    '''
+    Starting state of the 5 players of a made up team
+    '''
+    players = []
+    for slot, name in enumerate(names):
+        players.append({
+            'participantID': first_participant + slot, 'teamID': teamID, 'summonerName': tag + ' ' + name,
+            'summonerID': 'summoner-' + name, 'accountID': 'account-' + name, 'championID': 10 + first_participant + slot,
+            'pickTurn': first_participant + slot, 'pickMode': 'draft', 'level': 1, 'experience': 0, 'currentGold': 500,
+            'totalGold': 500, 'goldPerSecond': 0.0, 'stats': {'minionsKilled': 0, 'championsKilled': 0, 'deaths': 0}
+        })
+    return players
+
+def schedule_events(rnd, minutes):
+    '''
+    Objective events for a made up game (the event types the objectives function looks for)
+    Output:
+        events: list of (game second, event dict) sorted by time
+    '''
+    events = []
+    def add(second, event):
+        events.append((second, event))
+
+    #kills, the first one is first blood
+    second = rnd.uniform(120, 330)
+    while second < minutes * 60:
+        add(second, {'kind': 'kill', 'victimTeamUrn': rnd.choice(['live:lol:riot:team:one', 'live:lol:riot:team:two'])})
+        second += rnd.uniform(30, 150)
+    #dragons every 5 minutes or so
+    for second in range(300, minutes * 60, 330):
+        add(second + rnd.uniform(0, 60), {'kind': 'dragon', 'team': rnd.choice(['teamOne', 'teamTwo'])})
+    #heralds and baron
+    for second in [480, 840]:
+        if second < minutes * 60:
+            add(second + rnd.uniform(0, 60), {'kind': 'monster', 'monsterType': 'riftHerald', 'team': rnd.choice(['teamOne', 'teamTwo'])})
+    if minutes > 25:
+        add(rnd.uniform(1500, minutes * 60), {'kind': 'monster', 'monsterType': 'baron', 'team': rnd.choice(['teamOne', 'teamTwo'])})
+    #turrets, outer ones first
+    for tier, start, end in [('outer', 600, 1000), ('inner', 1000, 1500), ('base', 1500, 2100)]:
+        for lane in ['top', 'mid', 'bot']:
+            for side in ['live:lol:riot:team:one', 'live:lol:riot:team:two']:
+                second = rnd.uniform(start, end)
+                if second < minutes * 60 and rnd.random() < 0.8:
+                    add(second, {'kind': 'turret', 'buildingTeamUrn': side, 'lane': lane, 'turretTier': tier})
+    return sorted(events, key=lambda each: each[0])
+
+def generate_game(out_dir, files=7000, minutes=30, snapshot_rate=1.0, seed=0, academy=False):
+    '''
+    Writes a made up game folder that looks like a Bayes export: one message per line, files named in a different
+    order than their seqIdx, snapshots with both teams' players, plus kills, dragons, heralds, baron, turrets and the winner.
+    The objective events carry the team state like snapshots do, since the objectives function only looks at messages
+    with player lists. A matching contract database is saved to nagcd.csv in the same folder
+    Input:
+        out_dir: folder to write the game to
+        files: number of JSON files (messages are spread over them, filler messages are added if there aren't enough)
+        minutes: game length
+        snapshot_rate: snapshots per second of game time
+        seed: random seed, the same settings and seed always give the same game
+        academy: use CLG_ACADEMY_PLAYER instead of CLG_PLAYER so the academy functions find our team
+    Output:
+        summary: dict with 'files', 'messages' and 'bytes' written
+    '''
+    rnd = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    start = datetime(2022, 8, 8, 19, 0, 0) + timedelta(milliseconds=rnd.randint(0, 999))
+    ours = automater.CLG_ACADEMY_PLAYER if academy else automater.CLG_PLAYER
+    names = {'teamOne': [ours, 'Jungler', 'Mider', 'Carry', 'Roamer'], 'teamTwo': ['Topper', 'Ganker', 'Wizard', 'Shooter', 'Warden']}
+    tags = {'teamOne': 'CLGA' if academy else 'CLG', 'teamTwo': 'OPP'}
+    teams = {'teamOne': make_team(tags['teamOne'], names['teamOne'], 100, 1),
+             'teamTwo': make_team(tags['teamTwo'], names['teamTwo'], 200, 6)}
+    dragons = {'teamOne': 0, 'teamTwo': 0}
+    events = schedule_events(rnd, minutes)
+    next_event = 0
+
+    def message(kind, action, when, gameTime, extra=None, players=True):
+        payload = {'gameTime': gameTime}
+        if players:
+            for side in ['teamOne', 'teamTwo']:
+                payload[side] = {'players': json.loads(json.dumps(teams[side])), 'dragonKills': dragons[side]}
+        payload.update(extra or {})
+        return {'payload': {'type': kind, 'subject': 'GAME', 'action': action,
+                            'sourceUpdatedAt': when.isoformat(timespec='milliseconds') + 'Z', 'payload': payload}}
+
+    messages = []
+    snapshots = int(minutes * 60 * snapshot_rate)
+    for number in range(snapshots):
+        second = number / snapshot_rate
+        for side in ['teamOne', 'teamTwo']:
+            for player in teams[side]:
+                gained = rnd.randint(1, 4) / snapshot_rate
+                player['totalGold'] += int(gained)
+                player['currentGold'] = player['totalGold'] // 3
+                player['goldPerSecond'] = round(gained, 2)
+                player['experience'] += int(rnd.randint(0, 6) / snapshot_rate)
+                player['level'] = min(18, 1 + player['experience'] // 600)
+                if rnd.random() < 0.25 / snapshot_rate:
+                    player['stats']['minionsKilled'] += 1
+        when = start + timedelta(seconds=second, milliseconds=rnd.randint(0, 150))
+        messages.append(message('SNAPSHOT', 'UPDATE', when, int(second * 1000)))
+
+        #Events that happened since the last snapshot
+        while next_event < len(events) and events[next_event][0] <= second:
+            event = events[next_event][1]
+            next_event += 1
+            if event['kind'] == 'kill':
+                extra, action = {'victimTeamUrn': event['victimTeamUrn']}, 'KILL'
+            elif event['kind'] == 'dragon':
+                dragons[event['team']] += 1
+                urn = 'live:lol:riot:team:one' if event['team'] == 'teamOne' else 'live:lol:riot:team:two'
+                extra, action = {'monsterType': 'dragon', 'killerTeamUrn': urn}, 'KILLED_ANCIENT'
+            elif event['kind'] == 'monster':
+                urn = 'live:lol:riot:team:one' if event['team'] == 'teamOne' else 'live:lol:riot:team:two'
+                extra, action = {'monsterType': event['monsterType'], 'killerTeamUrn': urn}, 'KILLED_ANCIENT'
+            else:
+                extra = {'buildingType': 'turret', 'buildingTeamUrn': event['buildingTeamUrn'], 'lane': event['lane'],
+                         'turretTier': event['turretTier']}
+                action = 'DESTROYED_TURRET'
+            messages.append(message('GAME_EVENT', action, when, int(second * 1000), extra))
+
+    end = start + timedelta(minutes=minutes)
+    messages.append(message('GAME_EVENT', 'END_MAP', end, minutes * 60000, {'winningTeam': rnd.choice([100, 200])}))
+
+    #Filler messages (no players) spread through the game if there are more files than messages
+    if len(messages) < files:
+        fillers = set(rnd.sample(range(files), files - len(messages)))
+        game_messages = iter(messages)
+        messages = []
+        for position in range(files):
+            if position in fillers:
+                when = start + timedelta(seconds=minutes * 60 * position / files)
+                messages.append(message('INFO', 'PING', when, int(minutes * 60000 * position / files), players=False))
+            else:
+                messages.append(next(game_messages))
+    for seqIdx, each in enumerate(messages):
+        each['seqIdx'] = seqIdx
+
+    #Spread the messages over the files in seqIdx order, then name the files in a shuffled order
+    per_file = -(-len(messages) // files)
+    chunks = [messages[i:i + per_file] for i in range(0, len(messages), per_file)]
+    names_order = list(range(len(chunks)))
+    rnd.shuffle(names_order)
+    total = 0
+    for name, chunk in zip(names_order, chunks):
+        text = ''.join(json.dumps(each) + '\n' for each in chunk)
+        with open(os.path.join(out_dir, '%06d.json' % name), 'w') as f:
+            f.write(text)
+        total += len(text)
+
+    #Contract database for the made up players
+    roster = []
+    for side, team in [('teamOne', 'Counter Logic Gaming'), ('teamTwo', 'Opponent Esports')]:
+        for name, position in zip(names[side], POSITIONS):
+            roster.append({'Team': team, 'summonerName': name, 'Position': position})
+    pd.DataFrame(roster).to_csv(os.path.join(out_dir, 'nagcd.csv'), index=False)
+
+    return {'files': len(chunks), 'messages': len(messages), 'bytes': total}
+
+def measure(stage, func, *args, repeat=1, memory=True):
+    '''
+    Times one stage (best of repeat runs) and, with memory, runs it once more under tracemalloc for its peak memory
+    Output:
+        result: what func gave back
+        record: dict with 'stage', 'seconds', 'cpu_seconds' and 'peak_mb' (None without memory)
+    '''
+    best = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func(*args)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        if best is None or wall < best[0]:
+            best = (wall, cpu)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, {'stage': stage, 'seconds': round(best[0], 4), 'cpu_seconds': round(best[1], 4),
+                    'peak_mb': round(peak, 1) if peak is not None else None}
+
+def run_benchmark(game_dir, academy=False, workers=(1,), repeat=1, memory=True):
+    '''
+    Times json_to_df (for each number of workers and with only RAW_COLUMNS), get_team_data, objectives and final_output on one game folder,
+    plus reloading the game from the columnar cache and the Arrow engine (if pyarrow is installed)
+    Uses game_dir/nagcd.csv as the contract database if it's there (made up games), else the saved one (offline)
+    Output:
+        records: list of dicts from measure
+    '''
+    roster = os.path.join(game_dir, 'nagcd.csv')
+    if os.path.exists(roster):
+        automater.CONTRACT_DB_PATH = roster
+    get_team_data = automater.get_team_data_academy if academy else automater.get_team_data
+    objectives = automater.objectives_academy if academy else automater.objectives
+    final_output = automater.final_output_academy if academy else automater.final_output
+
+    records = []
+    for count in workers:
+        rawdata, record = measure('json_to_df (workers=%d)' % count, automater.json_to_df, game_dir, count, repeat=repeat, memory=memory)
+        records.append(record)
+    rawdata, record = measure('json_to_df (RAW_COLUMNS only)', automater.json_to_df, game_dir, 1, automater.RAW_COLUMNS,
+                              repeat=repeat, memory=memory)
+    records.append(record)
+    game, record = measure('parse_game', automater.parse_game, rawdata, repeat=repeat, memory=memory)
+    records.append(record)
+    #json_to_df and parse_game in one go with the Arrow engine, when pyarrow is installed
+    if automater.pa is not None:
+        record = measure('read_game_arrow', automater.read_game_arrow, game_dir, repeat=repeat, memory=memory)[1]
+        records.append(record)
+    (CLG, team2), record = measure('get_team_data', get_team_data, game, True, repeat=repeat, memory=memory)
+    records.append(record)
+    #objectives only sets columns on the team dataframes, so running it again on copies times it on its own
+    record = measure('objectives', lambda: objectives(game, CLG.copy(), team2.copy()), repeat=repeat, memory=memory)[1]
+    records.append(record)
+    record = measure('final_output', final_output, CLG, team2, repeat=repeat, memory=memory)[1]
+    records.append(record)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        automater.load_game(game_dir, 1, cache_dir)
+        record = measure('load_game (cached)', automater.load_game, game_dir, 1, cache_dir, repeat=repeat, memory=memory)[1]
+        records.append(record)
+    return records
+
+def print_records(records):
+    '''
+    Prints benchmark records as a table
+    '''
+    print('%-30s %10s %10s %10s' % ('stage', 'seconds', 'cpu', 'peak MB'))
+    for record in records:
+        peak = '-' if record['peak_mb'] is None else str(record['peak_mb'])
+        print('%-30s %10.4f %10.4f %10s' % (record['stage'], record['seconds'], record['cpu_seconds'], peak))
+
+def save_records(records, path, **info):
+    '''
+    Saves benchmark records as JSON (with the python/pandas versions and when it ran) to compare later runs against
+    '''
+    with open(path, 'w') as f:
+        json.dump(dict(info, python=sys.version.split()[0], pandas=pd.__version__, ran=datetime.now().isoformat(),
+                       records=records), f, indent=1)
+
+def main(argv=None):
+    '''
+    Command line entry point, run the file with --help to see the options
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark BayesEsportsScrimAutomater on made up or real game folders')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_generate_options(command):
+        command.add_argument('--files', type=int, default=7000, help='number of JSON files (default: %(default)s)')
+        command.add_argument('--minutes', type=int, default=30, help='game length (default: %(default)s)')
+        command.add_argument('--snapshot-rate', type=float, default=1.0, help='snapshots per second (default: %(default)s)')
+        command.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+        command.add_argument('--academy', action='store_true', help='made up game for the academy functions')
+
+    def add_run_options(command):
+        command.add_argument('--workers', default='1', help='comma separated worker counts for json_to_df (default: %(default)s)')
+        command.add_argument('--repeat', type=int, default=1, help='runs per stage, the best one counts (default: %(default)s)')
+        command.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+        command.add_argument('-o', '--output', help='save the results to this .json file')
+
+    generate = commands.add_parser('generate', help='write a made up game folder')
+    generate.add_argument('out_dir', help='folder to write the game to')
+    add_generate_options(generate)
+
+    run = commands.add_parser('run', help='time each stage on a game folder')
+    run.add_argument('game_dir', help='game folder')
+    run.add_argument('--academy', action='store_true', help='use the academy functions')
+    add_run_options(run)
+
+    quick = commands.add_parser('quick', help='generate a made up game in a temporary folder and time it')
+    add_generate_options(quick)
+    add_run_options(quick)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        summary = generate_game(args.out_dir, args.files, args.minutes, args.snapshot_rate, args.seed, args.academy)
+        print('Wrote %(files)d files (%(messages)d messages, %(bytes)d bytes)' % summary)
+        return
+
+    workers = [int(each) for each in args.workers.split(',')]
+    with tempfile.TemporaryDirectory() as temp:
+        game_dir = args.game_dir if args.command == 'run' else os.path.join(temp, 'game')
+        info = {'game_dir': game_dir, 'academy': args.academy}
+        if args.command == 'quick':
+            info.update(generate_game(game_dir, args.files, args.minutes, args.snapshot_rate, args.seed, args.academy))
+            info.update(minutes=args.minutes, snapshot_rate=args.snapshot_rate, seed=args.seed)
+        records = run_benchmark(game_dir, args.academy, workers, args.repeat, not args.no_memory)
+    print_records(records)
+    if args.output:
+        save_records(records, args.output, **info)
+        print('Saved ' + args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import os
+import contextlib
+import sys
+import shutil
+import tarfile
+
+import pytest
+
+#The script and benchmark.py live in the folder above
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import BayesEsportsScrimAutomater as automater
+import benchmark
+
+'''
+Made up games (see benchmark.generate_game) shared by the tests, small enough to run in a few seconds but longer than
+the last stat checkpoint so --early has something to skip
+
+data/g1.csv and data/a1.csv are what the original scrim_automater and scrim_automater_academy (from before any of the
+speed ups) give on those games, so every way of running a game is checked against the old code and not against itself.
+The only differences from the old code are the two bugs that were fixed on purpose: the first mid tower check compared
+against 'lie:lol:riot:team:one' and always credited team one, and the teamTwo AOER roster used teamOne's names
+'''
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def make_game(out_dir, academy=False, seed=1):
+    '''
+    Writes a made up game folder (with its nagcd.csv) and gives its path
+    The settings have to stay the same for data/g1.csv and data/a1.csv to match
+    '''
+    benchmark.generate_game(out_dir, files=900, minutes=22, snapshot_rate=0.5, seed=seed, academy=academy)
+    return out_dir
+
+def use_roster(game_dir):
+    '''
+    Points the contract database at the nagcd.csv of a made up game and forgets the one already loaded
+    '''
+    automater.CONTRACT_DB_PATH = os.path.join(game_dir, 'nagcd.csv')
+    automater._contract_db.clear()
+    automater._contract_db_source.clear()
+
+@contextlib.contextmanager
+def roster_of(game_dir):
+    '''
+    use_roster for a with block, the contract database is put back after
+    '''
+    saved = automater.CONTRACT_DB_PATH
+    use_roster(game_dir)
+    try:
+        yield game_dir
+    finally:
+        automater.CONTRACT_DB_PATH = saved
+        automater._contract_db.clear()
+        automater._contract_db_source.clear()
+
+def as_csv(output):
+    '''
+    What the .csv file of an output would hold, so outputs compare the way the spreadsheet sees them
+    '''
+    return output.to_csv()
+
+def golden(name):
+    with open(os.path.join(DATA_DIR, name + '.csv')) as f:
+        return f.read()
+
+def copy_game(game_dir, out_dir):
+    '''
+    Copies a game folder (its JSON files) to out_dir
+    '''
+    shutil.copytree(game_dir, out_dir, ignore=shutil.ignore_patterns('*.csv'))
+    return out_dir
+
+def tar_game(game_dir, path):
+    '''
+    A .tar.gz of a game folder, stored by file name (which isn't seqIdx order)
+    '''
+    with tarfile.open(path, 'w:gz') as archive:
+        for name in sorted(os.listdir(game_dir)):
+            if name.endswith('.json'):
+                archive.add(os.path.join(game_dir, name), 'game/' + name)
+    return path
+
+@pytest.fixture(scope='session')
+def game_dir(tmp_path_factory):
+    return make_game(str(tmp_path_factory.mktemp('games') / 'g1'))
+
+@pytest.fixture(scope='session')
+def academy_game(tmp_path_factory):
+    return make_game(str(tmp_path_factory.mktemp('games') / 'a1'), academy=True, seed=2)
+
+@pytest.fixture(scope='session')
+def reference():
+    return golden('g1')
+
+@pytest.fixture(scope='session')
+def academy_reference():
+    return golden('a1')
+
+@pytest.fixture
+def roster(game_dir):
+    '''
+    The made up game's contract database, put back after the test
+    '''
+    with roster_of(game_dir):
+        yield game_dir
@@ -0,0 +1,146 @@
+import os
+import json
+import multiprocessing
+
+import pytest
+
+import BayesEsportsScrimAutomater as automater
+from conftest import as_csv, copy_game
+
+'''
+Batch runs over a split folder of made up games
+'''
+
+def make_split(game_dir, root_dir, weeks=2):
+    '''
+    A split folder where every week has a game folder called 'game'
+    '''
+    for number in range(1, weeks + 1):
+        copy_game(game_dir, os.path.join(root_dir, 'week' + str(number), 'game'))
+    return root_dir
+
+def break_game(json_dir):
+    '''
+    A game folder with one message in it that isn't valid JSON
+    '''
+    os.makedirs(json_dir)
+    with open(os.path.join(json_dir, '0.json'), 'w') as f:
+        f.write('{"seqIdx": 0, "payload": {"type": "INFO"}\n')
+    return json_dir
+
+def rows(output):
+    return [as_csv(output.drop(columns='Game').iloc[[number]].reset_index(drop=True)) for number in range(len(output))]
+
+def test_batch(roster, reference, tmp_path):
+    #One row per game in folder order, a game that fails is reported without stopping the others
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    break_game(os.path.join(root_dir, 'week1', 'broken'))
+    output, failures = automater.scrim_automater_batch(root_dir, workers=2, offline=True)
+    assert rows(output) == [reference, reference]
+    assert [failure['path'] for failure in failures] == [os.path.join(root_dir, 'week1', 'broken')]
+    assert 'JSONDecodeError' in failures[0]['error']
+
+def test_batch_files_inside_the_split(roster, reference, tmp_path, monkeypatch):
+    #The manifest, profile reports and output saved inside the split aren't games, on the first run or the next ones
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    monkeypatch.chdir(root_dir)
+    for run in range(2):
+        automater.main(['batch', '.', '--offline', '--workers', '1', '--profile-dir', 'profiles'])
+        #Named after the folder, not '..csv'
+        output = automater.pd.read_csv(os.path.join(root_dir, 'split.csv'), index_col=0)
+        assert len(output) == 2
+    assert sorted(os.listdir(root_dir)) == ['profiles', 'split.csv', 'split.manifest.json', 'week1', 'week2']
+    assert automater.find_game_dirs(root_dir, [os.path.join(root_dir, 'profiles'), os.path.join(root_dir, 'split.manifest.json')]) == \
+        [os.path.join(root_dir, 'week1', 'game'), os.path.join(root_dir, 'week2', 'game')]
+
+def test_batch_output_inside_the_split(roster, tmp_path, monkeypatch, capsys):
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    monkeypatch.chdir(tmp_path)
+    for run in range(2):
+        automater.main(['batch', 'split', '-o', os.path.join('split', 'season.csv'), '--offline', '--workers', '1'])
+        assert len(automater.pd.read_csv(os.path.join(root_dir, 'season.csv'), index_col=0)) == 2
+    assert 'season.manifest.json is inside split' in capsys.readouterr().out
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='the worker processes have to get the patched load_game')
+def test_worker_that_dies(roster, reference, tmp_path, monkeypatch):
+    #A worker process killed in the middle of a game only fails that game, the others still run
+    root_dir = make_split(roster, str(tmp_path / 'split'), weeks=4)
+    crash = os.path.join(root_dir, 'week2', 'game')
+    load_game = automater.load_game
+    def dying_load_game(json_dir, *args, **kwargs):
+        if json_dir == crash:
+            os._exit(1)
+        return load_game(json_dir, *args, **kwargs)
+    monkeypatch.setattr(automater, 'load_game', dying_load_game)
+    events = str(tmp_path / 'events.jsonl')
+    output, failures = automater.scrim_automater_batch(root_dir, workers=2, offline=True, events_path=events)
+    assert rows(output) == [reference] * 3
+    assert [failure['path'] for failure in failures] == [crash]
+    with open(events) as f:
+        failed = [json.loads(line) for line in f if '"failed"' in line]
+    assert [(event['path'], event['failed_stage']) for event in failed] == [(crash, 'worker')]
+
+def test_manifest(roster, reference, tmp_path):
+    #A second run reuses the rows saved in the manifest and only runs the game that changed
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    manifest = str(tmp_path / 'split.manifest.json')
+    output, failures = automater.scrim_automater_batch(root_dir, workers=1, offline=True, manifest_path=manifest)
+    assert failures == [] and rows(output) == [reference, reference]
+    changed = os.path.join(root_dir, 'week2', 'game', 'extra.json')
+    with open(changed, 'w') as f:
+        f.write('{"seqIdx": 999999, "payload": {"type": "INFO", "sourceUpdatedAt": "2022-08-08T19:00:00.000Z"}}\n')
+    events = str(tmp_path / 'events.jsonl')
+    again, failures = automater.scrim_automater_batch(root_dir, workers=1, offline=True, manifest_path=manifest, events_path=events)
+    assert rows(again) == [reference, reference]
+    with open(events) as f:
+        assert [(json.loads(line)['path'], json.loads(line)['status']) for line in f] == \
+            [(os.path.join(root_dir, 'week1', 'game'), 'reused'), (os.path.join(root_dir, 'week2', 'game'), 'done')]
+
+def test_results_db(roster, tmp_path, monkeypatch):
+    #Games with the same folder name in two weeks stay apart, and a game saved by game, batch and queue-collect is one game
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    db = str(tmp_path / 'results.db')
+    monkeypatch.chdir(tmp_path)
+    automater.main(['game', os.path.join('split', 'week1', 'game'), '--offline', '--results-db', db])
+    automater.scrim_automater_batch(root_dir, workers=1, offline=True, results_db=db, details=True)
+    queue_dir = str(tmp_path / 'queue')
+    automater.create_queue(root_dir, queue_dir, offline=True)
+    automater.queue_worker(queue_dir, interval=0)
+    automater.collect_queue(queue_dir, db)
+    conn = automater.open_results_db(db)
+    assert sorted(conn.execute('SELECT key, game FROM games').fetchall()) == \
+        [(os.path.join(root_dir, 'week1', 'game'), 'game'), (os.path.join(root_dir, 'week2', 'game'), 'game')]
+    assert conn.execute('SELECT COUNT(DISTINCT key) FROM curves').fetchone()[0] == 2
+    assert len(automater.stored_games(conn)) == 2
+    assert automater.season_stats(conn, ['GD@15 Team'], by=None)['Games'].item() == 2
+    conn.close()
+
+def test_pack_next_to_its_folder_runs_once(roster, reference, tmp_path):
+    #pack_game writes g1.ndjson next to g1 by default, the batch runs the folder and not both
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    automater.pack_game(os.path.join(root_dir, 'week1', 'game'))
+    assert os.path.exists(os.path.join(root_dir, 'week1', 'game.ndjson'))
+    output, failures = automater.scrim_automater_batch(root_dir, workers=1, offline=True)
+    assert rows(output) == [reference, reference]
+    assert automater.find_game_dirs(root_dir) == [os.path.join(root_dir, 'week1', 'game'), os.path.join(root_dir, 'week2', 'game')]
+
+def test_metrics(roster, tmp_path):
+    #Prometheus text summary of the run and one event per game, a failed game counted by the stage it failed in
+    root_dir = make_split(roster, str(tmp_path / 'split'))
+    break_game(os.path.join(root_dir, 'week3', 'broken'))
+    metrics, events = str(tmp_path / 'batch.prom'), str(tmp_path / 'events.jsonl')
+    output, failures = automater.scrim_automater_batch(root_dir, workers=1, offline=True, metrics_path=metrics, events_path=events)
+    assert len(output) == 2 and [failure['game'] for failure in failures] == ['broken']
+    with open(metrics) as f:
+        text = f.read()
+    assert 'lolscrim_batch_games{status="done"} 2' in text
+    assert 'lolscrim_batch_games{status="failed"} 1' in text
+    assert 'lolscrim_batch_roster_source{source="saved"} 2' in text
+    assert 'lolscrim_batch_game_seconds_count 3' in text
+    with open(events) as f:
+        saved = [json.loads(line) for line in f]
+    assert sorted(event['status'] for event in saved) == ['done', 'done', 'failed']
+    assert all(event['bytes_read'] > 0 and event['roster_source'] == 'saved' for event in saved if event['status'] == 'done')
+    (failed,) = [event for event in saved if event['status'] == 'failed']
+    assert failed['failed_stage'] == failures[0]['report']['failed_stage'] is not None
+    assert 'lolscrim_batch_failures{stage="' + failed['failed_stage'] + '"} 1' in text
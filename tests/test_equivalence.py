@@ -0,0 +1,140 @@
+import os
+import shutil
+import zipfile
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import BayesEsportsScrimAutomater as automater
+from conftest import as_csv, roster_of, tar_game
+
+'''
+Every faster way of reading a game has to give the same .csv as the original code (see data/ in conftest)
+'''
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_read(roster, reference, workers):
+    #The files of a game read in this process or split across a pool of processes
+    assert as_csv(automater.scrim_automater(roster, workers=workers, offline=True)) == reference
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_read_academy(academy_game, academy_reference, workers):
+    with roster_of(academy_game):
+        assert as_csv(automater.scrim_automater_academy(academy_game, workers=workers, offline=True)) == academy_reference
+
+def test_snapshot_index_matches_scan(roster):
+    #get_cs/get_g/get_xp through the (time, position) index give the first matching row of the team dataframe
+    teamOne, teamTwo = automater.get_team_data(automater.load_game(roster), offline=True)
+    for team in (teamOne, teamTwo):
+        times = team['sourceUpdatedAt'].dt.strftime('%H:%M:%S')
+        for minutes in (5, 10, 15, 20):
+            time = automater.check_time(team, minutes)
+            for position in automater.POSITIONS:
+                rows = team[(times == time) & (team['Position'] == position)].head(1)
+                for stat, lookup in (('minionsKilled', automater.get_cs), ('totalGold', automater.get_g), ('experience', automater.get_xp)):
+                    expected = rows[stat].item() if len(rows) else np.nan
+                    found = lookup(team, time, position)
+                    assert found == expected or (np.isnan(expected) and np.isnan(found))
+
+def test_game_cache(roster, reference, tmp_path):
+    #The second run loads the saved game instead of the JSON files
+    cache_dir = str(tmp_path / 'cache')
+    assert as_csv(automater.scrim_automater(roster, offline=True, cache_dir=cache_dir)) == reference
+    output, report = automater.profile_game(roster, offline=True, cache_dir=cache_dir)
+    assert as_csv(output) == reference
+    assert [stage['hit'] for stage in report['stages'] if stage['stage'] == 'read game cache'] == [True]
+
+def test_game_cache_is_opt_in(roster, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(automater, 'GAME_CACHE_DIR', cache_dir)
+    monkeypatch.chdir(tmp_path)
+    automater.main(['game', roster, '--offline'])
+    assert not os.path.exists(cache_dir)
+    automater.main(['game', roster, '--offline', '--cache-dir'])
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_cache_clear(roster, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    automater.load_game(roster, cache_dir=cache_dir)
+    #Not a saved game, stays
+    os.makedirs(os.path.join(cache_dir, 'notes'))
+    assert automater.clear_game_cache(cache_dir, timedelta(days=1)) == (0, 0)
+    games, size = automater.clear_game_cache(cache_dir)
+    assert games == 1 and size > 0
+    assert os.listdir(cache_dir) == ['notes']
+
+@pytest.mark.parametrize('timeline', [False, True])
+def test_objective_tables_match_scan(roster, timeline):
+    #First objectives (and the timeline) from the event tables of a parsed game are what walking every row gives
+    rawdata = automater.json_to_df(roster)
+    data = rawdata[rawdata['teamOne.players'].notnull()].reset_index(drop=True)
+    firsts, events = automater.scan_objectives(automater.load_game(roster), timeline)
+    expected_firsts, expected_events = automater.scan_objectives(data, timeline)
+    assert firsts == expected_firsts and len(firsts) == len(automater.FIRST_OBJECTIVES)
+    pd.testing.assert_frame_equal(events, expected_events)
+    assert len(events) > 0 if timeline else len(events) == 0
+
+def test_projected_fields(roster, reference):
+    #Only RAW_COLUMNS pulled out of each payload gives the same columns as flattening the whole payload
+    projected = automater.json_to_df(roster, fields=automater.RAW_COLUMNS)
+    full = automater.json_to_df(roster)
+    pd.testing.assert_frame_equal(projected, full[automater.RAW_COLUMNS], check_dtype=False)
+    game = automater.parse_game(projected)
+    assert as_csv(automater.final_output(*automater.get_team_data(game, offline=True))) == reference
+
+def zip_game(game_dir, path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name in sorted(os.listdir(game_dir)):
+            if name.endswith('.json'):
+                archive.write(os.path.join(game_dir, name), 'game/' + name)
+    return path
+
+@pytest.mark.parametrize('archive, name', [(zip_game, 'g1.zip'), (tar_game, 'g1.tar.gz')])
+def test_archives(roster, reference, tmp_path, archive, name):
+    #Read straight out of a zip or tar.gz without unpacking it
+    path = archive(roster, str(tmp_path / name))
+    assert automater.game_name(path) == 'g1'
+    assert as_csv(automater.scrim_automater(path, offline=True)) == reference
+
+@pytest.mark.parametrize('archive', [None, zip_game])
+def test_early(roster, reference, tmp_path, archive):
+    #Stops reading after the last checkpoint, plus the end of the game for the winner, and fewer files get read
+    path = archive(roster, str(tmp_path / 'g1.zip')) if archive else roster
+    output, report = automater.profile_game(path, offline=True, early=True)
+    assert as_csv(output) == reference
+    read = sum(stage['files'] for stage in report['stages'] if stage['stage'] in ('read head', 'read tail'))
+    assert read < len(automater.list_json_files(roster))
+
+def test_early_academy(academy_game, academy_reference):
+    with roster_of(academy_game):
+        assert as_csv(automater.scrim_automater_academy(academy_game, offline=True, early=True)) == academy_reference
+
+def test_arrow_engine(roster, reference):
+    #pyarrow is in requirements-test.txt so this never gets skipped
+    assert as_csv(automater.scrim_automater(roster, offline=True, engine='arrow')) == reference
+
+def test_arrow_engine_academy(academy_game, academy_reference):
+    with roster_of(academy_game):
+        assert as_csv(automater.scrim_automater_academy(academy_game, offline=True, engine='arrow')) == academy_reference
+
+def test_pack(roster, reference, tmp_path):
+    #One .ndjson file plus its index, read in full, early, streamed and by the arrow engine
+    packed = str(tmp_path / 'g1.ndjson')
+    summary = automater.pack_game(roster, packed)
+    assert summary['files'] == len(automater.list_json_files(roster))
+    assert as_csv(automater.scrim_automater(packed, offline=True)) == reference
+    assert as_csv(automater.scrim_automater(packed, offline=True, early=True)) == reference
+    assert as_csv(automater.stream_game(packed, offline=True)) == reference
+    assert as_csv(automater.scrim_automater(packed, offline=True, engine='arrow')) == reference
+
+def test_pack_refuses_repeated_seqidx(roster, tmp_path):
+    #A message that shows up twice stops the packing, and nothing is left behind
+    broken = str(tmp_path / 'broken')
+    shutil.copytree(roster, broken)
+    first = sorted(automater.list_json_files(broken))[0]
+    shutil.copy(first, os.path.join(broken, 'copy.json'))
+    with pytest.raises(ValueError, match='more than once'):
+        automater.pack_game(broken, str(tmp_path / 'broken.ndjson'))
+    assert not os.path.exists(str(tmp_path / 'broken.ndjson'))
@@ -0,0 +1,100 @@
+import io
+import os
+import glob
+import shutil
+import time
+import threading
+
+import pandas as pd
+import pytest
+
+import BayesEsportsScrimAutomater as automater
+from conftest import as_csv, roster_of, tar_game
+
+'''
+The live state (update_live_state) has to end on the same row as the original code, both when following a game while
+it's written (watch_game) and when reading a finished one a chunk at a time (stream_game)
+'''
+
+#Academy opponent from ROSTER_OVERRIDES with one player who lost the team tag, like amateur games in the real exports
+AOER_NAMES = {'OPP Topper': 'AOER Chim', 'OPP Ganker': 'Jozy', 'OPP Wizard': 'AOER LEO99', 'OPP Shooter': 'AOER Shorthop',
+              'OPP Warden': 'AOER Fizzi'}
+
+def aoer_game(academy_game, out_dir):
+    '''
+    The made up academy game against AOER, a team that isn't in the contract database
+    '''
+    shutil.copytree(academy_game, out_dir)
+    for path in glob.glob(os.path.join(out_dir, '*.json')):
+        with open(path) as f:
+            text = f.read()
+        for old, new in AOER_NAMES.items():
+            text = text.replace('"' + old + '"', '"' + new + '"')
+        with open(path, 'w') as f:
+            f.write(text)
+    nagcd = pd.read_csv(os.path.join(out_dir, 'nagcd.csv'))
+    nagcd[nagcd['Team'] != 'Opponent Esports'].to_csv(os.path.join(out_dir, 'nagcd.csv'), index=False)
+    return out_dir
+
+def watch(json_dir, academy=False):
+    row = automater.watch_game(json_dir, academy=academy, offline=True, interval=0.01, on_row=lambda row: None, timeout=1)
+    return as_csv(pd.DataFrame([row]))
+
+def test_watch(roster, reference):
+    assert watch(roster) == reference
+
+def test_watch_academy(academy_game, academy_reference):
+    with roster_of(academy_game):
+        assert watch(academy_game, academy=True) == academy_reference
+
+def test_watch_subfolders(roster, reference, tmp_path):
+    #Files spread over nested subfolders, like json_to_df reads them
+    json_dir = str(tmp_path / 'game')
+    for number, path in enumerate(sorted(glob.glob(os.path.join(roster, '*.json')))):
+        folder = os.path.join(json_dir, 'part' + str(number % 3), 'sub' + str(number % 2))
+        os.makedirs(folder, exist_ok=True)
+        shutil.copy(path, folder)
+    assert watch(json_dir) == reference
+
+def test_watch_academy_untagged_opponent(academy_game, tmp_path):
+    #Players are resolved like get_team_data_academy does, the untagged player and ROSTER_OVERRIDES included
+    json_dir = aoer_game(academy_game, str(tmp_path / 'aoer'))
+    with roster_of(json_dir):
+        expected = as_csv(automater.scrim_automater_academy(json_dir, offline=True))
+        assert watch(json_dir, academy=True) == expected
+    assert not pd.isna(pd.read_csv(io.StringIO(expected))['GD@10 Jg'].item())
+
+def test_watch_while_written(roster, reference, tmp_path):
+    #Files showing up in seqIdx order a few at a time while the game is followed
+    json_dir = str(tmp_path / 'game')
+    os.makedirs(json_dir)
+    ordered, stored = automater.message_order(roster)
+    def write():
+        for start in range(0, len(ordered), 100):
+            for name in ordered[start:start + 100]:
+                shutil.copy(os.path.join(roster, name), json_dir)
+            time.sleep(0.05)
+    writer = threading.Thread(target=write)
+    writer.start()
+    rows = []
+    last = automater.watch_game(json_dir, offline=True, interval=0.01, on_row=rows.append, timeout=5)
+    writer.join()
+    assert as_csv(pd.DataFrame([last])) == reference
+    #Updated as the game went on, not only once at the end
+    assert len(rows) > 1
+
+def test_stream(roster, reference):
+    assert as_csv(automater.stream_game(roster, offline=True, chunk_size=100)) == reference
+
+def test_stream_academy(academy_game, academy_reference):
+    with roster_of(academy_game):
+        assert as_csv(automater.stream_game(academy_game, academy=True, offline=True, chunk_size=100)) == academy_reference
+
+@pytest.mark.parametrize('spill', [automater.TAR_SPILL_BYTES, 0])
+def test_stream_tar_out_of_order(roster, reference, tmp_path, monkeypatch, spill):
+    #Files that come before their turn wait in a temporary file, in memory or (spill 0) on disk
+    path = tar_game(roster, str(tmp_path / 'g1.tar.gz'))
+    ordered, stored = automater.message_order(path)
+    assert ordered != stored
+    monkeypatch.setattr(automater, 'TAR_SPILL_BYTES', spill)
+    assert as_csv(automater.stream_game(path, offline=True, chunk_size=100)) == reference
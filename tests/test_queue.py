@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+import BayesEsportsScrimAutomater as automater
+from conftest import ROOT, as_csv, copy_game
+
+'''
+The work queue run locally: a temporary folder stands in for the shared drive and each worker is its own process,
+started from the command line like on a real machine
+'''
+
+SCRIPT = os.path.join(ROOT, 'BayesEsportsScrimAutomater.py')
+
+def make_split(game_dir, root_dir, games):
+    '''
+    A split folder with a copy of the made up game in each week
+    '''
+    for number in range(games):
+        copy_game(game_dir, os.path.join(root_dir, 'week' + str(number), 'game'))
+    return root_dir
+
+def worker_env(game_dir, home):
+    '''
+    Environment for a worker process: its own home folder with the made up game's contract database saved in it
+    '''
+    os.makedirs(os.path.join(home, '.lolscrimautomater'), exist_ok=True)
+    shutil.copy(os.path.join(game_dir, 'nagcd.csv'), os.path.join(home, '.lolscrimautomater', 'nagcd.csv'))
+    return dict(os.environ, HOME=home, USERPROFILE=home)
+
+def start_workers(queue_dir, env, count):
+    return [subprocess.Popen([sys.executable, SCRIPT, 'queue-work', queue_dir, '--interval', '0.2'],
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) for each in range(count)]
+
+def finish(workers):
+    '''
+    Waits for the workers and gives back every game they said they ran
+    '''
+    ran = []
+    for worker in workers:
+        output, _ = worker.communicate(timeout=300)
+        assert worker.returncode == 0, output
+        ran += [line.split()[1] for line in output.splitlines() if line.startswith(('Done ', 'Failed '))]
+    return ran
+
+def results(queue_dir):
+    queue = automater.load_queue(queue_dir)
+    return {game: automater.read_queue_file(os.path.join(queue_dir, 'results', automater.queue_key(game) + '.json'))
+            for game in queue['games']}
+
+def test_each_game_claimed_once(game_dir, reference, tmp_path):
+    root_dir = make_split(game_dir, str(tmp_path / 'split'), 6)
+    queue_dir = str(tmp_path / 'queue')
+    queue = automater.create_queue(root_dir, queue_dir, offline=True)
+    ran = finish(start_workers(queue_dir, worker_env(game_dir, str(tmp_path / 'home')), 3))
+
+    assert sorted(ran) == sorted(queue['games'])
+    saved = results(queue_dir)
+    assert all(result['error'] is None and result['attempt'] == 1 for result in saved.values())
+    assert os.listdir(os.path.join(queue_dir, 'claims')) == []
+    assert automater.queue_status(queue_dir)['done'] == 6
+
+    output, failures = automater.collect_queue(queue_dir)
+    assert failures == []
+    #Every game is the same made up game, so every row is the reference row
+    rows = output.drop(columns='Game')
+    for number in range(len(rows)):
+        assert as_csv(rows.iloc[[number]].reset_index(drop=True)) == reference
+
+def test_expired_lease_is_reclaimed(game_dir, reference, tmp_path):
+    root_dir = make_split(game_dir, str(tmp_path / 'split'), 2)
+    queue_dir = str(tmp_path / 'queue')
+    queue = automater.create_queue(root_dir, queue_dir, offline=True, lease=2)
+    dead, alive = queue['games']
+    #A worker that claimed the first game and died without renewing its claim
+    assert automater.claim_game(queue_dir, dead, 'dead-worker', lease=2)['attempt'] == 1
+    stale = time.time() - 60
+    os.utime(automater.claim_path(queue_dir, dead, 1), (stale, stale))
+    assert automater.queue_status(queue_dir)['expired'] == 1
+
+    ran = finish(start_workers(queue_dir, worker_env(game_dir, str(tmp_path / 'home')), 2))
+    assert sorted(ran) == sorted(queue['games'])
+    saved = results(queue_dir)
+    assert saved[dead]['attempt'] == 2 and saved[dead]['worker'] != 'dead-worker'
+    assert saved[alive]['attempt'] == 1
+    assert all(result['error'] is None for result in saved.values())
+
+def test_live_claim_is_not_taken(game_dir, tmp_path):
+    root_dir = make_split(game_dir, str(tmp_path / 'split'), 1)
+    queue_dir = str(tmp_path / 'queue')
+    (game,) = automater.create_queue(root_dir, queue_dir, offline=True)['games']
+    assert automater.claim_game(queue_dir, game, 'first') is not None
+    assert automater.claim_game(queue_dir, game, 'second') is None
+    with open(automater.claim_path(queue_dir, game, 1)) as f:
+        assert json.load(f)['worker'] == 'first'